@@ -0,0 +1,240 @@
+"""
+渠道包模块
+v2/v3签名不覆盖APK签名块本身，在签名块中加入自定义的ID-值对不会破坏签名。
+基础APK只签名一次，每个渠道只需复制条目区（copy_file_range，支持的文件系统上为reflink），
+写入加了渠道信息的签名块并修改EOCD中的中央目录偏移，不需要重新计算摘要，也不启动JVM。
+渠道信息的格式与Walle相同（ID 0x71777777，值为 {"channel": 渠道名} 的JSON），可以直接使用Walle的读取库
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_zip import ApkZipReader, ApkFormatError
+from apk_checksum import MultiHasher, signer_certificate_sha256
+from apk_signing_block import (find_signing_block, build_signing_block, patched_eocd, write_signed_apk,
+                               feed_hasher, OperationCancelled, APK_SIGNATURE_SCHEME_V2_BLOCK_ID,
+                               APK_SIGNATURE_SCHEME_V3_BLOCK_ID, APK_SIGNATURE_SCHEME_V31_BLOCK_ID)
+
+
+# 签名块中渠道信息的ID（与Walle相同）
+CHANNEL_BLOCK_ID = 0x71777777
+
+# 同时写出的渠道包数，reflink时几乎不占用磁盘带宽，普通复制时受磁盘速度限制
+DEFAULT_CHANNEL_WORKERS = 4
+
+# 渠道名中不允许的字符（渠道名会出现在文件名中）
+_INVALID_CHANNEL_CHARS = re.compile(r'[<>:"/\\|?*\s\x00-\x1f]')
+
+# 基础APK必须带有其中一种签名，渠道信息才会被保留
+_SIGNATURE_IDS = (APK_SIGNATURE_SCHEME_V2_BLOCK_ID, APK_SIGNATURE_SCHEME_V3_BLOCK_ID,
+                  APK_SIGNATURE_SCHEME_V31_BLOCK_ID)
+
+
+def validate_channel(channel):
+    """检查渠道名，不合法时抛出ValueError"""
+    if not channel:
+        raise ValueError("渠道名不能为空")
+    if _INVALID_CHANNEL_CHARS.search(channel):
+        raise ValueError(f"渠道名中有不允许的字符: {channel!r}")
+    return channel
+
+
+def load_channel_list(path):
+    """
+    读取渠道列表文件：每行一个渠道名，忽略空行和#开头的注释，重复的渠道只保留一个
+    :return: 渠道名列表
+    """
+    channels = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                channels.append(validate_channel(line))
+            except ValueError as e:
+                raise ValueError(f"{path} 第{line_number}行: {str(e)}")
+    if not channels:
+        raise ValueError(f"渠道列表为空: {path}")
+    return list(dict.fromkeys(channels))
+
+
+def channel_output_dir(signed_apk):
+    """默认的渠道包目录：签名后的APK同目录下的 <文件名>_channels"""
+    stem = os.path.splitext(os.path.basename(signed_apk))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(signed_apk)), f"{stem}_channels")
+
+
+def channel_output_path(signed_apk, channel, output_dir=None):
+    """渠道包路径：<输出目录>/<文件名>_<渠道名>.apk"""
+    stem = os.path.splitext(os.path.basename(signed_apk))[0]
+    return os.path.join(output_dir or channel_output_dir(signed_apk), f"{stem}_{channel}.apk")
+
+
+def channel_payload(channel):
+    """签名块中渠道信息的值"""
+    return json.dumps({'channel': channel}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def read_channel_info(apk_path):
+    """
+    读取APK签名块中的渠道信息，只读取文件末尾的EOCD和签名块
+    :return: 渠道信息字典，没有渠道信息时返回None
+    """
+    with ApkZipReader(apk_path) as reader:
+        _, pairs = find_signing_block(reader.buf, reader.eocd)
+    for pair_id, value in pairs:
+        if pair_id == CHANNEL_BLOCK_ID:
+            try:
+                info = json.loads(value.decode('utf-8'))
+            except ValueError:
+                raise ApkFormatError("签名块中的渠道信息格式错误")
+            return info if isinstance(info, dict) else None
+    return None
+
+
+def read_channel(apk_path):
+    """读取APK的渠道名，没有渠道信息时返回None"""
+    info = read_channel_info(apk_path)
+    return None if info is None else info.get('channel')
+
+
+def write_channel_apks(signed_apk, channels, output_dir=None, cancel_event=None, progress_callback=None,
+                       max_workers=DEFAULT_CHANNEL_WORKERS, checksums=False):
+    """
+    由已签名的基础APK生成渠道包，每个渠道包写出后读回渠道信息确认
+    :param signed_apk: 已用v2或v3签名的APK
+    :param channels: 渠道名列表
+    :param output_dir: 输出目录，默认见channel_output_dir
+    :param progress_callback: 可选的progress_callback(已完成数, 总数)，在工作线程中调用
+    :param checksums: 是否计算各渠道包的校验和；条目区的哈希只计算一次，各渠道包复制哈希状态后
+                      只追加计算自己的签名块、中央目录和EOCD
+    :return: 统计信息字典，其中outputs为 {渠道名: 输出路径}，计算校验和时hashers为 {渠道名: MultiHasher}，
+             signer_sha256为签名证书指纹
+    :raises OperationCancelled: cancel_event被设置
+    """
+    channels = [validate_channel(channel) for channel in dict.fromkeys(channels)]
+    output_dir = output_dir or channel_output_dir(signed_apk)
+    started = time.perf_counter()
+
+    with ApkZipReader(signed_apk) as reader:
+        eocd = reader.eocd
+        if eocd.zip64:
+            raise ApkFormatError("不支持ZIP64格式")
+        block_offset, pairs = find_signing_block(reader.buf, eocd)
+        if block_offset is None or not any(pair_id in _SIGNATURE_IDS for pair_id, _ in pairs):
+            raise ApkFormatError("基础APK没有v2/v3签名，无法写入渠道信息")
+        central_directory = bytes(reader.buf[eocd.cd_offset:eocd.cd_offset + eocd.cd_size])
+        # 替换已有的渠道信息，其余的ID-值对（签名、其他工具写入的信息）原样保留
+        pairs = [(pair_id, value) for pair_id, value in pairs if pair_id != CHANNEL_BLOCK_ID]
+        eocd_records = {}
+        signing_blocks = {}
+        for channel in channels:
+            signing_blocks[channel] = build_signing_block(pairs + [(CHANNEL_BLOCK_ID, channel_payload(channel))])
+            eocd_records[channel] = patched_eocd(reader.buf, eocd, block_offset + len(signing_blocks[channel]))
+        entries_hasher = None
+        if checksums:
+            view = memoryview(reader.buf)
+            try:
+                entries_hasher = feed_hasher(MultiHasher(), view[:block_offset], cancel_event)
+            finally:
+                view.release()
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {}
+    hashers = {}
+    lock = threading.Lock()
+
+    def write_one(channel):
+        if cancel_event is not None and cancel_event.is_set():
+            raise OperationCancelled()
+        output_path = channel_output_path(signed_apk, channel, output_dir)
+        # 先写临时文件，取消或出错时不留下不完整的渠道包
+        temp_path = f"{output_path}.tmp"
+        try:
+            size = write_signed_apk(signed_apk, temp_path, block_offset, signing_blocks[channel], central_directory,
+                                    eocd_records[channel], cancel_event)
+            if read_channel(temp_path) != channel:
+                raise ApkFormatError(f"渠道包校验失败: {channel}")
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        hasher = None
+        if entries_hasher is not None:
+            hasher = entries_hasher.copy()
+            for data in (signing_blocks[channel], central_directory, eocd_records[channel]):
+                hasher.update(data)
+        with lock:
+            outputs[channel] = output_path
+            if hasher is not None:
+                hashers[channel] = hasher
+            done = len(outputs)
+        if progress_callback is not None:
+            progress_callback(done, len(channels))
+        return size
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(write_one, channel) for channel in channels]
+        try:
+            total_bytes = sum(future.result() for future in futures)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    stats = {
+        'count': len(outputs),
+        'bytes': total_bytes,
+        'output_dir': output_dir,
+        'outputs': outputs,
+        'elapsed': time.perf_counter() - started,
+    }
+    if checksums:
+        stats['hashers'] = hashers
+        stats['signer_sha256'] = signer_certificate_sha256(pairs)
+    return stats
+
+
+def format_channel_stats(stats):
+    """把渠道包统计信息格式化为一行说明"""
+    return f"生成{stats['count']}个渠道包（{stats['elapsed']:.1f}秒）到 {stats['output_dir']}"
+
+
+def main(argv=None):
+    """命令行入口：读取渠道，或由已签名的APK生成渠道包"""
+    parser = argparse.ArgumentParser(description="APK渠道包")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    read_parser = subparsers.add_parser('read', help="读取APK的渠道")
+    read_parser.add_argument('apks', nargs='+')
+
+    write_parser = subparsers.add_parser('write', help="由已签名的APK生成渠道包")
+    write_parser.add_argument('--channels', required=True, help="渠道列表文件，每行一个渠道名")
+    write_parser.add_argument('--output-dir', default=None)
+    write_parser.add_argument('--workers', type=int, default=DEFAULT_CHANNEL_WORKERS, help="同时写出的渠道包数")
+    write_parser.add_argument('apk')
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'read':
+            for apk_path in args.apks:
+                print(f"{apk_path}\t{read_channel(apk_path) or ''}")
+            return 0
+        stats = write_channel_apks(args.apk, load_channel_list(args.channels), args.output_dir,
+                                   max_workers=args.workers)
+        print(format_channel_stats(stats))
+        return 0
+    except (ApkFormatError, ValueError, OSError) as e:
+        print(str(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
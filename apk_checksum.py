@@ -0,0 +1,157 @@
+"""
+校验清单模块
+分发系统上传前需要每个输出APK的SHA-256/MD5。进程内签名在写出（或拼出）输出的同时计算校验和，
+渠道包共用条目区的哈希状态，只对各自的签名块和中央目录追加计算；
+结果连同大小、签名证书指纹和耗时以JSON行追加到输出目录中的清单文件，下游不必再读一遍输出
+"""
+
+import os
+import json
+import time
+import struct
+import hashlib
+import threading
+
+from apk_zip import ApkZipReader
+from apk_signing_block import (find_signing_block, OperationCancelled, APK_SIGNATURE_SCHEME_V2_BLOCK_ID,
+                               APK_SIGNATURE_SCHEME_V3_BLOCK_ID, APK_SIGNATURE_SCHEME_V31_BLOCK_ID)
+
+
+# 输出目录中的清单文件名
+MANIFEST_NAME = "checksums.jsonl"
+
+# 计算的哈希算法
+CHECKSUM_ALGORITHMS = ('sha256', 'md5')
+
+# 读取文件计算哈希时每次的长度
+HASH_READ_SIZE = 1024 * 1024
+
+# 从签名块中读取签名证书时依次查找的块（v3.1/v3为轮换后的当前证书）
+_CERTIFICATE_BLOCK_IDS = (APK_SIGNATURE_SCHEME_V31_BLOCK_ID, APK_SIGNATURE_SCHEME_V3_BLOCK_ID,
+                          APK_SIGNATURE_SCHEME_V2_BLOCK_ID)
+
+# 同一进程内追加清单时串行写入
+_manifest_lock = threading.Lock()
+
+
+class MultiHasher:
+    def __init__(self, algorithms=CHECKSUM_ALGORITHMS):
+        """
+        同时计算多种哈希，并记录数据长度和计算耗时
+        :param algorithms: hashlib算法名称
+        """
+        # 校验和不用于安全用途，FIPS模式下也允许MD5
+        self._digests = {name: hashlib.new(name, usedforsecurity=False) for name in algorithms}
+        self.size = 0
+        self.elapsed = 0.0
+
+    def update(self, data):
+        """追加数据（hashlib在处理大块数据时会释放GIL）"""
+        started = time.perf_counter()
+        for digest in self._digests.values():
+            digest.update(data)
+        self.size += len(data)
+        self.elapsed += time.perf_counter() - started
+
+    def copy(self):
+        """复制当前的哈希状态，用于共同前缀的多个输出"""
+        hasher = MultiHasher.__new__(MultiHasher)
+        hasher._digests = {name: digest.copy() for name, digest in self._digests.items()}
+        hasher.size = self.size
+        hasher.elapsed = self.elapsed
+        return hasher
+
+    def hexdigests(self):
+        """{算法: 十六进制哈希}"""
+        return {name: digest.hexdigest() for name, digest in self._digests.items()}
+
+
+def hash_file(path, hasher=None, cancel_event=None):
+    """读取文件计算哈希（用于由外部工具写出的输出）"""
+    hasher = hasher if hasher is not None else MultiHasher()
+    buf = bytearray(HASH_READ_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher
+
+
+def _length_prefixed_items(data):
+    """依次读取长度前缀的条目"""
+    pos = 0
+    while pos + 4 <= len(data):
+        length, = struct.unpack_from('<I', data, pos)
+        yield data[pos + 4:pos + 4 + length]
+        pos += 4 + length
+
+
+def signer_certificate_sha256(pairs):
+    """
+    签名块中第一个签名者证书的SHA-256指纹（v2/v3的signed data都以摘要列表、证书列表开头）
+    :param pairs: find_signing_block返回的ID-值对
+    :return: 十六进制指纹，没有签名或格式不符时返回None
+    """
+    blocks = dict(pairs)
+    for block_id in _CERTIFICATE_BLOCK_IDS:
+        if block_id not in blocks:
+            continue
+        try:
+            signers = next(_length_prefixed_items(blocks[block_id]))
+            signer = next(_length_prefixed_items(signers))
+            signed_data = next(_length_prefixed_items(signer))
+            certificates = list(_length_prefixed_items(signed_data))[1]
+            return hashlib.sha256(next(_length_prefixed_items(certificates))).hexdigest()
+        except (StopIteration, IndexError, struct.error):
+            continue
+    return None
+
+
+def apk_signer_sha256(apk_path):
+    """读取APK签名块中的签名证书指纹，只读取文件末尾"""
+    with ApkZipReader(apk_path) as reader:
+        _, pairs = find_signing_block(reader.buf, reader.eocd)
+    return signer_certificate_sha256(pairs)
+
+
+def checksum_record(output_path, hasher, signer_sha256, input_path=None, elapsed=None, channel=None):
+    """
+    生成一条清单记录
+    :param hasher: 已处理完整个输出文件的MultiHasher
+    :param elapsed: 从开始签名到输出完成的耗时（秒）
+    """
+    record = {'output': os.path.abspath(output_path), 'name': os.path.basename(output_path), 'size': hasher.size}
+    record.update(hasher.hexdigests())
+    record['signer_sha256'] = signer_sha256
+    if input_path is not None:
+        record['input'] = os.path.abspath(input_path)
+    if channel is not None:
+        record['channel'] = channel
+    record['timings'] = {'total': elapsed, 'checksum': hasher.elapsed}
+    record['time'] = time.time()
+    return record
+
+
+def append_manifest(record, directory=None):
+    """
+    把记录追加到清单文件（默认为输出文件所在目录中的checksums.jsonl）
+    每条记录只用一次write写入整行，多个进程同时追加时也不会交错
+    """
+    directory = directory or os.path.dirname(record['output'])
+    line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+    with _manifest_lock:
+        fd = os.open(os.path.join(directory, MANIFEST_NAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def format_checksum(record):
+    """把清单记录格式化为简短说明"""
+    return f"SHA-256 {record['sha256'][:16]}…"
@@ -0,0 +1,228 @@
+"""
+块摘要缓存模块
+热更新流程中同一路径的APK只修改了少数条目就重新签名。v2签名按1MB分块计算摘要，
+这里保存上次签名时条目区每个块的摘要，以及每个条目所在区间的签名（中央目录记录、本地文件头、区间边界和数据首尾），
+再次签名时根据中央目录中的CRC和偏移判断哪些区间变化了，只重新计算与变化区间重叠的块。
+文件大小和修改时间都没有变化时也比较区间签名；沿用前总是重新计算其中一个块，与缓存不一致时放弃整个缓存。
+需要去掉v1签名文件或重新对齐的APK走单次流水线（apk_pipeline.stream_sign_apk），不使用这里的缓存
+"""
+
+import os
+import random
+import struct
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_signing_block import CHUNK_SIZE, compute_chunk_digests
+
+
+# 缓存目录
+DIGEST_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".apk_resign_gui", "digests")
+
+# 最多保留的缓存文件数，超出时删除最久未使用的
+MAX_CACHE_FILES = 200
+
+# 缓存文件格式：文件头、块摘要、区间签名
+_MAGIC = b'APKDIG02'
+_HEADER = struct.Struct('<8sQQqII')
+DIGEST_SIZE = 32
+SPAN_SIGNATURE_SIZE = 16
+
+# 区间签名包括条目数据开头和结尾的字节数：CRC和大小相同但重新压缩过的条目，压缩数据通常从开头就不同
+SPAN_SAMPLE_SIZE = 4096
+
+# entries_end: 条目区长度；file_size/mtime_ns: 计算摘要时APK的大小和修改时间；
+# chunk_digests: 条目区各块的摘要；span_signatures: 各区间签名的集合
+DigestMap = namedtuple('DigestMap', ['entries_end', 'file_size', 'mtime_ns', 'chunk_digests', 'span_signatures'])
+
+
+def _span_signature(*parts):
+    """区间签名"""
+    digest = hashlib.blake2b(digest_size=SPAN_SIGNATURE_SIZE)
+    for part in parts:
+        digest.update(part)
+    return digest.digest()
+
+
+def entry_spans(buf, index, entries_end):
+    """
+    把条目区[0, entries_end)划分为区间：每个区间从一个条目的本地文件头开始，到下一个条目的本地文件头为止
+    区间签名包括中央目录记录（CRC、压缩后大小、本地文件头偏移等）、本地文件头、区间边界和数据首尾各SPAN_SAMPLE_SIZE字节，
+    签名相同说明该区间在文件中的位置没有变化，内容（除非CRC碰撞且只改了数据中间）也没有变化
+    :param index: CentralDirectoryIndex
+    :return: [(起始偏移, 结束偏移, 签名)]，按偏移排序并覆盖整个条目区
+    """
+    spans = []
+    order = [i for i in index.order_by_offset() if index.header_offsets[i] < entries_end]
+    first = index.header_offsets[order[0]] if order else entries_end
+    if first > 0:
+        # 第一个条目之前的数据没有CRC可用，直接按内容计算签名
+        spans.append((0, first, _span_signature(struct.pack('<QQ', 0, first), buf[:first])))
+    for n, i in enumerate(order):
+        start = index.header_offsets[i]
+        end = index.header_offsets[order[n + 1]] if n + 1 < len(order) else entries_end
+        data_start = min(index.data_offset(i), end)
+        spans.append((start, end, _span_signature(
+            struct.pack('<QQ', start, end), index.record(i), buf[start:data_start],
+            buf[data_start:min(data_start + SPAN_SAMPLE_SIZE, end)], buf[max(data_start, end - SPAN_SAMPLE_SIZE):end])))
+    return spans
+
+
+def reusable_chunks(previous, spans, entries_end):
+    """
+    找出可以沿用上次摘要的块：块的边界与上次相同，且块内所有字节都属于未变化的区间
+    条目大小变化会使后面所有条目的偏移改变，这些条目所在的块都需要重新计算
+    :param previous: 上次的DigestMap
+    :return: {块序号: 摘要}
+    """
+    # 合并变化的区间
+    changed = []
+    for start, end, signature in spans:
+        if signature in previous.span_signatures:
+            continue
+        if changed and changed[-1][1] >= start:
+            changed[-1][1] = max(changed[-1][1], end)
+        else:
+            changed.append([start, end])
+
+    known = {}
+    j = 0
+    for k, digest in enumerate(previous.chunk_digests):
+        start = k * CHUNK_SIZE
+        if start >= entries_end:
+            break
+        end = min(start + CHUNK_SIZE, entries_end)
+        if end != min(start + CHUNK_SIZE, previous.entries_end):
+            continue
+        while j < len(changed) and changed[j][1] <= start:
+            j += 1
+        if j < len(changed) and changed[j][0] < end:
+            continue
+        known[k] = digest
+    return known
+
+
+def spot_check(buf, known, entries_end):
+    """
+    随机重新计算一个沿用的块，确认缓存与文件内容一致（CRC碰撞或保留了修改时间、只改了条目数据中间的改写只能靠抽查发现）
+    :param known: {块序号: 摘要}
+    :return: 摘要是否一致
+    """
+    k = random.choice(list(known))
+    start = k * CHUNK_SIZE
+    return compute_chunk_digests((buf[start:min(start + CHUNK_SIZE, entries_end)],)) == [known[k]]
+
+
+class ChunkDigestCache:
+    def __init__(self, cache_dir=DIGEST_CACHE_DIR, max_files=MAX_CACHE_FILES):
+        """
+        按输入APK路径保存条目区的块摘要
+        :param cache_dir: 缓存目录
+        :param max_files: 最多保留的缓存文件数
+        """
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def _path(self, apk_path):
+        """缓存文件路径"""
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(apk_path)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.bin")
+
+    def load(self, apk_path):
+        """读取上次的DigestMap，没有缓存或缓存损坏时返回None"""
+        try:
+            with open(self._path(apk_path), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+        magic, entries_end, file_size, mtime_ns, chunk_count, span_count = _HEADER.unpack_from(data)
+        spans_start = _HEADER.size + chunk_count * DIGEST_SIZE
+        if magic != _MAGIC or len(data) != spans_start + span_count * SPAN_SIGNATURE_SIZE:
+            return None
+        chunk_digests = [data[pos:pos + DIGEST_SIZE] for pos in range(_HEADER.size, spans_start, DIGEST_SIZE)]
+        span_signatures = {data[pos:pos + SPAN_SIGNATURE_SIZE]
+                           for pos in range(spans_start, len(data), SPAN_SIGNATURE_SIZE)}
+        return DigestMap(entries_end, file_size, mtime_ns, chunk_digests, span_signatures)
+
+    def save(self, apk_path, digest_map):
+        """保存DigestMap（先写临时文件再替换）"""
+        signatures = sorted(digest_map.span_signatures)
+        header = _HEADER.pack(_MAGIC, digest_map.entries_end, digest_map.file_size, digest_map.mtime_ns,
+                              len(digest_map.chunk_digests), len(signatures))
+        data = b''.join([header] + list(digest_map.chunk_digests) + signatures)
+        path = self._path(apk_path)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._prune()
+        except OSError as e:
+            print(f"保存块摘要缓存失败: {e}")
+
+    def _prune(self):
+        """删除最久未使用的缓存文件"""
+        with self._lock:
+            try:
+                files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                         if name.endswith('.bin')]
+            except OSError:
+                return
+            if len(files) <= self.max_files:
+                return
+            files.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+            for path in files[:len(files) - self.max_files]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def lookup(self, apk_path, reader, entries_end):
+        """
+        与上次的缓存比较：计算区间签名找出未变化的块，文件大小和修改时间是否变化都不作为依据；
+        沿用前抽查一个块，与缓存不一致时不沿用任何块
+        :param reader: ApkZipReader
+        :return: (可以沿用的块摘要 {块序号: 摘要}, 不含块摘要的DigestMap)，后者在签名完成后传给store
+        """
+        stat = reader.stat()
+        previous = self.load(apk_path)
+        # 大小和修改时间相同也重新计算区间签名：保留修改时间的改写只要落在本地文件头或数据首尾就能发现
+        spans = entry_spans(reader.buf, reader.index(), entries_end)
+        known = reusable_chunks(previous, spans, entries_end) if previous is not None else {}
+        span_signatures = {signature for _, _, signature in spans}
+        if known and not spot_check(reader.buf, known, entries_end):
+            known = {}
+        return known, DigestMap(entries_end, stat.st_size, stat.st_mtime_ns, None, span_signatures)
+
+    def store(self, apk_path, entries_end, chunk_digests, pending):
+        """
+        签名完成后保存本次的块摘要
+        :param chunk_digests: 所有块摘要，只保存属于条目区的部分
+        :param pending: lookup返回的DigestMap
+        """
+        entry_chunks = (entries_end + CHUNK_SIZE - 1) // CHUNK_SIZE
+        self.save(apk_path, pending._replace(chunk_digests=chunk_digests[:entry_chunks]))
+
+    def precompute(self, apk_path, reader, entries_end, cancel_event=None, max_workers=None):
+        """
+        签名前预先计算条目区的块摘要并保存（块摘要与密钥无关），只计算与上次缓存相比变化的块
+        :param reader: ApkZipReader
+        :param max_workers: 计算摘要的线程数，默认CPU核数
+        :return: 统计信息字典
+        :raises OperationCancelled: cancel_event被设置
+        """
+        known, pending = self.lookup(apk_path, reader, entries_end)
+        view = memoryview(reader.buf)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as executor:
+                chunk_digests = compute_chunk_digests((view[:entries_end],), executor, cancel_event, known)
+        finally:
+            view.release()
+        self.store(apk_path, entries_end, chunk_digests, pending)
+        return {'chunks': len(chunk_digests), 'chunks_reused': len(known)}
@@ -0,0 +1,232 @@
+"""
+APK元数据模块
+解析二进制AndroidManifest.xml(AXML)，并根据命名模板生成输出文件名
+"""
+
+import os
+import re
+import struct
+
+from apk_zip import ApkZipReader, ApkFormatError
+
+
+# AXML块类型
+RES_XML_TYPE = 0x0003
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_XML_START_ELEMENT_TYPE = 0x0102
+
+# 字符串池标志
+UTF8_FLAG = 0x100
+
+# Res_value数据类型
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+
+NO_INDEX = 0xFFFFFFFF
+
+# android命名空间属性的资源ID，混淆后的清单中属性名可能被清空，只能依靠资源ID识别
+ANDROID_ATTR_IDS = {
+    0x0101021b: 'versionCode',
+    0x0101021c: 'versionName',
+    0x0101020c: 'minSdkVersion',
+    0x01010270: 'targetSdkVersion',
+    0x010104ea: 'extractNativeLibs',
+}
+
+# 需要读取属性的元素，读到application后即可停止解析
+MANIFEST_ELEMENTS = ('manifest', 'uses-sdk', 'application')
+
+# 默认的输出文件命名模板
+DEFAULT_OUTPUT_TEMPLATE = "{apk_name}_resigned.apk"
+
+# 模板可用字段
+TEMPLATE_FIELDS = ('apk_name', 'package', 'versionName', 'versionCode', 'minSdkVersion', 'profile')
+
+# 文件名中不允许的字符
+_INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+class _StringPool:
+    def __init__(self, data, pos):
+        """解析字符串池头部，字符串按需解码"""
+        header_size, = struct.unpack_from('<H', data, pos + 2)
+        string_count, _, flags, strings_start = struct.unpack_from('<IIII', data, pos + 8)
+        self.data = data
+        self.utf8 = bool(flags & UTF8_FLAG)
+        self.offsets = struct.unpack_from(f'<{string_count}I', data, pos + header_size)
+        self.strings_start = pos + strings_start
+        self._cache = {}
+
+    def get(self, index):
+        """获取指定索引的字符串"""
+        if index == NO_INDEX or index >= len(self.offsets):
+            return None
+        value = self._cache.get(index)
+        if value is None:
+            value = self._decode(self.strings_start + self.offsets[index])
+            self._cache[index] = value
+        return value
+
+    def _decode(self, pos):
+        data = self.data
+        if self.utf8:
+            # 先是UTF-16长度，再是UTF-8字节长度，各占1或2字节
+            pos += 2 if data[pos] & 0x80 else 1
+            length = data[pos]
+            if length & 0x80:
+                length = ((length & 0x7F) << 8) | data[pos + 1]
+                pos += 2
+            else:
+                pos += 1
+            return data[pos:pos + length].decode('utf-8', 'replace')
+        length, = struct.unpack_from('<H', data, pos)
+        if length & 0x8000:
+            low, = struct.unpack_from('<H', data, pos + 2)
+            length = ((length & 0x7FFF) << 16) | low
+            pos += 4
+        else:
+            pos += 2
+        return data[pos:pos + length * 2].decode('utf-16-le', 'replace')
+
+
+def _attribute_value(strings, raw_value, data_type, value):
+    """把属性值转换为Python值"""
+    if raw_value != NO_INDEX:
+        return strings.get(raw_value)
+    if data_type == TYPE_STRING:
+        return strings.get(value)
+    if data_type in (TYPE_INT_DEC, TYPE_INT_HEX):
+        return value - 0x100000000 if value & 0x80000000 else value
+    if data_type == TYPE_INT_BOOLEAN:
+        return value != 0
+    if data_type == TYPE_REFERENCE:
+        return f"@0x{value:08x}"
+    return value
+
+
+def parse_manifest(data):
+    """
+    解析二进制AndroidManifest.xml中manifest、uses-sdk和application元素的关键属性
+    :param data: AXML数据
+    :return: 属性字典，例如 {'package': ..., 'versionCode': ..., 'versionName': ...}
+    :raises ApkFormatError: 不是二进制XML或数据不完整
+    """
+    if len(data) < 8:
+        raise ApkFormatError("AndroidManifest.xml 数据过短")
+    chunk_type, header_size, total_size = struct.unpack_from('<HHI', data, 0)
+    if chunk_type != RES_XML_TYPE:
+        raise ApkFormatError("AndroidManifest.xml 不是二进制XML格式")
+
+    try:
+        return _parse_chunks(data, header_size, min(total_size, len(data)))
+    except (struct.error, IndexError):
+        raise ApkFormatError("AndroidManifest.xml 数据不完整")
+
+
+def _parse_chunks(data, pos, end):
+    """依次解析[pos, end)中的块，数据被截断时抛出struct.error或IndexError"""
+    strings = None
+    resource_ids = ()
+    result = {}
+    while pos + 8 <= end:
+        chunk_type, header_size, chunk_size = struct.unpack_from('<HHI', data, pos)
+        if chunk_size < 8:
+            raise ApkFormatError("AndroidManifest.xml 块大小错误")
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = _StringPool(data, pos)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            count = (chunk_size - header_size) // 4
+            resource_ids = struct.unpack_from(f'<{count}I', data, pos + header_size)
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE and strings is not None:
+            _, name_index, attr_start, attr_size, attr_count = struct.unpack_from('<IIHHH', data, pos + 16)
+            element = strings.get(name_index)
+            if element in MANIFEST_ELEMENTS:
+                attr_pos = pos + 16 + attr_start
+                for _ in range(attr_count):
+                    _, attr_name, raw_value, _, _, data_type, value = struct.unpack_from('<IIIHBBI', data, attr_pos)
+                    attr_pos += attr_size
+                    if attr_name < len(resource_ids) and resource_ids[attr_name] in ANDROID_ATTR_IDS:
+                        key = ANDROID_ATTR_IDS[resource_ids[attr_name]]
+                    elif element == 'manifest' and strings.get(attr_name) == 'package':
+                        key = 'package'
+                    else:
+                        continue
+                    result[key] = _attribute_value(strings, raw_value, data_type, value)
+                if element == 'application':
+                    break
+        pos += chunk_size
+    return result
+
+
+def get_apk_metadata(apk_path):
+    """
+    读取APK的清单元数据，只访问中央目录和AndroidManifest.xml条目
+    :param apk_path: APK路径
+    """
+    with ApkZipReader(apk_path) as reader:
+        try:
+            manifest = reader.read('AndroidManifest.xml')
+        except KeyError:
+            raise ApkFormatError("APK中没有AndroidManifest.xml")
+    return parse_manifest(manifest)
+
+
+def _sanitize(value):
+    """替换文件名中不允许的字符"""
+    return _INVALID_FILENAME_CHARS.sub('_', str(value))
+
+
+def format_output_name(template, apk_path, metadata=None, profile=""):
+    """
+    按模板生成输出文件名
+    :param template: 命名模板，如 "{package}-{versionName}-{versionCode}-{profile}.apk"
+    :param apk_path: 输入APK路径
+    :param metadata: get_apk_metadata的结果，模板只用到apk_name/profile时可为None
+    :param profile: 签名配置名称
+    """
+    fields = {
+        'apk_name': os.path.splitext(os.path.basename(apk_path))[0],
+        'profile': profile,
+    }
+    for key, value in (metadata or {}).items():
+        if value is not None:
+            fields[key] = value
+    try:
+        name = template.format_map({key: _sanitize(value) for key, value in fields.items()})
+    except KeyError as e:
+        raise ValueError(f"命名模板字段 {e} 不可用，可用字段: {', '.join(TEMPLATE_FIELDS)}")
+    if not name.lower().endswith('.apk'):
+        name += '.apk'
+    return name
+
+
+def check_output_name(name):
+    """
+    检查按模板生成的输出文件名，只允许不含目录的文件名（模板本身可能带有路径分隔符或..）
+    :raises ValueError: 文件名带有目录、是绝对路径或为..
+    """
+    if (not name or os.path.isabs(name) or os.path.splitdrive(name)[0] or os.path.basename(name) != name
+            or name in (os.curdir, os.pardir) or '/' in name or '\\' in name):
+        raise ValueError(f"输出文件名不能包含目录: {name}")
+    return name
+
+
+def resolve_output_name(apk_path, template=None, profile=""):
+    """
+    按模板生成并检查输出文件名，需要时读取APK的清单元数据
+    :param template: 命名模板，为空时使用DEFAULT_OUTPUT_TEMPLATE
+    :raises ValueError: 模板字段不可用或文件名带有目录
+    :raises ApkFormatError: 模板需要清单元数据而APK无法解析
+    """
+    template = template or DEFAULT_OUTPUT_TEMPLATE
+    metadata = get_apk_metadata(apk_path) if template_needs_metadata(template) else None
+    return check_output_name(format_output_name(template, apk_path, metadata, profile))
+
+
+def template_needs_metadata(template):
+    """模板是否用到需要解析清单的字段"""
+    return any(f"{{{field}" in template for field in TEMPLATE_FIELDS if field not in ('apk_name', 'profile'))
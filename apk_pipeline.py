@@ -0,0 +1,365 @@
+"""
+单次流水线签名模块
+需要去掉v1签名文件、重新对齐或把原生库改为不压缩时，条目区不能原样复制。
+这里把读取、去签名、对齐、计算摘要和写出串成一条流水线：各阶段之间用有界队列连接，
+复用预先分配的1MB缓冲区，每个缓冲区恰好是一个v2摘要块，写出的同时计算摘要，
+输入的每个字节只读一次、输出只写一次，内存占用只取决于缓冲区数量，与APK大小无关
+"""
+
+import time
+import zlib
+import queue
+import threading
+
+from apk_zip import ApkZipReader, ApkZipWriter, ApkFormatError, ZIP_STORED, ZIP_DEFLATED, DEFAULT_ALIGNMENT
+from apk_repack import is_native_lib, DEFAULT_PAGE_SIZE, SUPPORTED_PAGE_SIZES
+from apk_signing_block import (find_signing_block, build_signing_block, compute_chunk_digests, top_level_digest,
+                               is_v1_signature_file, _chunk_digest, OperationCancelled,
+                               CHUNK_SIZE, SIGNATURE_BLOCK_IDS, APK_SIGNATURE_SCHEME_V2_BLOCK_ID)
+
+
+# 缓冲区数量，缓冲区大小固定为一个v2摘要块
+DEFAULT_BUFFER_COUNT = 8
+
+# 解压原生库时每次读取的压缩数据长度
+INFLATE_READ_SIZE = 256 * 1024
+
+# 阶段等待队列时检查是否需要停止的间隔（秒）
+_POLL_INTERVAL = 0.1
+
+# 流水线各阶段
+STAGE_READ = "读取"
+STAGE_DIGEST = "摘要"
+STAGE_WRITE = "写入"
+STAGE_CHECKSUM = "校验和"
+
+
+class _PipelineStopped(Exception):
+    """其他阶段出错或被取消，当前阶段停止"""
+    pass
+
+
+class StageCounter:
+    def __init__(self, name):
+        """
+        流水线阶段的吞吐量计数
+        :param name: 阶段名称
+        """
+        self.name = name
+        self.bytes = 0
+        # 处理数据的时间和等待上下游的时间（秒）
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    def rate(self):
+        """处理数据时的吞吐量（字节/秒）"""
+        return self.bytes / self.busy if self.busy > 0 else 0.0
+
+    def as_dict(self):
+        return {'bytes': self.bytes, 'busy': self.busy, 'waiting': self.waiting, 'rate': self.rate()}
+
+
+class BufferPool:
+    def __init__(self, count, size=CHUNK_SIZE):
+        """
+        预先分配的固定数量缓冲区，用完后阻塞直到下游归还
+        :param count: 缓冲区数量
+        :param size: 每个缓冲区的字节数
+        """
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def acquire(self, stop_event):
+        """取出一个空闲缓冲区"""
+        return _get(self._free, stop_event)
+
+    def release(self, buffer):
+        """归还缓冲区"""
+        self._free.put(buffer)
+
+
+def _get(q, stop_event):
+    """从队列中取出一项，等待期间其他阶段要求停止时抛出_PipelineStopped"""
+    while True:
+        try:
+            return q.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            if stop_event.is_set():
+                raise _PipelineStopped()
+
+
+def plan_entries(index, page_align_native_libs=False, page_size=DEFAULT_PAGE_SIZE):
+    """
+    只根据中央目录规划输出的条目区：按本地文件头顺序输出，去掉v1签名文件，不压缩的条目按4字节对齐，
+    不压缩的原生库按页对齐
+    :param index: CentralDirectoryIndex
+    :param page_align_native_libs: 是否把压缩的原生库改为不压缩并按页对齐
+    :return: (ApkZipWriter（已登记所有条目）, [(本地文件头, 数据偏移, 数据长度, 是否需要解压, 解压后长度)], 统计信息)
+    """
+    if page_size not in SUPPORTED_PAGE_SIZES:
+        raise ValueError(f"不支持的页大小: {page_size}")
+    writer = ApkZipWriter(None)
+    segments = []
+    stats = {'entries': 0, 'stripped_entries': 0, 'native_libs_inflated': 0}
+    for i in index.order_by_offset():
+        entry = index.entry(i)
+        if is_v1_signature_file(entry.name):
+            stats['stripped_entries'] += 1
+            continue
+        if entry.compress_type not in (ZIP_STORED, ZIP_DEFLATED):
+            raise ApkFormatError(f"不支持的压缩方式 {entry.compress_type}: {entry.name}")
+        native_lib = is_native_lib(entry.name)
+        inflate = page_align_native_libs and native_lib and entry.compress_type == ZIP_DEFLATED
+        compress_type = ZIP_STORED if inflate else entry.compress_type
+        size = entry.file_size if inflate else entry.compressed_size
+        alignment = None
+        if compress_type == ZIP_STORED:
+            alignment = page_size if native_lib else DEFAULT_ALIGNMENT
+        header = writer.add_entry(entry, compress_type, size, alignment)
+        segments.append((header, index.data_offset(i), entry.compressed_size, inflate, size))
+        stats['entries'] += 1
+        if inflate:
+            stats['native_libs_inflated'] += 1
+    return writer, segments, stats
+
+
+def rewrite_reason(index, page_size=DEFAULT_PAGE_SIZE):
+    """
+    条目区能否原样保留：有v1签名文件或不压缩的条目没有对齐时需要经过流水线重写
+    :return: 需要重写的原因，可以原样保留时返回None
+    """
+    for i in index.order_by_offset():
+        name = index.name(i)
+        if is_v1_signature_file(name):
+            return "去掉v1签名文件"
+        entry = index.entry(i)
+        if entry.compress_type == ZIP_STORED:
+            alignment = page_size if is_native_lib(name) else DEFAULT_ALIGNMENT
+            if index.data_offset(i) % alignment:
+                return "重新对齐不压缩的条目"
+    return None
+
+
+class _Pipeline:
+    def __init__(self, src_path, dst_file, segments, buffer_count, cancel_event, hasher=None):
+        """
+        读取 -> 摘要 -> 写入 [-> 校验和] 各阶段各在一个线程中运行
+        :param dst_file: 已打开的输出文件，条目区从当前位置开始写
+        :param segments: plan_entries规划的条目
+        :param hasher: 可选的apk_checksum.MultiHasher，写出后计算输出文件的校验和
+        """
+        self.src_path = src_path
+        self.dst_file = dst_file
+        self.segments = segments
+        self.pool = BufferPool(buffer_count)
+        self.cancel_event = cancel_event
+        self.stop_event = threading.Event()
+        self.error = None
+        self.chunk_digests = []
+        self.hasher = hasher
+        # 读取之后的阶段：(名称, 处理函数)，缓冲区依次经过各阶段，最后一个阶段归还缓冲区
+        self.stages = [(STAGE_DIGEST, self._digest), (STAGE_WRITE, self._write)]
+        if hasher is not None:
+            self.stages.append((STAGE_CHECKSUM, hasher.update))
+        # 队列中最多容纳全部缓冲区，阶段之间不会因为队列满而等待
+        self.queues = [queue.Queue(maxsize=buffer_count) for _ in self.stages]
+        self.counters = {name: StageCounter(name) for name in [STAGE_READ] + [name for name, _ in self.stages]}
+
+    def run(self):
+        """运行流水线，返回条目区的块摘要"""
+        threads = [threading.Thread(target=self._guard, args=(self._read,), daemon=True)]
+        threads += [threading.Thread(target=self._guard, args=(self._run_stage, i), daemon=True)
+                    for i in range(len(self.stages))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.chunk_digests
+
+    def _guard(self, stage, *args):
+        """运行一个阶段，出错时通知其他阶段停止"""
+        try:
+            stage(*args)
+        except _PipelineStopped:
+            pass
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+            self.stop_event.set()
+
+    def _acquire(self):
+        """读取阶段取出空闲缓冲区，同时检查是否被取消"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise OperationCancelled()
+        counter = self.counters[STAGE_READ]
+        started = time.perf_counter()
+        buffer = self.pool.acquire(self.stop_event)
+        counter.waiting += time.perf_counter() - started
+        return buffer, memoryview(buffer)
+
+    def _read(self):
+        """读取阶段：把本地文件头和条目数据依次填满缓冲区"""
+        counter = self.counters[STAGE_READ]
+        buffer, view = self._acquire()
+        fill = 0
+        with open(self.src_path, 'rb', buffering=0) as f:
+            for segment in self.segments:
+                started = time.perf_counter()
+                for piece in self._pieces(f, segment):
+                    # piece为要复制的数据，或者为整数，表示从文件当前位置读取的长度
+                    remaining = piece if isinstance(piece, int) else len(piece)
+                    done = 0
+                    while remaining:
+                        if fill == len(buffer):
+                            counter.busy += time.perf_counter() - started
+                            self.queues[0].put((buffer, fill))
+                            buffer, view = self._acquire()
+                            fill = 0
+                            started = time.perf_counter()
+                        n = min(remaining, len(buffer) - fill)
+                        if isinstance(piece, int):
+                            if f.readinto(view[fill:fill + n]) != n:
+                                raise ApkFormatError("读取条目数据时文件意外结束")
+                        else:
+                            view[fill:fill + n] = piece[done:done + n]
+                        fill += n
+                        done += n
+                        remaining -= n
+                        counter.bytes += n
+                counter.busy += time.perf_counter() - started
+        if fill:
+            self.queues[0].put((buffer, fill))
+        else:
+            self.pool.release(buffer)
+        self.queues[0].put(None)
+
+    @staticmethod
+    def _pieces(f, segment):
+        """依次给出一个条目的输出数据：本地文件头，然后是从文件读取的长度或解压后的数据"""
+        header, data_offset, data_size, inflate, size = segment
+        yield memoryview(header)
+        if not data_size:
+            return
+        f.seek(data_offset)
+        if not inflate:
+            yield data_size
+            return
+        # 解压后的数据按块给出，不会一次性读入整个条目
+        decompressor = zlib.decompressobj(-15)
+        total = 0
+        remaining = data_size
+        while remaining:
+            raw = f.read(min(INFLATE_READ_SIZE, remaining))
+            if not raw:
+                raise ApkFormatError("读取条目数据时文件意外结束")
+            remaining -= len(raw)
+            while raw:
+                data = decompressor.decompress(raw, CHUNK_SIZE)
+                raw = decompressor.unconsumed_tail
+                total += len(data)
+                yield memoryview(data)
+        data = decompressor.flush()
+        total += len(data)
+        yield memoryview(data)
+        if total != size:
+            raise ApkFormatError(f"解压后的长度与中央目录不一致: {total} != {size}")
+
+    def _run_stage(self, index):
+        """运行读取之后的一个阶段，处理完的缓冲区交给下一阶段"""
+        name, work = self.stages[index]
+        counter = self.counters[name]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            started = time.perf_counter()
+            item = _get(inbox, self.stop_event)
+            counter.waiting += time.perf_counter() - started
+            if item is None:
+                break
+            buffer, fill = item
+            started = time.perf_counter()
+            work(memoryview(buffer)[:fill])
+            counter.busy += time.perf_counter() - started
+            counter.bytes += fill
+            if outbox is not None:
+                outbox.put(item)
+            else:
+                self.pool.release(buffer)
+        if outbox is not None:
+            outbox.put(None)
+
+    def _digest(self, data):
+        """摘要阶段：每个缓冲区是一个完整的v2块"""
+        self.chunk_digests.append(_chunk_digest(data))
+
+    def _write(self, data):
+        """写入阶段"""
+        self.dst_file.write(data)
+
+
+def stream_sign_apk(src_path, dst_path, signer, cancel_event=None, page_align_native_libs=False,
+                    page_size=DEFAULT_PAGE_SIZE, buffer_count=DEFAULT_BUFFER_COUNT, hasher=None):
+    """
+    单次流水线重写并签名APK：去掉v1签名文件和旧签名块，重新对齐，写出条目区的同时计算v2摘要，
+    最后写入签名块、中央目录和EOCD；签名块中与签名无关的条目和ZIP注释原样保留
+    :param signer: V2Signer
+    :param page_align_native_libs: 是否把压缩的原生库改为不压缩并按页对齐
+    :param buffer_count: 缓冲区数量，流水线占用的内存为buffer_count * 1MB
+    :param hasher: 可选的apk_checksum.MultiHasher，在写出的同时计算整个输出文件的校验和
+    :return: 统计信息字典，其中stages为各阶段的吞吐量计数
+    """
+    started = time.perf_counter()
+    with ApkZipReader(src_path) as reader:
+        _, pairs = find_signing_block(reader.buf, reader.eocd)
+        writer, segments, stats = plan_entries(reader.index(), page_align_native_libs, page_size)
+        comment = reader.comment()
+    entries_end = writer.offset
+    central_directory = writer.central_directory()
+    kept_pairs = [(pair_id, value) for pair_id, value in pairs if pair_id not in SIGNATURE_BLOCK_IDS]
+
+    with open(dst_path, 'wb') as f:
+        pipeline = _Pipeline(src_path, f, segments, buffer_count, cancel_event, hasher)
+        chunk_digests = pipeline.run()
+        # 计算摘要时EOCD中的中央目录偏移视为签名块的偏移
+        chunk_digests += compute_chunk_digests(
+            (central_directory, writer.eocd_record(entries_end, len(central_directory), comment)))
+        signing_block = build_signing_block(
+            [(APK_SIGNATURE_SCHEME_V2_BLOCK_ID, signer.build_v2_block(top_level_digest(chunk_digests)))]
+            + kept_pairs)
+        for data in (signing_block, central_directory,
+                     writer.eocd_record(entries_end + len(signing_block), len(central_directory), comment)):
+            f.write(data)
+            if hasher is not None:
+                hasher.update(data)
+        size = f.tell()
+
+    counters = pipeline.counters
+    stats.update({
+        'size': size,
+        'entries_bytes': entries_end,
+        'signing_block_bytes': len(signing_block),
+        'chunks': len(chunk_digests),
+        'kept_blocks': len(kept_pairs),
+        'buffer_bytes': buffer_count * CHUNK_SIZE,
+        'elapsed': time.perf_counter() - started,
+        'stages': {name: counter.as_dict() for name, counter in counters.items()},
+        # 处理时间最长的阶段决定了整条流水线的速度
+        'bottleneck': max(counters.values(), key=lambda counter: counter.busy).name,
+    })
+    return stats
+
+
+def format_pipeline_stats(stats):
+    """把流水线统计信息格式化为一行说明"""
+    parts = []
+    if stats['stripped_entries']:
+        parts.append(f"去掉{stats['stripped_entries']}个v1签名文件")
+    if stats['native_libs_inflated']:
+        parts.append(f"{stats['native_libs_inflated']}个原生库改为不压缩")
+    rates = "、".join(f"{name} {stage['rate'] / (1024 * 1024):.0f}MB/s" for name, stage in stats['stages'].items())
+    parts.append(f"单次流水线 {rates}，瓶颈：{stats['bottleneck']}")
+    return "，".join(parts)
@@ -0,0 +1,125 @@
+"""
+APK预处理模块
+选择或拖入APK后到点击重签名前，在后台完成与密钥无关的准备工作：查找签名工具（直接启动java时还获取java版本）、
+顺序读取整个文件预热页缓存、解析中央目录，进程内签名会原样保留条目区时还预先计算条目区的块摘要（见apk_digest_cache）。
+APK路径改变时取消上一次的预处理，点击重签名时通常只剩生成签名这一步
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_zip import ApkZipReader
+from apk_signing_block import OperationCancelled
+
+
+# 预热页缓存时每次读取的长度
+WARM_READ_SIZE = 4 * 1024 * 1024
+
+
+def warm_page_cache(path, cancel_event=None):
+    """
+    顺序读取整个文件，使之后按mmap访问时不必等待磁盘
+    :return: 读取的字节数
+    :raises OperationCancelled: cancel_event被设置
+    """
+    buf = bytearray(WARM_READ_SIZE)
+    total = 0
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            # 提示内核加大预读
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            n = f.readinto(buf)
+            if not n:
+                break
+            total += n
+    return total
+
+
+def prepare_apk(processor, apk_path, repack_options=None, cancel_event=None):
+    """
+    完成一个APK与密钥无关的准备工作（在工作线程中调用）
+    :param processor: 与签名时设置相同的SigningProcessor，工具检查结果和块摘要缓存为所有实例共享
+    :param repack_options: 签名时将使用的重新打包参数，决定是否需要预先计算块摘要
+    :return: 统计信息字典
+    :raises OperationCancelled: cancel_event被设置
+    """
+    started = time.perf_counter()
+    tools_ok, _, _ = processor.check_tools()
+    if tools_ok and processor.use_direct_java and processor.find_apksigner_jar() is not None:
+        java_cmd = processor.find_java()
+        if java_cmd:
+            processor.get_java_major_version(java_cmd)
+    bytes_read = warm_page_cache(apk_path, cancel_event)
+    with ApkZipReader(apk_path) as reader:
+        entry_count = len(reader.index())
+    digest_stats, reason = processor.precompute_digests(apk_path, repack_options, cancel_event)
+    return {
+        'apk_path': apk_path,
+        'tools_ok': tools_ok,
+        'bytes_read': bytes_read,
+        'entries': entry_count,
+        'digests': digest_stats,
+        'digests_skipped_reason': reason,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def format_prepare_stats(stats):
+    """把预处理统计信息格式化为一行说明"""
+    text = f"已预处理 {os.path.basename(stats['apk_path'])}：{stats['entries']}个条目"
+    if stats['digests'] is not None:
+        text += f"，块摘要{stats['digests']['chunks']}块"
+    return f"{text}（{stats['elapsed']:.1f}秒）"
+
+
+class ApkPreparer:
+    def __init__(self):
+        """后台预处理当前选择的APK，同一时间只处理一个，新的路径会取消尚未完成的预处理"""
+        self._lock = threading.Lock()
+        # 单线程依次执行，被取消的预处理结束后才开始下一个，不会同时读取两个文件
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._cancel_event = None
+
+    def prepare(self, apk_path, processor, repack_options=None, callback=None):
+        """
+        取消上一次的预处理，在后台预处理apk_path
+        :param callback: 可选回调callback(apk_path, 统计信息, 错误信息)，完成或出错时在工作线程中调用，被取消时不调用
+        """
+        cancel_event = threading.Event()
+        with self._lock:
+            if self._cancel_event is not None:
+                self._cancel_event.set()
+            self._cancel_event = cancel_event
+        self._executor.submit(self._run, apk_path, processor, repack_options, callback, cancel_event)
+
+    @staticmethod
+    def _run(apk_path, processor, repack_options, callback, cancel_event):
+        """在工作线程中预处理"""
+        if cancel_event.is_set():
+            return
+        try:
+            stats, error = prepare_apk(processor, apk_path, repack_options, cancel_event), None
+        except OperationCancelled:
+            return
+        except Exception as e:
+            # 任何异常都作为预处理失败报告，否则调用方会一直等待结果
+            stats, error = None, str(e) or type(e).__name__
+        if callback is not None and not cancel_event.is_set():
+            callback(apk_path, stats, error)
+
+    def cancel(self):
+        """取消正在进行的预处理"""
+        with self._lock:
+            if self._cancel_event is not None:
+                self._cancel_event.set()
+                self._cancel_event = None
+
+    def shutdown(self):
+        """停止后台预处理"""
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,164 @@
+"""
+APK重新打包模块
+签名前可选的优化：原生库不压缩并按页对齐存储，指定类型的条目按指定级别重新压缩
+"""
+
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_zip import (ApkZipReader, ApkZipWriter, ApkFormatError, entry_data_offset, read_entry,
+                     ZIP_STORED, ZIP_DEFLATED, DEFAULT_ALIGNMENT)
+from apk_metadata import parse_manifest
+
+
+# 原生库对齐的页大小，Android 15起部分设备使用16KB页
+DEFAULT_PAGE_SIZE = 4096
+SUPPORTED_PAGE_SIZES = (4096, 16384, 65536)
+
+# 默认压缩级别
+DEFAULT_COMPRESS_LEVEL = 9
+
+# 每个工作线程预先提交的条目数，限制同时驻留内存的条目数据
+IN_FLIGHT_PER_WORKER = 4
+
+
+def is_native_lib(name):
+    """是否为lib/<abi>/下的原生库"""
+    return name.startswith('lib/') and name.endswith('.so')
+
+
+def _deflate(data, level):
+    """raw deflate压缩（zlib在压缩期间会释放GIL）"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _inflate(data, size):
+    """raw deflate解压"""
+    return zlib.decompress(data, -15, size or zlib.DEF_BUF_SIZE)
+
+
+def _process_entry(buf, entry, action, level):
+    """
+    处理单个条目，返回(压缩方式, 数据)
+    :param action: 'store' 解压后原样存储，'recompress' 解压后重新压缩，'copy' 原样复制
+    """
+    start = entry_data_offset(buf, entry)
+    raw = buf[start:start + entry.compressed_size]
+    if action == 'copy':
+        return entry.compress_type, raw
+    data = _inflate(raw, entry.file_size) if entry.compress_type == ZIP_DEFLATED else raw
+    if action == 'store':
+        return ZIP_STORED, data
+    compressed = _deflate(data, level)
+    # 重新压缩反而变大时保留原数据
+    if entry.compress_type == ZIP_DEFLATED and len(compressed) >= len(raw):
+        return ZIP_DEFLATED, raw
+    return ZIP_DEFLATED, compressed
+
+
+def repack_apk(src_path, dst_path, page_align_native_libs=True, page_size=DEFAULT_PAGE_SIZE,
+               recompress_extensions=(), compress_level=DEFAULT_COMPRESS_LEVEL, max_workers=None):
+    """
+    重新打包APK
+    :param src_path: 输入APK
+    :param dst_path: 输出APK（未签名，需要再签名）
+    :param page_align_native_libs: 是否把lib/**/*.so改为不压缩并按页对齐（对应extractNativeLibs=false）
+    :param page_size: 原生库对齐的页大小
+    :param recompress_extensions: 需要重新压缩的条目扩展名，如('.dex', '.arsc')；只处理原本已压缩的条目
+    :param compress_level: 重新压缩使用的zlib级别(0-9)
+    :param max_workers: 压缩线程数，默认CPU核数
+    :return: 统计信息字典
+    """
+    if page_size not in SUPPORTED_PAGE_SIZES:
+        raise ValueError(f"不支持的页大小: {page_size}")
+    recompress_extensions = tuple(ext.lower() for ext in recompress_extensions)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    stats = {
+        'size_before': os.path.getsize(src_path),
+        'size_after': 0,
+        'entries': 0,
+        'native_libs': 0,
+        'native_libs_stored_aligned': 0,
+        'native_lib_bytes': 0,
+        'native_libs_previously_deflated': 0,
+        'recompressed_entries': 0,
+        'recompressed_saved_bytes': 0,
+        'page_size': page_size,
+        'extract_native_libs': None,
+    }
+
+    with ApkZipReader(src_path) as reader:
+        # 通过索引按需读取条目，条目很多时不会一次性创建所有条目对象
+        index = reader.index()
+        stats['entries'] = len(index)
+
+        manifest = reader.find_entry('AndroidManifest.xml')
+        if manifest is not None:
+            try:
+                stats['extract_native_libs'] = parse_manifest(read_entry(reader.buf, manifest)).get('extractNativeLibs')
+            except (ApkFormatError, ValueError):
+                pass
+
+        def plan(entry):
+            name = entry.name
+            if page_align_native_libs and is_native_lib(name):
+                return 'store'
+            if (recompress_extensions and entry.compress_type == ZIP_DEFLATED
+                    and name.lower().endswith(recompress_extensions)):
+                return 'recompress'
+            return 'copy'
+
+        with open(dst_path, 'wb') as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            writer = ApkZipWriter(f)
+            in_flight = deque()
+
+            def write_next():
+                entry, action, future = in_flight.popleft()
+                compress_type, data = future.result()
+                alignment = None
+                if compress_type == ZIP_STORED:
+                    alignment = page_size if is_native_lib(entry.name) and page_align_native_libs else DEFAULT_ALIGNMENT
+                if is_native_lib(entry.name):
+                    stats['native_libs'] += 1
+                    stats['native_lib_bytes'] += entry.file_size
+                    if action == 'store':
+                        stats['native_libs_stored_aligned'] += 1
+                        if entry.compress_type == ZIP_DEFLATED:
+                            stats['native_libs_previously_deflated'] += 1
+                if action == 'recompress':
+                    stats['recompressed_entries'] += 1
+                    stats['recompressed_saved_bytes'] += entry.compressed_size - len(data)
+                writer.write_entry(entry, compress_type, data, alignment=alignment)
+
+            # 以本地文件头顺序输出，保持原有的条目布局
+            for i in index.order_by_offset():
+                entry = index.entry(i)
+                if entry.compress_type not in (ZIP_STORED, ZIP_DEFLATED):
+                    raise ApkFormatError(f"不支持的压缩方式 {entry.compress_type}: {entry.name}")
+                action = plan(entry)
+                # 并行处理，按提交顺序写回，保持条目顺序不变
+                in_flight.append((entry, action, executor.submit(
+                    _process_entry, reader.buf, entry, action, compress_level)))
+                if len(in_flight) >= max_workers * IN_FLIGHT_PER_WORKER:
+                    write_next()
+            while in_flight:
+                write_next()
+            stats['size_after'] = writer.close(reader.comment())
+
+    return stats
+
+
+def format_repack_stats(stats):
+    """把统计信息格式化为一行说明"""
+    text = (f"大小 {stats['size_before'] / 1024:.0f}KB -> {stats['size_after'] / 1024:.0f}KB，"
+            f"原生库 {stats['native_libs_stored_aligned']}/{stats['native_libs']} 个不压缩并按"
+            f"{stats['page_size'] // 1024}KB对齐")
+    if stats['recompressed_entries']:
+        text += f"，重新压缩 {stats['recompressed_entries']} 个条目节省 {stats['recompressed_saved_bytes'] / 1024:.0f}KB"
+    if stats['native_libs_stored_aligned'] and stats['extract_native_libs'] is not False:
+        text += "（注意：清单未声明 extractNativeLibs=false，安装时仍会解压原生库）"
+    return text
@@ -0,0 +1,425 @@
+"""
+APK签名块模块
+v2签名只覆盖ZIP条目区、中央目录和EOCD，签名块本身位于条目区和中央目录之间。
+重签名时条目区保持不变，只需要生成新的签名块并修改EOCD中的中央目录偏移，
+输出文件由三部分拼成：原样复制的条目区（copy_file_range，由内核完成复制）、新签名块、中央目录和EOCD
+"""
+
+import os
+import struct
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_zip import ApkZipReader, ApkFormatError, read_entry, EOCD_SIZE
+from apk_metadata import parse_manifest
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa, ec, dsa, padding
+    from cryptography.hazmat.primitives.serialization import pkcs12
+except ImportError:
+    # 没有cryptography时无法在进程内签名，调用方回退到apksigner
+    pkcs12 = None
+
+
+# 签名块结构
+APK_SIG_BLOCK_MAGIC = b'APK Sig Block 42'
+APK_SIG_BLOCK_FOOTER_SIZE = 8 + 16
+APK_SIG_BLOCK_MIN_SIZE = 8 + APK_SIG_BLOCK_FOOTER_SIZE
+
+# 签名块中的ID
+APK_SIGNATURE_SCHEME_V2_BLOCK_ID = 0x7109871a
+APK_SIGNATURE_SCHEME_V3_BLOCK_ID = 0xf05368c0
+APK_SIGNATURE_SCHEME_V31_BLOCK_ID = 0x1b93ad61
+VERITY_PADDING_BLOCK_ID = 0x42726577
+SOURCE_STAMP_V1_BLOCK_ID = 0x2b09189e
+SOURCE_STAMP_V2_BLOCK_ID = 0x6dff800d
+
+# 重签名时需要去掉的块：旧的签名以及依赖旧签名的块，其余块（如渠道信息）原样保留
+SIGNATURE_BLOCK_IDS = (
+    APK_SIGNATURE_SCHEME_V2_BLOCK_ID, APK_SIGNATURE_SCHEME_V3_BLOCK_ID, APK_SIGNATURE_SCHEME_V31_BLOCK_ID,
+    VERITY_PADDING_BLOCK_ID, SOURCE_STAMP_V1_BLOCK_ID, SOURCE_STAMP_V2_BLOCK_ID,
+)
+
+# v2签名算法ID
+SIGNATURE_RSA_PKCS1_V1_5_WITH_SHA256 = 0x0103
+SIGNATURE_ECDSA_WITH_SHA256 = 0x0201
+SIGNATURE_DSA_WITH_SHA256 = 0x0301
+
+# 内容按1MB分块计算摘要
+CHUNK_SIZE = 1024 * 1024
+# 每个线程任务处理的块数
+CHUNKS_PER_TASK = 16
+
+# 只签v2时要求的最低minSdkVersion（Android 7.0），更低的版本需要v1签名
+V2_ONLY_MIN_SDK = 24
+
+# copy_file_range每次复制的最大长度，便于在大文件复制过程中响应取消
+COPY_RANGE_SIZE = 64 * 1024 * 1024
+
+# 常见密钥库文件头，这两种格式只能交给apksigner
+JKS_MAGIC = b'\xfe\xed\xfe\xed'
+JCEKS_MAGIC = b'\xce\xce\xce\xce'
+
+
+class UnsupportedKeystoreError(Exception):
+    """密钥库格式不支持进程内签名"""
+    pass
+
+
+class OperationCancelled(Exception):
+    """操作被取消"""
+    pass
+
+
+def _length_prefixed(data):
+    """uint32长度前缀"""
+    return struct.pack('<I', len(data)) + data
+
+
+def _length_prefixed_sequence(items):
+    """每个元素都带长度前缀的序列，整个序列再带长度前缀"""
+    return _length_prefixed(b''.join(_length_prefixed(item) for item in items))
+
+
+def find_signing_block(buf, eocd):
+    """
+    查找中央目录前的APK签名块
+    :return: (签名块偏移, [(ID, 值bytes)])，没有签名块时返回(None, [])
+    """
+    cd_offset = eocd.cd_offset
+    if cd_offset < APK_SIG_BLOCK_MIN_SIZE or buf[cd_offset - 16:cd_offset] != APK_SIG_BLOCK_MAGIC:
+        return None, []
+    block_size, = struct.unpack_from('<Q', buf, cd_offset - APK_SIG_BLOCK_FOOTER_SIZE)
+    block_offset = cd_offset - block_size - 8
+    if block_size < APK_SIG_BLOCK_FOOTER_SIZE or block_offset < 0:
+        raise ApkFormatError(f"APK签名块大小错误: {block_size}")
+    if struct.unpack_from('<Q', buf, block_offset)[0] != block_size:
+        raise ApkFormatError("APK签名块首尾记录的大小不一致")
+
+    pairs = []
+    pos = block_offset + 8
+    end = cd_offset - APK_SIG_BLOCK_FOOTER_SIZE
+    while pos < end:
+        pair_length, = struct.unpack_from('<Q', buf, pos)
+        if pair_length < 4 or pos + 8 + pair_length > end:
+            raise ApkFormatError(f"APK签名块条目长度错误，偏移: {pos}")
+        pair_id, = struct.unpack_from('<I', buf, pos + 8)
+        pairs.append((pair_id, bytes(buf[pos + 12:pos + 8 + pair_length])))
+        pos += 8 + pair_length
+    return block_offset, pairs
+
+
+def build_signing_block(pairs):
+    """
+    生成APK签名块
+    :param pairs: [(ID, 值bytes)]
+    """
+    body = b''.join(struct.pack('<QI', len(value) + 4, pair_id) + value for pair_id, value in pairs)
+    block_size = len(body) + APK_SIG_BLOCK_FOOTER_SIZE
+    return struct.pack('<Q', block_size) + body + struct.pack('<Q', block_size) + APK_SIG_BLOCK_MAGIC
+
+
+def patched_eocd(buf, eocd, cd_offset):
+    """复制EOCD（包括注释）并替换其中的中央目录偏移"""
+    record = bytearray(buf[eocd.offset:eocd.offset + EOCD_SIZE + eocd.comment_length])
+    struct.pack_into('<I', record, 16, cd_offset)
+    return bytes(record)
+
+
+def _chunk_digest(data):
+    """单个块的摘要：SHA-256(0xa5 || 长度 || 数据)"""
+    digest = hashlib.sha256(b'\xa5' + struct.pack('<I', len(data)))
+    digest.update(data)
+    return digest.digest()
+
+
+def _digest_chunks(view, start, end):
+    """计算[start, end)内各块的摘要（hashlib在处理大块数据时会释放GIL）"""
+    return [_chunk_digest(view[pos:min(pos + CHUNK_SIZE, end)]) for pos in range(start, end, CHUNK_SIZE)]
+
+
+def compute_chunk_digests(sections, executor=None, cancel_event=None, known=None):
+    """
+    按1MB分块计算各部分的摘要
+    :param sections: 依次为条目区、中央目录、EOCD的bytes或memoryview
+    :param executor: 可选的线程池，用于并行计算
+    :param known: 可选的 {块序号: 摘要}，条目区中这些块的摘要已知（见apk_digest_cache），不再重新计算
+    :return: 所有块摘要的列表，顺序与签名方案规定的相同
+    """
+    known = known or {}
+    digests = []
+    # (在digests中的位置, view, 起始偏移, 结束偏移)，连续的待计算块合并为一个任务
+    tasks = []
+    for section_index, section in enumerate(sections):
+        view = memoryview(section)
+        for start in range(0, len(view), CHUNK_SIZE):
+            digest = known.get(start // CHUNK_SIZE) if section_index == 0 else None
+            if digest is None:
+                end = min(start + CHUNK_SIZE, len(view))
+                last = tasks[-1] if tasks else None
+                if (last is not None and last[1] is view and last[3] == start
+                        and last[3] - last[2] < CHUNK_SIZE * CHUNKS_PER_TASK):
+                    tasks[-1] = (last[0], view, last[2], end)
+                else:
+                    tasks.append((len(digests), view, start, end))
+            digests.append(digest)
+
+    futures = []
+    try:
+        if executor is None:
+            for slot, view, start, end in tasks:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise OperationCancelled()
+                results = _digest_chunks(view, start, end)
+                digests[slot:slot + len(results)] = results
+            return digests
+        futures = [(task[0], executor.submit(_digest_chunks, *task[1:])) for task in tasks]
+        for slot, future in futures:
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            results = future.result()
+            digests[slot:slot + len(results)] = results
+        return digests
+    finally:
+        for _, future in futures:
+            future.cancel()
+        # 异常的traceback会保留这里的局部变量，先释放对mmap的引用
+        sections = tasks = view = section = last = None
+
+
+def top_level_digest(chunk_digests):
+    """由块摘要计算整个APK的摘要：SHA-256(0x5a || 块数 || 块摘要...)"""
+    digest = hashlib.sha256(b'\x5a' + struct.pack('<I', len(chunk_digests)))
+    for chunk_digest in chunk_digests:
+        digest.update(chunk_digest)
+    return digest.digest()
+
+
+class V2Signer:
+    def __init__(self, private_key, certificates):
+        """
+        v2签名者
+        :param private_key: cryptography私钥对象
+        :param certificates: 证书链（cryptography证书对象），第一个为签名证书
+        """
+        self.private_key = private_key
+        self.certificates = certificates
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm = SIGNATURE_RSA_PKCS1_V1_5_WITH_SHA256
+        elif isinstance(private_key, ec.EllipticCurvePrivateKey):
+            self.algorithm = SIGNATURE_ECDSA_WITH_SHA256
+        elif isinstance(private_key, dsa.DSAPrivateKey):
+            self.algorithm = SIGNATURE_DSA_WITH_SHA256
+        else:
+            raise UnsupportedKeystoreError(f"不支持的密钥类型: {type(private_key).__name__}")
+
+    def _sign(self, data):
+        """用私钥签名"""
+        if self.algorithm == SIGNATURE_RSA_PKCS1_V1_5_WITH_SHA256:
+            return self.private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        if self.algorithm == SIGNATURE_ECDSA_WITH_SHA256:
+            return self.private_key.sign(data, ec.ECDSA(hashes.SHA256()))
+        return self.private_key.sign(data, hashes.SHA256())
+
+    def build_v2_block(self, content_digest):
+        """
+        生成v2签名方案块的值
+        :param content_digest: top_level_digest的结果
+        """
+        digests = _length_prefixed_sequence([struct.pack('<I', self.algorithm) + _length_prefixed(content_digest)])
+        certificates = _length_prefixed_sequence(
+            [cert.public_bytes(serialization.Encoding.DER) for cert in self.certificates])
+        # 没有附加属性
+        signed_data = digests + certificates + _length_prefixed(b'')
+        signatures = _length_prefixed_sequence([struct.pack('<I', self.algorithm) + _length_prefixed(self._sign(signed_data))])
+        public_key = self.certificates[0].public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+        signer = _length_prefixed(signed_data) + signatures + _length_prefixed(public_key)
+        return _length_prefixed_sequence([signer])
+
+
+def load_signer(keystore_path, storepass, keypass, key_alias):
+    """
+    从PKCS12密钥库加载签名者
+    :raises UnsupportedKeystoreError: 没有cryptography、密钥库不是PKCS12格式，或无法确认别名对应的条目，应改用apksigner
+    :raises ValueError: 密钥库密码或密钥密码错误，或密钥库中没有私钥
+    """
+    if pkcs12 is None:
+        raise UnsupportedKeystoreError("未安装cryptography")
+    with open(keystore_path, 'rb') as f:
+        data = f.read()
+    if data[:4] in (JKS_MAGIC, JCEKS_MAGIC):
+        raise UnsupportedKeystoreError("JKS/JCEKS密钥库")
+
+    try:
+        loaded = pkcs12.load_pkcs12(data, (storepass or '').encode('utf-8'))
+    except ValueError:
+        raise ValueError("无法打开密钥库，密钥库密码错误或不是PKCS12格式")
+    # PKCS12中的私钥用密钥库密码加密，另外填写的密钥密码必须能解开同一个私钥（apksigner同样会拒绝错误的密钥密码）
+    if keypass and keypass != storepass:
+        try:
+            pkcs12.load_pkcs12(data, keypass.encode('utf-8'))
+        except ValueError:
+            raise ValueError("密钥密码错误")
+    if loaded.key is None or loaded.cert is None:
+        raise ValueError("密钥库中没有私钥或证书")
+    # keytool把别名保存为证书的friendlyName。cryptography只返回第一个私钥，
+    # 无法确认别名对应的条目时（没有别名、多个条目或别名不同）交给apksigner按别名选择
+    friendly_name = loaded.cert.friendly_name
+    if friendly_name is None:
+        raise UnsupportedKeystoreError("密钥库条目没有别名")
+    if any(cert.friendly_name is not None for cert in loaded.additional_certs):
+        raise UnsupportedKeystoreError("密钥库中有多个条目")
+    if key_alias and friendly_name.decode('utf-8', 'replace').lower() != key_alias.lower():
+        raise UnsupportedKeystoreError(f"密钥库中的别名与 {key_alias} 不同")
+    # 没有friendlyName的证书是证书链
+    certificates = [loaded.cert.certificate] + [cert.certificate for cert in loaded.additional_certs]
+    return V2Signer(loaded.key, certificates)
+
+
+def block_signing_unsupported_reason(reader):
+    """
+    检查APK能否只用v2签名（只替换签名块）
+    :param reader: ApkZipReader
+    :return: 不能时返回原因，可以时返回None
+    """
+    if pkcs12 is None:
+        return "未安装cryptography"
+    if reader.eocd.zip64:
+        return "不支持ZIP64格式"
+    manifest = reader.find_entry('AndroidManifest.xml')
+    if manifest is None:
+        return "缺少AndroidManifest.xml"
+    try:
+        min_sdk = parse_manifest(read_entry(reader.buf, manifest)).get('minSdkVersion')
+    except (ApkFormatError, ValueError) as e:
+        return f"无法解析AndroidManifest.xml: {str(e)}"
+    if not isinstance(min_sdk, int) or min_sdk < V2_ONLY_MIN_SDK:
+        return f"minSdkVersion为{min_sdk}，需要v1签名"
+    return None
+
+
+def is_v1_signature_file(name):
+    """是否为v1签名文件（META-INF/下的.SF和签名块文件），只用v2签名时应去掉"""
+    name = name.upper()
+    return name.startswith('META-INF/') and name.endswith(('.SF', '.RSA', '.DSA', '.EC'))
+
+
+def copy_range(fsrc, fdst, length, cancel_event=None):
+    """
+    从fsrc当前位置复制length字节到fdst当前位置
+    优先使用os.copy_file_range，由内核直接复制（支持的文件系统上为reflink），不可用时按块读写
+    """
+    remaining = length
+    src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    while remaining > 0 and copy_file_range is not None:
+        if cancel_event is not None and cancel_event.is_set():
+            raise OperationCancelled()
+        try:
+            copied = copy_file_range(src_fd, dst_fd, min(remaining, COPY_RANGE_SIZE))
+        except OSError:
+            # 跨文件系统（旧内核）或文件系统不支持
+            copied = 0
+        if copied <= 0:
+            break
+        remaining -= copied
+    if remaining == 0:
+        return
+    # copy_file_range直接修改了文件描述符的偏移，与文件对象的缓冲位置同步
+    fsrc.seek(os.lseek(src_fd, 0, os.SEEK_CUR))
+    fdst.seek(os.lseek(dst_fd, 0, os.SEEK_CUR))
+    while remaining > 0:
+        if cancel_event is not None and cancel_event.is_set():
+            raise OperationCancelled()
+        chunk = fsrc.read(min(remaining, CHUNK_SIZE))
+        if not chunk:
+            raise ApkFormatError("复制条目区时文件意外结束")
+        fdst.write(chunk)
+        remaining -= len(chunk)
+
+
+def feed_hasher(hasher, data, cancel_event=None):
+    """
+    分段把数据交给hasher（如apk_checksum.MultiHasher），便于在大文件计算过程中响应取消
+    :param data: bytes、memoryview或mmap
+    """
+    view = memoryview(data)
+    try:
+        for pos in range(0, len(view), COPY_RANGE_SIZE // 8):
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            hasher.update(view[pos:pos + COPY_RANGE_SIZE // 8])
+    finally:
+        view.release()
+    return hasher
+
+
+def write_signed_apk(src_path, dst_path, entries_end, signing_block, central_directory, eocd_record,
+                     cancel_event=None):
+    """
+    拼出签名后的APK：条目区[0, entries_end)原样复制，随后写入签名块、中央目录和EOCD
+    :param eocd_record: 已替换中央目录偏移的EOCD
+    """
+    with open(src_path, 'rb') as fsrc, open(dst_path, 'wb') as fdst:
+        copy_range(fsrc, fdst, entries_end, cancel_event)
+        fdst.seek(entries_end)
+        fdst.write(signing_block)
+        fdst.write(central_directory)
+        fdst.write(eocd_record)
+        return fdst.tell()
+
+
+def sign_apk_v2(src_path, dst_path, signer, cancel_event=None, max_workers=None, digest_cache=None, hasher=None):
+    """
+    用v2签名方案签名APK，保留签名块中与签名无关的条目
+    :param signer: V2Signer
+    :param max_workers: 计算摘要的线程数，默认CPU核数
+    :param digest_cache: 可选的ChunkDigestCache，沿用上次签名同一路径APK时未变化的块摘要
+    :param hasher: 可选的apk_checksum.MultiHasher，计算整个输出文件的校验和；条目区与输入相同，
+                   在计算块摘要的同时从已映射的输入中计算，不再读取输出
+    :return: 统计信息字典
+    """
+    with ApkZipReader(src_path) as reader:
+        buf, eocd = reader.buf, reader.eocd
+        block_offset, pairs = find_signing_block(buf, eocd)
+        entries_end = eocd.cd_offset if block_offset is None else block_offset
+        view = memoryview(buf)
+        try:
+            central_directory = view[eocd.cd_offset:eocd.cd_offset + eocd.cd_size]
+            # 计算摘要时EOCD中的中央目录偏移视为签名块的偏移
+            sections = (view[:entries_end], central_directory, patched_eocd(buf, eocd, entries_end))
+            known, pending = digest_cache.lookup(src_path, reader, entries_end) if digest_cache else ({}, None)
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as executor:
+                hashing = executor.submit(feed_hasher, hasher, sections[0], cancel_event) if hasher else None
+                try:
+                    chunk_digests = compute_chunk_digests(sections, executor, cancel_event, known)
+                finally:
+                    if hashing is not None:
+                        hashing.result()
+            kept_pairs = [(pair_id, value) for pair_id, value in pairs if pair_id not in SIGNATURE_BLOCK_IDS]
+            signing_block = build_signing_block(
+                [(APK_SIGNATURE_SCHEME_V2_BLOCK_ID, signer.build_v2_block(top_level_digest(chunk_digests)))]
+                + kept_pairs)
+            eocd_record = patched_eocd(buf, eocd, entries_end + len(signing_block))
+            size = write_signed_apk(src_path, dst_path, entries_end, signing_block, central_directory,
+                                    eocd_record, cancel_event)
+            if hasher:
+                for data in (signing_block, central_directory, eocd_record):
+                    hasher.update(data)
+        finally:
+            # 释放对mmap的引用，否则无法关闭
+            central_directory = sections = None
+            view.release()
+    if digest_cache:
+        digest_cache.store(src_path, entries_end, chunk_digests, pending)
+    return {
+        'size': size,
+        'entries_bytes': entries_end,
+        'signing_block_bytes': len(signing_block),
+        'chunks': len(chunk_digests),
+        'chunks_reused': len(known),
+        'bytes_hashed': size - len(signing_block) - sum(min(CHUNK_SIZE, entries_end - k * CHUNK_SIZE) for k in known),
+        'kept_blocks': len(kept_pairs),
+    }
@@ -0,0 +1,371 @@
+"""
+APK(ZIP)结构读取模块
+通过mmap直接读取中央目录和单个条目，不解压整个APK
+"""
+
+import os
+import mmap
+import struct
+import zlib
+from collections import namedtuple
+
+
+# ZIP结构签名
+LOCAL_HEADER_SIG = 0x04034b50
+CENTRAL_DIR_SIG = 0x02014b50
+EOCD_SIG = b'PK\x05\x06'
+ZIP64_EOCD_SIG = 0x06064b50
+ZIP64_EOCD_LOCATOR_SIG = 0x07064b50
+
+# 结构长度
+EOCD_SIZE = 22
+LOCAL_HEADER_SIZE = 30
+CENTRAL_DIR_HEADER_SIZE = 46
+ZIP64_EOCD_LOCATOR_SIZE = 20
+ZIP64_EOCD_SIZE = 56
+# EOCD注释最长65535字节
+MAX_EOCD_SEARCH = EOCD_SIZE + 0xFFFF
+
+# 压缩方式
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# 通用标志位：第3位表示使用数据描述符，第11位表示文件名为UTF-8
+FLAG_DATA_DESCRIPTOR = 0x0008
+FLAG_UTF8 = 0x0800
+
+# zipalign使用的对齐扩展字段ID
+ALIGNMENT_EXTRA_ID = 0xD935
+ALIGNMENT_EXTRA_HEADER_SIZE = 6
+
+# 未压缩条目的默认对齐（zipalign -p 4）
+DEFAULT_ALIGNMENT = 4
+
+# 非ZIP64结构能表示的最大值，字段为该值时实际值在ZIP64结构中
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP16_LIMIT = 0xFFFF
+
+# ZIP64扩展字段ID
+ZIP64_EXTRA_ID = 0x0001
+
+# 中央目录条目头，解析时只按需读取
+CENTRAL_DIR_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+
+ZipEntry = namedtuple('ZipEntry', [
+    'name', 'compress_type', 'crc', 'compressed_size', 'file_size', 'header_offset', 'flags',
+    'raw_name', 'mod_time', 'mod_date', 'create_version', 'internal_attr', 'external_attr'
+])
+
+# zip64为True时entry_count/cd_size/cd_offset取自ZIP64结束记录
+EndOfCentralDirectory = namedtuple('EndOfCentralDirectory', [
+    'offset', 'entry_count', 'cd_size', 'cd_offset', 'comment_length', 'zip64'
+], defaults=(False,))
+
+
+class ApkFormatError(Exception):
+    """APK(ZIP)结构错误"""
+    pass
+
+
+def find_eocd(buf):
+    """
+    查找中央目录结束记录(EOCD)
+    :param buf: 整个文件的mmap或bytes
+    :return: EndOfCentralDirectory
+    """
+    size = len(buf)
+    start = max(0, size - MAX_EOCD_SEARCH)
+    offset = buf.rfind(EOCD_SIG, start)
+    while offset >= 0:
+        # 注释长度必须与文件末尾吻合，避免把注释里的签名当成EOCD
+        comment_length = struct.unpack_from('<H', buf, offset + 20)[0]
+        if offset + EOCD_SIZE + comment_length == size:
+            entry_count, cd_size, cd_offset = struct.unpack_from('<HII', buf, offset + 10)
+            eocd = EndOfCentralDirectory(offset, entry_count, cd_size, cd_offset, comment_length)
+            if entry_count == ZIP16_LIMIT or ZIP32_LIMIT in (cd_size, cd_offset):
+                return _find_zip64_eocd(buf, eocd)
+            return eocd
+        offset = buf.rfind(EOCD_SIG, start, offset)
+    raise ApkFormatError("未找到ZIP中央目录结束记录，文件可能不是有效的APK")
+
+
+def _find_zip64_eocd(buf, eocd):
+    """
+    EOCD中有字段溢出时通过紧挨在前面的ZIP64定位记录读取ZIP64结束记录
+    没有定位记录时按普通EOCD处理（例如恰好有65535个条目）
+    """
+    locator = eocd.offset - ZIP64_EOCD_LOCATOR_SIZE
+    if locator < 0 or struct.unpack_from('<I', buf, locator)[0] != ZIP64_EOCD_LOCATOR_SIG:
+        return eocd
+    record_offset, = struct.unpack_from('<Q', buf, locator + 8)
+    if record_offset + ZIP64_EOCD_SIZE > locator or struct.unpack_from('<I', buf, record_offset)[0] != ZIP64_EOCD_SIG:
+        raise ApkFormatError("ZIP64结束记录位置错误")
+    entry_count, cd_size, cd_offset = struct.unpack_from('<QQQ', buf, record_offset + 32)
+    return EndOfCentralDirectory(eocd.offset, entry_count, cd_size, cd_offset, eocd.comment_length, True)
+
+
+def zip64_extra_values(buf, extra_start, extra_length, file_size, compressed_size, header_offset):
+    """
+    从扩展字段中读取ZIP64的实际值：只有在中央目录中为0xFFFFFFFF的字段才会出现在ZIP64扩展字段中，
+    顺序依次为原始大小、压缩后大小、本地文件头偏移
+    :return: (file_size, compressed_size, header_offset)
+    """
+    pos = extra_start
+    end = extra_start + extra_length
+    while pos + 4 <= end:
+        extra_id, length = struct.unpack_from('<HH', buf, pos)
+        if extra_id == ZIP64_EXTRA_ID:
+            field = pos + 4
+            values = []
+            for value in (file_size, compressed_size, header_offset):
+                if value == ZIP32_LIMIT:
+                    if field + 8 > pos + 4 + length:
+                        raise ApkFormatError("ZIP64扩展字段长度不足")
+                    value, = struct.unpack_from('<Q', buf, field)
+                    field += 8
+                values.append(value)
+            return tuple(values)
+        pos += 4 + length
+    return file_size, compressed_size, header_offset
+
+
+def parse_central_directory_entry(buf, pos):
+    """
+    解析位于pos的中央目录条目
+    :return: (ZipEntry, 下一个条目的偏移)
+    """
+    (sig, create_version, _, flags, compress_type, mod_time, mod_date, crc, compressed_size, file_size,
+     name_length, extra_length, comment_length, _, internal_attr, external_attr, header_offset) = \
+        CENTRAL_DIR_HEADER.unpack_from(buf, pos)
+    if sig != CENTRAL_DIR_SIG:
+        raise ApkFormatError(f"中央目录条目签名错误，偏移: {pos}")
+    name_start = pos + CENTRAL_DIR_HEADER_SIZE
+    raw_name = bytes(buf[name_start:name_start + name_length])
+    # 第11位表示文件名为UTF-8编码
+    name = raw_name.decode('utf-8' if flags & FLAG_UTF8 else 'cp437', 'replace')
+    if ZIP32_LIMIT in (compressed_size, file_size, header_offset):
+        file_size, compressed_size, header_offset = zip64_extra_values(
+            buf, name_start + name_length, extra_length, file_size, compressed_size, header_offset)
+    entry = ZipEntry(name, compress_type, crc, compressed_size, file_size, header_offset, flags,
+                     raw_name, mod_time, mod_date, create_version, internal_attr, external_attr)
+    return entry, name_start + name_length + extra_length + comment_length
+
+
+def iter_central_directory(buf, eocd=None):
+    """
+    遍历中央目录中的条目
+    :param buf: 整个文件的mmap或bytes
+    :param eocd: 已读取的EOCD，为None时自动查找
+    """
+    if eocd is None:
+        eocd = find_eocd(buf)
+    pos = eocd.cd_offset
+    end = eocd.cd_offset + eocd.cd_size
+    while pos < end:
+        entry, pos = parse_central_directory_entry(buf, pos)
+        yield entry
+
+
+def find_entry(buf, name, eocd=None):
+    """
+    在中央目录中查找指定条目，找不到时返回None
+    只比较文件名字节，命中后才解析完整条目，大量条目时不会为每个条目创建对象
+    """
+    if eocd is None:
+        eocd = find_eocd(buf)
+    candidates = {name.encode('utf-8'), name.encode('cp437', 'replace')}
+    lengths = {len(candidate) for candidate in candidates}
+    pos = eocd.cd_offset
+    end = eocd.cd_offset + eocd.cd_size
+    while pos < end:
+        if struct.unpack_from('<I', buf, pos)[0] != CENTRAL_DIR_SIG:
+            raise ApkFormatError(f"中央目录条目签名错误，偏移: {pos}")
+        name_length, extra_length, comment_length = struct.unpack_from('<HHH', buf, pos + 28)
+        name_start = pos + CENTRAL_DIR_HEADER_SIZE
+        if name_length in lengths and buf[name_start:name_start + name_length] in candidates:
+            entry = parse_central_directory_entry(buf, pos)[0]
+            if entry.name == name:
+                return entry
+        pos = name_start + name_length + extra_length + comment_length
+    return None
+
+
+def entry_data_offset(buf, entry):
+    """获取条目数据在文件中的起始偏移（跳过本地文件头）"""
+    sig, = struct.unpack_from('<I', buf, entry.header_offset)
+    if sig != LOCAL_HEADER_SIG:
+        raise ApkFormatError(f"本地文件头签名错误: {entry.name}")
+    name_length, extra_length = struct.unpack_from('<HH', buf, entry.header_offset + 26)
+    return entry.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def read_entry(buf, entry):
+    """读取并解压单个条目的数据"""
+    start = entry_data_offset(buf, entry)
+    data = buf[start:start + entry.compressed_size]
+    if entry.compress_type == ZIP_STORED:
+        return bytes(data)
+    if entry.compress_type == ZIP_DEFLATED:
+        return zlib.decompress(data, -15, entry.file_size or zlib.DEF_BUF_SIZE)
+    raise ApkFormatError(f"不支持的压缩方式 {entry.compress_type}: {entry.name}")
+
+
+class ApkZipReader:
+    def __init__(self, apk_path):
+        """
+        以mmap方式打开APK，只读取实际访问的部分
+        :param apk_path: APK路径
+        """
+        self.apk_path = apk_path
+        self._index = None
+        self._file = open(apk_path, 'rb')
+        try:
+            self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法mmap
+            self._file.close()
+            raise ApkFormatError("APK文件为空")
+        try:
+            self.eocd = find_eocd(self.buf)
+        except ApkFormatError:
+            self.close()
+            raise
+
+    def entries(self):
+        """遍历所有条目"""
+        return iter_central_directory(self.buf, self.eocd)
+
+    def find_entry(self, name):
+        """查找条目，已建立索引时通过索引查找"""
+        if self._index is not None:
+            return self._index.find_entry(name)
+        return find_entry(self.buf, name, self.eocd)
+
+    def index(self):
+        """获取中央目录索引（首次调用时建立），适合需要多次查找或遍历大量条目的场合"""
+        if self._index is None:
+            from apk_zip_index import CentralDirectoryIndex
+            self._index = CentralDirectoryIndex(self.buf, self.eocd)
+        return self._index
+
+    def comment(self):
+        """EOCD中的ZIP注释"""
+        start = self.eocd.offset + EOCD_SIZE
+        return bytes(self.buf[start:start + self.eocd.comment_length])
+
+    def stat(self):
+        """已打开文件的os.stat_result（与mmap的内容对应，即使路径随后被替换）"""
+        return os.fstat(self._file.fileno())
+
+    def read(self, name):
+        """读取条目内容，条目不存在时抛出KeyError"""
+        entry = self.find_entry(name)
+        if entry is None:
+            raise KeyError(name)
+        return read_entry(self.buf, entry)
+
+    def close(self):
+        """关闭文件"""
+        self._index = None
+        self.buf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def alignment_extra(offset, name_length, alignment):
+    """
+    生成使条目数据按alignment对齐的扩展字段（与zipalign相同的0xD935格式）
+    :param offset: 本地文件头在输出文件中的偏移
+    :param name_length: 文件名长度
+    :param alignment: 对齐字节数
+    """
+    data_start = offset + LOCAL_HEADER_SIZE + name_length + ALIGNMENT_EXTRA_HEADER_SIZE
+    padding = (alignment - data_start % alignment) % alignment
+    return struct.pack('<HHH', ALIGNMENT_EXTRA_ID, 2 + padding, alignment) + b'\0' * padding
+
+
+class ApkZipWriter:
+    def __init__(self, stream):
+        """
+        顺序写出APK(ZIP)，由调用方提供已压缩的数据，便于控制对齐和并行压缩
+        :param stream: 可写的二进制文件对象，从偏移0开始写；只用add_entry规划布局时可以为None
+        """
+        self.stream = stream
+        self.offset = 0
+        self._central_directory = []
+
+    def add_entry(self, entry, compress_type, compressed_size, alignment=None):
+        """
+        登记一个条目并返回其本地文件头（包括文件名和对齐扩展字段），头和数据由调用方写出
+        :param entry: 原始条目(ZipEntry)，提供文件名、CRC、时间和属性
+        :param compress_type: 输出的压缩方式
+        :param compressed_size: 输出的(已压缩)数据长度
+        :param alignment: 数据起始偏移的对齐字节数，None表示不对齐
+        """
+        file_size = entry.file_size
+        if compress_type == ZIP_STORED:
+            file_size = compressed_size
+        if self.offset >= ZIP32_LIMIT or compressed_size >= ZIP32_LIMIT or file_size >= ZIP32_LIMIT:
+            raise ApkFormatError(f"输出超过4GB，不支持写出ZIP64: {entry.name}")
+        raw_name = entry.raw_name
+        extra = alignment_extra(self.offset, len(raw_name), alignment) if alignment else b''
+        # 数据大小已写在本地文件头中，不再使用数据描述符
+        flags = entry.flags & ~FLAG_DATA_DESCRIPTOR
+        header = struct.pack('<IHHHHHIIIHH', LOCAL_HEADER_SIG, 20, flags, compress_type,
+                             entry.mod_time, entry.mod_date, entry.crc, compressed_size, file_size,
+                             len(raw_name), len(extra)) + raw_name + extra
+        self._central_directory.append(struct.pack(
+            '<IHHHHHHIIIHHHHHII', CENTRAL_DIR_SIG, entry.create_version, 20, flags, compress_type,
+            entry.mod_time, entry.mod_date, entry.crc, compressed_size, file_size,
+            len(raw_name), 0, 0, 0, entry.internal_attr, entry.external_attr, self.offset) + raw_name)
+        self.offset += len(header) + compressed_size
+        return header
+
+    def write_entry(self, entry, compress_type, data, compressed_size=None, alignment=None):
+        """
+        写出一个条目
+        :param entry: 原始条目(ZipEntry)，提供文件名、CRC、时间和属性
+        :param compress_type: 输出的压缩方式
+        :param data: 输出的(已压缩)数据，bytes或memoryview
+        :param compressed_size: 数据长度，默认len(data)
+        :param alignment: 数据起始偏移的对齐字节数，None表示不对齐
+        """
+        if compressed_size is None:
+            compressed_size = len(data)
+        header_offset = self.offset
+        self.stream.write(self.add_entry(entry, compress_type, compressed_size, alignment))
+        self.stream.write(data)
+        return header_offset
+
+    def central_directory(self):
+        """已登记条目的中央目录"""
+        if len(self._central_directory) > 0xFFFF:
+            raise ApkFormatError("条目数超出范围，不支持写出ZIP64")
+        return b''.join(self._central_directory)
+
+    def eocd_record(self, cd_offset, cd_size, comment=b''):
+        """
+        EOCD记录
+        :param comment: ZIP注释，通常由ApkZipReader.comment()取得原APK的注释
+        """
+        if cd_offset >= ZIP32_LIMIT:
+            raise ApkFormatError("中央目录偏移超出范围，不支持写出ZIP64")
+        if len(comment) > 0xFFFF:
+            raise ApkFormatError("ZIP注释过长")
+        count = len(self._central_directory)
+        return struct.pack('<4s4H2LH', EOCD_SIG, 0, 0, count, count, cd_size, cd_offset, len(comment)) + comment
+
+    def close(self, comment=b''):
+        """写出中央目录和EOCD，返回文件总长度"""
+        cd_offset = self.offset
+        central_directory = self.central_directory()
+        eocd_record = self.eocd_record(cd_offset, len(central_directory), comment)
+        self.stream.write(central_directory)
+        self.stream.write(eocd_record)
+        self.offset += len(central_directory) + len(eocd_record)
+        return self.offset
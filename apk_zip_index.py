@@ -0,0 +1,167 @@
+"""
+APK(ZIP)中央目录索引模块
+大型APK（内嵌资源包的游戏，超过4GB、数万个条目）的中央目录不逐条创建Python对象，
+而是把每个条目的偏移、大小和文件名哈希存放在紧凑的array中，条目本身仍从mmap中按需读取
+"""
+
+import zlib
+import struct
+from array import array
+
+from apk_zip import (ApkFormatError, find_eocd, parse_central_directory_entry, zip64_extra_values,
+                     CENTRAL_DIR_SIG, CENTRAL_DIR_HEADER_SIZE, LOCAL_HEADER_SIG, LOCAL_HEADER_SIZE,
+                     FLAG_UTF8, ZIP32_LIMIT)
+
+
+# 中央目录条目中建立索引需要的字段：签名、压缩后大小、原始大小、文件名/扩展字段/注释长度、本地文件头偏移
+_INDEX_FIELDS = struct.Struct('<I16xIIHHH8xI')
+
+# 查找表为开放寻址（线性探测）的哈希表，每一项为 (文件名哈希 << 32) | (条目序号 + 1)，0表示空位
+_INDEX_BITS = 32
+_INDEX_MASK = (1 << _INDEX_BITS) - 1
+# 查找表的最大装载率为3/4
+_LOOKUP_LOAD_NUM = 4
+_LOOKUP_LOAD_DEN = 3
+
+
+def _name_hash(raw_name):
+    """文件名哈希，冲突时再比较文件名本身"""
+    return zlib.crc32(raw_name)
+
+
+class CentralDirectoryIndex:
+    def __init__(self, buf, eocd=None):
+        """
+        遍历一次中央目录建立索引，支持ZIP64
+        每个条目只占用约43～54字节：中央目录条目偏移、本地文件头偏移、两个大小各8字节，
+        查找表的容量是不小于条目数4/3的2的幂，每个条目约11～22字节（例如10万个条目时约21字节）
+        :param buf: 整个文件的mmap或bytes
+        :param eocd: 已读取的EOCD，为None时自动查找
+        """
+        self.buf = buf
+        self.eocd = eocd if eocd is not None else find_eocd(buf)
+        if self.eocd.entry_count >= _INDEX_MASK:
+            raise ApkFormatError(f"条目数过多: {self.eocd.entry_count}")
+
+        self.record_offsets = array('Q')
+        self.header_offsets = array('Q')
+        self.compressed_sizes = array('Q')
+        self.file_sizes = array('Q')
+        # 建索引期间暂存的文件名哈希，每个条目4字节
+        hashes = array('I')
+
+        unpack_from = _INDEX_FIELDS.unpack_from
+        pos = self.eocd.cd_offset
+        end = self.eocd.cd_offset + self.eocd.cd_size
+        while pos < end:
+            (sig, compressed_size, file_size, name_length, extra_length, comment_length,
+             header_offset) = unpack_from(buf, pos)
+            if sig != CENTRAL_DIR_SIG:
+                raise ApkFormatError(f"中央目录条目签名错误，偏移: {pos}")
+            name_start = pos + CENTRAL_DIR_HEADER_SIZE
+            if ZIP32_LIMIT in (compressed_size, file_size, header_offset):
+                file_size, compressed_size, header_offset = zip64_extra_values(
+                    buf, name_start + name_length, extra_length, file_size, compressed_size, header_offset)
+            hashes.append(_name_hash(buf[name_start:name_start + name_length]))
+            self.record_offsets.append(pos)
+            self.header_offsets.append(header_offset)
+            self.compressed_sizes.append(compressed_size)
+            self.file_sizes.append(file_size)
+            pos = name_start + name_length + extra_length + comment_length
+
+        # 不对查找表排序：sorted()会为每个条目创建一个int对象并生成同样长度的list，
+        # 数万个条目时峰值内存是紧凑array的数倍，直接在array中建开放寻址哈希表
+        capacity = 16
+        while capacity * _LOOKUP_LOAD_DEN < len(hashes) * _LOOKUP_LOAD_NUM:
+            capacity <<= 1
+        self._lookup_mask = capacity - 1
+        self._lookup = array('Q', [0]) * capacity
+        for i, name_hash in enumerate(hashes):
+            slot = name_hash & self._lookup_mask
+            while self._lookup[slot]:
+                slot = (slot + 1) & self._lookup_mask
+            self._lookup[slot] = name_hash << _INDEX_BITS | (i + 1)
+
+    def __len__(self):
+        return len(self.record_offsets)
+
+    def __iter__(self):
+        """按中央目录顺序遍历条目"""
+        for i in range(len(self)):
+            yield self.entry(i)
+
+    @property
+    def zip64(self):
+        """是否为ZIP64格式"""
+        return self.eocd.zip64
+
+    def memory_usage(self):
+        """索引本身占用的字节数（不含mmap）"""
+        arrays = (self.record_offsets, self.header_offsets, self.compressed_sizes, self.file_sizes, self._lookup)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def total_file_size(self):
+        """所有条目解压后的总大小"""
+        return sum(self.file_sizes)
+
+    def raw_name(self, i):
+        """第i个条目的原始文件名字节"""
+        pos = self.record_offsets[i]
+        name_length, = struct.unpack_from('<H', self.buf, pos + 28)
+        return bytes(self.buf[pos + CENTRAL_DIR_HEADER_SIZE:pos + CENTRAL_DIR_HEADER_SIZE + name_length])
+
+    def name(self, i):
+        """第i个条目的文件名"""
+        flags, = struct.unpack_from('<H', self.buf, self.record_offsets[i] + 8)
+        return self.raw_name(i).decode('utf-8' if flags & FLAG_UTF8 else 'cp437', 'replace')
+
+    def names(self):
+        """按中央目录顺序遍历文件名"""
+        for i in range(len(self)):
+            yield self.name(i)
+
+    def record(self, i):
+        """第i个条目在中央目录中的原始记录（包括文件名、扩展字段和注释）"""
+        pos = self.record_offsets[i]
+        name_length, extra_length, comment_length = struct.unpack_from('<HHH', self.buf, pos + 28)
+        return bytes(self.buf[pos:pos + CENTRAL_DIR_HEADER_SIZE + name_length + extra_length + comment_length])
+
+    def entry(self, i):
+        """读取第i个条目(ZipEntry)"""
+        return parse_central_directory_entry(self.buf, self.record_offsets[i])[0]
+
+    def find(self, name):
+        """查找条目序号，找不到时返回-1"""
+        for raw_name in dict.fromkeys((name.encode('utf-8'), name.encode('cp437', 'replace'))):
+            name_hash = _name_hash(raw_name)
+            slot = name_hash & self._lookup_mask
+            while self._lookup[slot]:
+                item = self._lookup[slot]
+                if item >> _INDEX_BITS == name_hash:
+                    i = (item & _INDEX_MASK) - 1
+                    if self.raw_name(i) == raw_name and self.name(i) == name:
+                        return i
+                slot = (slot + 1) & self._lookup_mask
+        return -1
+
+    def find_entry(self, name):
+        """查找条目(ZipEntry)，找不到时返回None"""
+        i = self.find(name)
+        return None if i < 0 else self.entry(i)
+
+    def data_offset(self, i):
+        """第i个条目数据在文件中的起始偏移（跳过本地文件头）"""
+        header_offset = self.header_offsets[i]
+        sig, = struct.unpack_from('<I', self.buf, header_offset)
+        if sig != LOCAL_HEADER_SIG:
+            raise ApkFormatError(f"本地文件头签名错误: {self.name(i)}")
+        name_length, extra_length = struct.unpack_from('<HH', self.buf, header_offset + 26)
+        return header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+    def order_by_offset(self):
+        """按本地文件头偏移排序的条目序号（即条目数据在文件中的顺序）"""
+        offsets = self.header_offsets
+        if all(offsets[i - 1] <= offsets[i] for i in range(1, len(offsets))):
+            # 常见情况：中央目录已按偏移排列，不必生成排序用的list
+            return array('Q', range(len(self)))
+        return array('Q', sorted(range(len(self)), key=offsets.__getitem__))
@@ -0,0 +1,385 @@
+"""
+异步签名API
+供基于asyncio的构建系统嵌入使用：用asyncio子进程代替每个任务一个线程，
+按完成顺序产出进度和结果事件，并支持背压和通过取消任务来终止签名
+"""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import threading
+import argparse
+import subprocess
+import itertools
+from collections import namedtuple
+
+from config_manager import ConfigManager
+from signing_processor import SigningProcessor
+from job_journal import JournalSet, signing_job_key, keystore_fingerprint, VERIFY_HASH, VERIFY_SIZE
+from apk_channel import load_channel_list
+from apk_checksum import MultiHasher
+from apk_zip import ApkFormatError
+
+
+# 默认同时运行的签名进程数
+DEFAULT_MAX_CONCURRENCY = 8
+# 事件缓冲区大小，消费者处理不过来时签名任务会等待
+DEFAULT_EVENT_BUFFER = 256
+
+# 异步签名任务，参数与SigningProcessor.perform_resign相同；
+# job_id会出现在该任务的所有事件中，为None时按读取顺序编号
+AsyncSigningJob = namedtuple('AsyncSigningJob', [
+    'apk_path', 'keystore_path', 'storepass', 'keypass', 'key_alias',
+    'output_template', 'profile_name', 'repack_options', 'job_id', 'channels'
+], defaults=(None, "", None, None, None))
+
+
+class SigningError(Exception):
+    """签名失败"""
+    pass
+
+
+async def _iterate(jobs):
+    """把同步或异步可迭代对象统一为异步迭代"""
+    if hasattr(jobs, '__aiter__'):
+        async for job in jobs:
+            yield job
+    else:
+        for job in jobs:
+            yield job
+
+
+class AsyncSigner:
+    def __init__(self, processor, max_concurrency=DEFAULT_MAX_CONCURRENCY, event_buffer=DEFAULT_EVENT_BUFFER):
+        """
+        初始化异步签名器
+        :param processor: 已完成工具检查的SigningProcessor，用于生成apksigner命令
+        :param max_concurrency: 同时运行的签名任务数
+        :param event_buffer: run()的事件缓冲区大小
+        """
+        self.processor = processor
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.event_buffer = max(1, int(event_buffer))
+
+    async def _start_process(self, cmd, shell):
+        """启动apksigner子进程"""
+        if shell:
+            # Windows下apksigner是批处理脚本，需要通过shell启动
+            return await asyncio.create_subprocess_shell(
+                subprocess.list2cmdline(cmd), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        # 放到独立的进程组中，取消时可以连同包装脚本启动的java一起结束
+        return await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True)
+
+    async def sign(self, job, progress=None):
+        """
+        签名单个APK
+        :param job: AsyncSigningJob
+        :param progress: 可选的异步回调 await progress(event)
+        :return: 输出APK路径；失败时抛出SigningError，任务被取消时终止签名进程并抛出CancelledError
+        """
+        output_apk, _, _ = await self._sign(job, progress)
+        return output_apk
+
+    async def _sign(self, job, progress):
+        """签名单个APK，返回(输出APK路径, 校验清单记录或None, 校验和不可用的原因或None)"""
+        async def report(value, status):
+            if progress is not None:
+                await progress({'type': 'progress', 'job_id': job.job_id, 'value': value, 'status': status})
+
+        await report(10, '准备重签名...')
+        started = time.perf_counter()
+        # 以下同步调用都会读取文件或启动子进程，全部放到线程中执行，不阻塞事件循环
+        try:
+            output_apk = await asyncio.to_thread(self.processor.resolve_output_path, job.apk_path,
+                                                 job.output_template, job.profile_name)
+        except Exception as e:
+            raise SigningError(f"生成输出文件名失败: {str(e)}")
+        format_error = await asyncio.to_thread(self.processor.check_apk_format, job.apk_path)
+        if format_error:
+            raise SigningError(format_error)
+
+        if self.processor.use_block_signing and self.processor.can_fuse_repack(job.repack_options):
+            # 进程内只替换签名块，在线程中执行；取消时通知线程停止
+            await report(20, '计算v2签名摘要...')
+            cancel_event = threading.Event()
+            hasher = MultiHasher() if self.processor.write_checksums else None
+            try:
+                stats, _ = await asyncio.to_thread(
+                    self.processor.block_sign, job.apk_path, output_apk, job.keystore_path, job.storepass,
+                    job.keypass or job.storepass, job.key_alias, cancel_event, job.repack_options, hasher)
+            except asyncio.CancelledError:
+                cancel_event.set()
+                raise
+            except Exception as e:
+                raise SigningError(f"签名失败: {str(e)}")
+            if stats is not None:
+                await report(90, '完成...')
+                return await self._finish(job, output_apk, report, hasher, started)
+
+        input_apk = job.apk_path
+        temp_apk = None
+        if job.repack_options is not None:
+            from apk_repack import repack_apk
+            await report(20, '重新打包APK...')
+            temp_apk = f"{output_apk}.repack.tmp"
+            try:
+                # 重新打包是CPU/IO密集的同步操作，放到默认线程池中执行
+                await asyncio.to_thread(repack_apk, job.apk_path, temp_apk, **job.repack_options)
+            except Exception as e:
+                if os.path.exists(temp_apk):
+                    os.remove(temp_apk)
+                raise SigningError(f"重新打包失败: {str(e)}")
+            input_apk = temp_apk
+
+        try:
+            # 可能运行java -version并准备CDS归档
+            cmd, shell, cds_pending = await asyncio.to_thread(
+                self.processor.build_sign_command, job.keystore_path, job.storepass, job.keypass or job.storepass,
+                job.key_alias, input_apk, output_apk)
+            await report(30, '开始签名过程...')
+            process = await self._start_process(cmd, shell)
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                # 任务被取消：终止签名进程后继续传播取消
+                if process.returncode is None:
+                    if shell:
+                        # taskkill是同步的子进程调用
+                        await asyncio.to_thread(SigningProcessor._kill_process_tree, process.pid)
+                    else:
+                        try:
+                            os.killpg(process.pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            # 进程在检查returncode之后刚好退出
+                            pass
+                    await process.wait()
+                await asyncio.to_thread(self.processor.finish_cds_archive, cds_pending, False)
+                raise
+            await asyncio.to_thread(self.processor.finish_cds_archive, cds_pending, process.returncode == 0)
+        finally:
+            if temp_apk and os.path.exists(temp_apk):
+                os.remove(temp_apk)
+
+        if process.returncode != 0:
+            raise SigningError(f"签名失败: {stderr.decode('utf-8', 'replace')}")
+        if not os.path.exists(output_apk):
+            raise SigningError("签名后的APK文件未找到，签名可能失败了")
+        await report(90, '完成...')
+        return await self._finish(job, output_apk, report, None, started)
+
+    async def _finish(self, job, output_apk, report, hasher, started):
+        """
+        签名完成后按需写入校验清单、生成渠道包
+        :param hasher: 写出输出时已计算的MultiHasher，为None时需要校验和则读取输出计算
+        :return: (输出APK路径, 校验清单记录或None, 校验和不可用的原因或None)
+        """
+        record = checksums_error = None
+        cancel_event = threading.Event()
+        try:
+            if self.processor.write_checksums:
+                if hasher is None:
+                    await report(90, '计算校验和...')
+                try:
+                    record = await asyncio.to_thread(self.processor.record_checksums, job.apk_path, output_apk,
+                                                     hasher, started, cancel_event)
+                except (OSError, ApkFormatError) as e:
+                    # 输出已经签好，只是没有校验和
+                    checksums_error = f"校验和不可用: {str(e)}"
+            if job.channels:
+                await report(90, f'生成{len(job.channels)}个渠道包...')
+                try:
+                    await asyncio.to_thread(self.processor.write_channels, job.apk_path, output_apk,
+                                            list(job.channels), started, cancel_event)
+                except Exception as e:
+                    raise SigningError(f"签名成功，但生成渠道包失败: {str(e)}")
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+        return output_apk, record, checksums_error
+
+    async def run(self, jobs, journals=None, resume=False, verify=VERIFY_HASH):
+        """
+        并发签名多个APK，按发生顺序产出事件
+        任务按需从jobs中读取（可以是同步或异步可迭代对象），不会一次性展开；
+        事件缓冲区满时签名任务会暂停等待消费者
+        :param jobs: AsyncSigningJob的可迭代对象
+        :param journals: 可选的JournalSet，在输出目录中记录任务日志
+        :param resume: 是否跳过日志中已完成且输出校验通过的任务
+        :param verify: 校验已完成输出的方式，VERIFY_SIZE或VERIFY_HASH
+        :return: 异步生成器，事件格式与progress_queue消息相同并带有job_id：
+                 progress / complete(output_path, elapsed, skipped[, checksums_error]) / error(message) / cancelled
+        """
+        events = asyncio.Queue(self.event_buffer)
+        job_iter = _iterate(jobs).__aiter__()
+        iter_lock = asyncio.Lock()
+        ids = itertools.count(1)
+        done = object()
+
+        async def worker():
+            while True:
+                async with iter_lock:
+                    try:
+                        job = await job_iter.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    if job.job_id is None:
+                        job = job._replace(job_id=next(ids))
+                start = time.monotonic()
+                journal = key = None
+                if journals is not None:
+                    # 输出与输入在同一目录，日志也放在那里
+                    # 首次打开日志时要重放（必要时压缩）整个文件，不在事件循环中进行
+                    journal = await asyncio.to_thread(journals.get, os.path.dirname(os.path.abspath(job.apk_path)))
+                    signer = await asyncio.to_thread(keystore_fingerprint, job.keystore_path, job.key_alias)
+                    key = signing_job_key(job.apk_path, signer, job.output_template, job.profile_name,
+                                          job.repack_options, job.channels)
+                    if resume:
+                        output_apk = await asyncio.to_thread(journal.verified_output, key, verify)
+                        if output_apk:
+                            await events.put({'type': 'complete', 'job_id': job.job_id, 'output_path': output_apk,
+                                              'elapsed': 0.0, 'skipped': True})
+                            continue
+                    await asyncio.to_thread(journal.record_start, key, job.apk_path)
+                try:
+                    output_apk, record, checksums_error = await self._sign(job, events.put)
+                    if journal is not None:
+                        try:
+                            await asyncio.to_thread(journal.record_done, key, job.apk_path, output_apk,
+                                                    record['sha256'] if record else None)
+                        except Exception as e:
+                            # 输出已经签好，日志写不进去只影响之后能否跳过这个任务
+                            print(f"写入任务日志失败: {e}")
+                except SigningError as e:
+                    if journal is not None:
+                        await asyncio.to_thread(journal.record_failed, key, job.apk_path, str(e))
+                    await events.put({'type': 'error', 'job_id': job.job_id, 'message': str(e),
+                                      'elapsed': time.monotonic() - start})
+                except asyncio.CancelledError:
+                    if not events.full():
+                        events.put_nowait({'type': 'cancelled', 'job_id': job.job_id})
+                    raise
+                except Exception as e:
+                    await events.put({'type': 'error', 'job_id': job.job_id,
+                                      'message': f"签名过程中发生异常: {str(e)}",
+                                      'elapsed': time.monotonic() - start})
+                else:
+                    event = {'type': 'complete', 'job_id': job.job_id, 'output_path': output_apk,
+                             'elapsed': time.monotonic() - start, 'skipped': False}
+                    if checksums_error:
+                        event['checksums_error'] = checksums_error
+                    await events.put(event)
+
+        async def supervise(workers):
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                await events.put(done)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.max_concurrency)]
+        supervisor = asyncio.ensure_future(supervise(workers))
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                yield event
+            # 重新抛出工作协程中的意外异常（例如读取jobs失败）
+            await supervisor
+        finally:
+            # 消费者提前退出或被取消时终止所有签名任务
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            supervisor.cancel()
+            await asyncio.gather(supervisor, return_exceptions=True)
+
+    async def sign_many(self, jobs, journals=None, resume=False, verify=VERIFY_HASH):
+        """签名多个APK并返回所有结束事件（complete/error），按完成顺序排列"""
+        return [event async for event in self.run(jobs, journals, resume, verify) if event['type'] != 'progress']
+
+
+async def create_signer(sdk_path, use_direct_java=False, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                        use_block_signing=False, write_checksums=False):
+    """
+    创建AsyncSigner，工具检查在线程池中执行以免阻塞事件循环
+    :raises SigningError: 缺少apksigner
+    """
+    processor = SigningProcessor(sdk_path, use_direct_java=use_direct_java, use_block_signing=use_block_signing,
+                                 write_checksums=write_checksums)
+    ok, missing, debug_info = await asyncio.to_thread(processor.check_tools)
+    if not ok:
+        raise SigningError(f"缺少必要的工具: {missing}，调试信息：{debug_info}")
+    return AsyncSigner(processor, max_concurrency)
+
+
+async def _run_batch(args):
+    """命令行批量签名"""
+    from job_queue import collect_apk_paths
+    config_manager = ConfigManager(args.config)
+    profile = config_manager.get_profile(args.profile)
+    if not profile.get('keystore_path'):
+        print(f"签名配置 '{args.profile}' 不存在或未设置密钥库路径")
+        return 1
+    signer = await create_signer(args.sdk if args.sdk is not None else config_manager.get_sdk_path(),
+                                 config_manager.get_direct_java(), args.concurrency,
+                                 config_manager.get_block_signing(),
+                                 args.checksums or config_manager.get_write_checksums())
+    output_template = args.output_template or config_manager.get_output_template()
+    try:
+        channels = load_channel_list(args.channels) if args.channels else None
+    except (OSError, ValueError) as e:
+        print(f"无法读取渠道列表: {str(e)}")
+        return 1
+    jobs = (AsyncSigningJob(apk_path, profile['keystore_path'], profile.get('storepass', ''),
+                            profile.get('keypass', ''), profile.get('key_alias', ''),
+                            output_template=output_template, profile_name=args.profile, channels=channels)
+            for apk_path in collect_apk_paths(args.apks))
+
+    journals = JournalSet()
+    counts = {'complete': 0, 'skipped': 0, 'error': 0}
+    try:
+        async for event in signer.run(jobs, journals, args.resume, args.verify):
+            if event['type'] == 'complete':
+                if event['skipped']:
+                    counts['skipped'] += 1
+                else:
+                    counts['complete'] += 1
+                    print(f"[成功] {event['output_path']} ({event['elapsed']:.1f}s)")
+                    if event.get('checksums_error'):
+                        print(f"[警告] {event['output_path']}: {event['checksums_error']}")
+            elif event['type'] == 'error':
+                counts['error'] += 1
+                print(f"[失败] 任务{event['job_id']}: {event['message']}")
+    finally:
+        journals.close()
+    print(f"完成: {counts['complete']} 成功, {counts['skipped']} 已跳过, {counts['error']} 失败")
+    return 1 if counts['error'] else 0
+
+
+def main(argv=None):
+    """命令行入口：不打开界面批量签名"""
+    parser = argparse.ArgumentParser(description="APK批量重签名")
+    parser.add_argument('--profile', required=True, help="签名配置名称")
+    parser.add_argument('--config', default="~/.apk_resign_gui_config.json", help="签名配置文件")
+    parser.add_argument('--sdk', default=None, help="Android SDK路径，默认读取配置文件")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY, help="同时签名的任务数")
+    parser.add_argument('--output-template', default=None, help="输出文件命名模板")
+    parser.add_argument('--resume', action='store_true', help="根据任务日志跳过已完成的任务")
+    parser.add_argument('--verify', choices=(VERIFY_SIZE, VERIFY_HASH), default=VERIFY_HASH,
+                        help="续传时校验已完成输出的方式")
+    parser.add_argument('--channels', default=None, help="渠道列表文件，签名后为每个渠道生成渠道包")
+    parser.add_argument('--checksums', action='store_true', help="把输出的校验和写入输出目录的checksums.jsonl")
+    parser.add_argument('apks', nargs='+', help="APK文件或文件夹")
+    args = parser.parse_args(argv)
+    try:
+        return asyncio.run(_run_batch(args))
+    except SigningError as e:
+        print(str(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
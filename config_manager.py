@@ -15,6 +15,17 @@ class ConfigManager:
         """
         self.config_file = os.path.join(os.path.expanduser(config_file_path))
         self.config_data = self.load_config()
+        # 签名配置变化时的回调
+        self._profile_listeners = []
+
+    def add_profile_listener(self, callback):
+        """注册签名配置变化（添加、修改、删除）时调用的回调"""
+        self._profile_listeners.append(callback)
+
+    def _notify_profiles_changed(self):
+        """通知签名配置已变化"""
+        for callback in self._profile_listeners:
+            callback()
 
     def load_config(self):
         """从配置文件加载数据"""
@@ -49,12 +60,14 @@ class ConfigManager:
         profiles = self.config_data.get("profiles", {})
         profiles[name] = profile_data
         self.config_data["profiles"] = profiles
+        self._notify_profiles_changed()
 
     def update_profile(self, name, profile_data):
         """更新配置"""
         profiles = self.config_data.get("profiles", {})
         profiles[name] = profile_data
         self.config_data["profiles"] = profiles
+        self._notify_profiles_changed()
 
     def delete_profile(self, name):
         """删除配置"""
@@ -62,6 +75,7 @@ class ConfigManager:
         if name in profiles:
             del profiles[name]
             self.config_data["profiles"] = profiles
+            self._notify_profiles_changed()
 
     def get_profile(self, name):
         """获取指定配置"""
@@ -70,4 +84,80 @@ class ConfigManager:
 
     def get_sdk_path(self):
         """获取SDK路径"""
-        return self.config_data.get("sdk_path", "")
\ No newline at end of file
+        return self.config_data.get("sdk_path", "")
+
+    def get_max_workers(self):
+        """获取同时执行的最大任务数"""
+        return self.config_data.get("max_workers", 2)
+
+    def set_max_workers(self, max_workers):
+        """设置同时执行的最大任务数"""
+        self.config_data["max_workers"] = max_workers
+
+    def get_direct_java(self):
+        """获取是否直接用java启动apksigner"""
+        return self.config_data.get("direct_java", True)
+
+    def set_direct_java(self, direct_java):
+        """设置是否直接用java启动apksigner"""
+        self.config_data["direct_java"] = direct_java
+
+    def get_block_signing(self):
+        """获取是否优先在进程内只替换v2签名块"""
+        return self.config_data.get("block_signing", False)
+
+    def set_block_signing(self, block_signing):
+        """设置是否优先在进程内只替换v2签名块"""
+        self.config_data["block_signing"] = block_signing
+
+    def get_output_template(self):
+        """获取输出文件命名模板"""
+        return self.config_data.get("output_template", "{apk_name}_resigned.apk")
+
+    def set_output_template(self, output_template):
+        """设置输出文件命名模板"""
+        self.config_data["output_template"] = output_template
+
+    def get_repack_settings(self):
+        """获取签名前重新打包的设置"""
+        settings = {"enabled": False, "page_size": 4096, "recompress_extensions": [], "compress_level": 9}
+        settings.update(self.config_data.get("repack", {}))
+        return settings
+
+    def set_repack_enabled(self, enabled):
+        """设置是否在签名前重新打包"""
+        settings = self.get_repack_settings()
+        settings["enabled"] = enabled
+        self.config_data["repack"] = settings
+
+    def get_channels_enabled(self):
+        """获取是否在签名后生成渠道包"""
+        return self.config_data.get("channels_enabled", False)
+
+    def set_channels_enabled(self, enabled):
+        """设置是否在签名后生成渠道包"""
+        self.config_data["channels_enabled"] = enabled
+
+    def get_channel_file(self):
+        """获取渠道列表文件路径"""
+        return self.config_data.get("channel_file", "")
+
+    def set_channel_file(self, channel_file):
+        """设置渠道列表文件路径"""
+        self.config_data["channel_file"] = channel_file
+
+    def get_write_checksums(self):
+        """获取是否把输出的校验和写入校验清单"""
+        return self.config_data.get("write_checksums", False)
+
+    def set_write_checksums(self, write_checksums):
+        """设置是否把输出的校验和写入校验清单"""
+        self.config_data["write_checksums"] = write_checksums
+
+    def get_resume(self):
+        """获取是否根据任务日志跳过已完成的任务"""
+        return self.config_data.get("resume", False)
+
+    def set_resume(self, resume):
+        """设置是否根据任务日志跳过已完成的任务"""
+        self.config_data["resume"] = resume
@@ -0,0 +1,781 @@
+"""
+分布式签名模块
+协调节点把一批APK分发到多台工作节点签名，密钥只保存在工作节点上
+
+协议：每条消息为 4字节大端长度 + JSON头，JSON头中带有size时紧跟size字节的文件数据。
+连接建立后双方用共享密钥做HMAC挑战应答（双向认证），并由共享密钥和双方的挑战派生本次连接的会话密钥。
+之后的每条消息在JSON头后附加HMAC-SHA256，文件数据之后也附加一个HMAC（覆盖方向、消息序号和内容），
+校验失败时断开连接，文件在校验通过前不会被使用。之后协调节点发送一条请求：
+  {"type": "status"}                                   -> {"type": "status", "active", "capacity", "profiles", "signers"}
+  {"type": "sign", "profile", "filename", "size", ...}  -> {"type": "result", "ok", "filename", "size"/"message"}
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import queue
+import socket
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+import socketserver
+
+from config_manager import ConfigManager
+from apk_zip import ApkFormatError
+from apk_metadata import resolve_output_name
+from signing_processor import SigningProcessor
+from job_journal import JournalSet, signing_job_key, keystore_fingerprint, VERIFY_HASH, VERIFY_SIZE
+from apk_checksum import MultiHasher, checksum_record, append_manifest, apk_signer_sha256
+
+
+# 网络参数
+CONNECT_TIMEOUT = 10
+IO_TIMEOUT = 600
+STREAM_CHUNK_SIZE = 1024 * 1024
+# JSON头最大长度，避免未认证的连接占用大量内存
+MAX_HEADER_SIZE = 64 * 1024
+NONCE_SIZE = 32
+# 认证后每条消息附加的HMAC-SHA256长度
+MAC_SIZE = 32
+
+# 单个任务最多尝试的工作节点数
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 批次进行中重新查询不可用工作节点的间隔（秒）
+STATUS_REFRESH_INTERVAL = 30
+
+# 共享密钥环境变量
+SECRET_ENV = "APK_RESIGN_SECRET"
+
+
+class ProtocolError(Exception):
+    """协议或认证错误"""
+    pass
+
+
+def _send_message(sock, header, stream=None):
+    """
+    发送一条消息
+    :param header: JSON头
+    :param stream: 可选的文件对象，header['size']字节会紧跟在头后发送
+    """
+    data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+    if stream is not None:
+        remaining = header['size']
+        while remaining > 0:
+            chunk = stream.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ProtocolError("文件在发送过程中被截断")
+            sock.sendall(chunk)
+            remaining -= len(chunk)
+
+
+def _recv_exact(sock, size):
+    """读取指定字节数"""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ProtocolError("连接已关闭")
+        received += n
+    return bytes(buf)
+
+
+def _recv_message(sock):
+    """接收一条消息的JSON头"""
+    length, = struct.unpack('>I', _recv_exact(sock, 4))
+    if length > MAX_HEADER_SIZE:
+        raise ProtocolError(f"消息头过大: {length}")
+    return json.loads(_recv_exact(sock, length).decode('utf-8'))
+
+
+def _recv_stream(sock, size, stream, digest=None):
+    """
+    接收size字节的文件数据并写入stream
+    :param digest: 可选的哈希对象（hashlib对象或MultiHasher），在写入的同时计算哈希
+    """
+    buf = bytearray(min(STREAM_CHUNK_SIZE, max(size, 1)))
+    view = memoryview(buf)
+    remaining = size
+    while remaining > 0:
+        n = sock.recv_into(view[:min(len(buf), remaining)])
+        if n == 0:
+            raise ProtocolError("文件在接收过程中连接已关闭")
+        stream.write(view[:n])
+        if digest is not None:
+            digest.update(view[:n])
+        remaining -= n
+
+
+def _mac(secret, nonce):
+    """计算挑战应答"""
+    return hmac.new(secret, bytes.fromhex(nonce), hashlib.sha256).hexdigest()
+
+
+def _session_key(secret, worker_nonce, coordinator_nonce):
+    """由共享密钥和双方的挑战派生会话密钥"""
+    return hmac.new(secret, b'apk-resign-session' + bytes.fromhex(worker_nonce) + bytes.fromhex(coordinator_nonce),
+                    hashlib.sha256).digest()
+
+
+class _Session:
+    def __init__(self, sock, key, send_label, recv_label):
+        """
+        认证后的连接，每条消息和文件数据都附加HMAC，防止被篡改、重放或反射
+        :param key: 会话密钥
+        :param send_label: 本方发送方向的标记，与对方的recv_label相同
+        :param recv_label: 对方发送方向的标记
+        """
+        self.sock = sock
+        self._key = key
+        self._send_label = send_label
+        self._recv_label = recv_label
+        self._send_seq = 0
+        self._recv_seq = 0
+
+    def _new_mac(self, label, seq):
+        """某个方向上第seq条消息的HMAC对象"""
+        return hmac.new(self._key, label + struct.pack('>Q', seq), hashlib.sha256)
+
+    def send(self, header, stream=None):
+        """
+        发送一条消息
+        :param stream: 可选的文件对象，header['size']字节会紧跟在头后发送，之后是文件数据的HMAC
+        """
+        data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        mac = self._new_mac(self._send_label, self._send_seq)
+        mac.update(data)
+        self._send_seq += 1
+        self.sock.sendall(struct.pack('>I', len(data)) + data + mac.digest())
+        if stream is not None:
+            mac = self._new_mac(self._send_label, self._send_seq)
+            self._send_seq += 1
+            remaining = header['size']
+            while remaining > 0:
+                chunk = stream.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ProtocolError("文件在发送过程中被截断")
+                mac.update(chunk)
+                self.sock.sendall(chunk)
+                remaining -= len(chunk)
+            self.sock.sendall(mac.digest())
+
+    def _check_mac(self, mac):
+        """读取对方附加的HMAC并校验"""
+        if not hmac.compare_digest(_recv_exact(self.sock, MAC_SIZE), mac.digest()):
+            raise ProtocolError("消息校验失败，连接可能被篡改")
+
+    def recv(self):
+        """接收一条消息的JSON头并校验"""
+        length, = struct.unpack('>I', _recv_exact(self.sock, 4))
+        if length > MAX_HEADER_SIZE:
+            raise ProtocolError(f"消息头过大: {length}")
+        data = _recv_exact(self.sock, length)
+        mac = self._new_mac(self._recv_label, self._recv_seq)
+        mac.update(data)
+        self._recv_seq += 1
+        self._check_mac(mac)
+        return json.loads(data.decode('utf-8'))
+
+    def recv_stream(self, size, stream, digest=None):
+        """
+        接收size字节的文件数据写入stream并校验，校验失败时抛出ProtocolError，调用方应丢弃已写入的数据
+        :param digest: 可选的哈希对象（hashlib对象或MultiHasher），在写入的同时计算哈希
+        """
+        mac = self._new_mac(self._recv_label, self._recv_seq)
+        self._recv_seq += 1
+        _recv_stream(self.sock, size, stream, _Tee(mac, digest))
+        self._check_mac(mac)
+
+    def close(self):
+        """关闭连接"""
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _Tee:
+    def __init__(self, *digests):
+        """把数据同时交给多个哈希对象（忽略None）"""
+        self._digests = [digest for digest in digests if digest is not None]
+
+    def update(self, data):
+        for digest in self._digests:
+            digest.update(data)
+
+
+def load_secret(secret_file=None):
+    """从文件或环境变量读取共享密钥"""
+    if secret_file:
+        with open(secret_file, 'rb') as f:
+            secret = f.read().strip()
+    else:
+        secret = os.environ.get(SECRET_ENV, '').encode('utf-8')
+    if not secret:
+        raise ValueError(f"未提供共享密钥，请使用 --secret-file 或设置环境变量 {SECRET_ENV}")
+    return secret
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        """处理来自协调节点的一个连接"""
+        worker = self.server.worker
+        sock = self.request
+        sock.settimeout(IO_TIMEOUT)
+        try:
+            # 认证：工作节点先发挑战，协调节点应答并回发自己的挑战
+            nonce = os.urandom(NONCE_SIZE).hex()
+            _send_message(sock, {'type': 'challenge', 'nonce': nonce})
+            auth = _recv_message(sock)
+            if auth.get('type') != 'auth' or not hmac.compare_digest(
+                    str(auth.get('mac', '')), _mac(worker.secret, nonce)):
+                _send_message(sock, {'type': 'auth_failed'})
+                return
+            session = _Session(sock, _session_key(worker.secret, nonce, str(auth['nonce'])), b'w2c', b'c2w')
+            _send_message(sock, {'type': 'auth_ok', 'mac': _mac(worker.secret, auth['nonce'])})
+
+            request = session.recv()
+            if request.get('type') == 'status':
+                session.send(worker.status())
+            elif request.get('type') == 'sign':
+                worker.handle_sign(session, request)
+            else:
+                session.send({'type': 'error', 'message': f"未知请求: {request.get('type')}"})
+        except (ProtocolError, OSError, ValueError) as e:
+            print(f"处理连接 {self.client_address} 失败: {e}")
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SigningWorker:
+    def __init__(self, processor, config_manager, secret, capacity=2, host='0.0.0.0', port=0):
+        """
+        初始化工作节点
+        :param processor: 已完成工具检查的SigningProcessor
+        :param config_manager: 本机的ConfigManager，签名配置（含密钥）只保存在工作节点
+        :param secret: 与协调节点共享的认证密钥(bytes)
+        :param capacity: 同时签名的最大任务数
+        :param host: 监听地址
+        :param port: 监听端口，0表示自动分配
+        """
+        self.processor = processor
+        self.config_manager = config_manager
+        self.secret = secret
+        self.capacity = max(1, int(capacity))
+        self._slots = threading.Semaphore(self.capacity)
+        self._active = 0
+        self._lock = threading.Lock()
+        self.server = _ThreadingServer((host, port), _WorkerHandler)
+        self.server.worker = self
+
+    @property
+    def address(self):
+        """实际监听的(host, port)"""
+        return self.server.server_address
+
+    def status(self):
+        """当前负载、可用的签名配置和各配置的签名密钥标识（见job_journal.keystore_fingerprint）"""
+        with self._lock:
+            active = self._active
+        profiles = self.config_manager.get_all_profiles()
+        return {
+            'type': 'status',
+            'active': active,
+            'capacity': self.capacity,
+            'profiles': list(profiles.keys()),
+            'signers': {name: keystore_fingerprint(profile.get('keystore_path', ''), profile.get('key_alias', ''))
+                        for name, profile in profiles.items()}
+        }
+
+    def handle_sign(self, session, request):
+        """接收APK，签名后把结果传回"""
+        profile_name = request.get('profile', '')
+        profile = self.config_manager.get_profile(profile_name)
+        filename = os.path.basename(request.get('filename', ''))
+        if filename in ('', os.curdir, os.pardir):
+            filename = 'input.apk'
+        size = int(request['size'])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            apk_path = os.path.join(temp_dir, filename)
+            with open(apk_path, 'wb') as f:
+                session.recv_stream(size, f)
+
+            if not profile.get('keystore_path'):
+                session.send({'type': 'result', 'ok': False,
+                              'message': f"工作节点上没有签名配置 '{profile_name}'"})
+                return
+
+            # 命名模板来自协调节点，输出必须留在临时目录中
+            try:
+                self.processor.resolve_output_path(apk_path, request.get('output_template'), profile_name)
+            except (ValueError, ApkFormatError) as e:
+                session.send({'type': 'result', 'ok': False, 'message': f"输出文件名不可用: {str(e)}"})
+                return
+
+            with self._slots:
+                with self._lock:
+                    self._active += 1
+                try:
+                    progress_queue = queue.Queue()
+                    self.processor.perform_resign(
+                        apk_path, profile['keystore_path'], profile.get('storepass', ''),
+                        profile.get('keypass', '') or profile.get('storepass', ''), profile.get('key_alias', ''),
+                        progress_queue, output_template=request.get('output_template'), profile_name=profile_name)
+                finally:
+                    with self._lock:
+                        self._active -= 1
+
+            result = None
+            while not progress_queue.empty():
+                msg = progress_queue.get_nowait()
+                if msg['type'] in ('complete', 'error', 'cancelled'):
+                    result = msg
+            if result is None or result['type'] != 'complete':
+                message = result.get('message', '签名未完成') if result else '签名未完成'
+                session.send({'type': 'result', 'ok': False, 'message': message})
+                return
+
+            output_path = result['output_path']
+            if os.path.dirname(os.path.abspath(output_path)) != os.path.abspath(temp_dir):
+                session.send({'type': 'result', 'ok': False, 'message': "输出不在工作节点的临时目录中"})
+                return
+            with open(output_path, 'rb') as f:
+                session.send({'type': 'result', 'ok': True, 'filename': os.path.basename(output_path),
+                              'size': os.path.getsize(output_path)}, f)
+
+    def serve_forever(self):
+        """运行工作节点直到shutdown"""
+        self.server.serve_forever()
+
+    def start(self):
+        """在后台线程中运行工作节点"""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        """停止工作节点"""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _WorkerState:
+    def __init__(self, address):
+        self.address = address
+        self.capacity = 0
+        self.profiles = []
+        # {签名配置名称: 签名密钥标识}
+        self.signers = {}
+        self.in_flight = 0
+        self.assigned_bytes = 0
+        # 上次查询状态时节点上不属于本批次的任务数（其他协调节点或本地签名）
+        self.busy = 0
+        self.alive = False
+        # 上次查询状态的time.monotonic()
+        self.checked = 0.0
+
+    def has_free_slot(self):
+        """扣除不属于本批次的任务后是否还有空闲名额"""
+        return self.in_flight + self.busy < self.capacity
+
+    def load(self, extra_bytes=0):
+        """按容量归一化的待处理字节数"""
+        return (self.assigned_bytes + extra_bytes) / max(self.capacity, 1)
+
+
+class _BatchJob:
+    def __init__(self, apk_path):
+        self.apk_path = apk_path
+        self.size = os.path.getsize(apk_path)
+        self.attempts = 0
+        self.tried = set()
+        self.result = None
+        self.journal = None
+        self.key = None
+        # 在协调节点上保存输出的路径，分发前确定，保证批次内不重复
+        self.output_path = None
+        # 最近一次失败的原因
+        self.error = None
+
+
+class SigningCoordinator:
+    def __init__(self, workers, secret, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        初始化协调节点
+        :param workers: 工作节点地址列表 [(host, port), ...]
+        :param secret: 共享认证密钥(bytes)
+        :param max_attempts: 单个任务最多尝试的工作节点数
+        """
+        self.workers = [_WorkerState(tuple(address)) for address in workers]
+        self.secret = secret
+        self.max_attempts = max_attempts
+
+    def _connect(self, address):
+        """连接工作节点并完成双向认证，返回_Session"""
+        sock = socket.create_connection(address, timeout=CONNECT_TIMEOUT)
+        try:
+            sock.settimeout(IO_TIMEOUT)
+            challenge = _recv_message(sock)
+            if challenge.get('type') != 'challenge':
+                raise ProtocolError("工作节点未发送认证挑战")
+            nonce = os.urandom(NONCE_SIZE).hex()
+            _send_message(sock, {'type': 'auth', 'mac': _mac(self.secret, challenge['nonce']), 'nonce': nonce})
+            reply = _recv_message(sock)
+            if reply.get('type') != 'auth_ok' or not hmac.compare_digest(
+                    str(reply.get('mac', '')), _mac(self.secret, nonce)):
+                raise ProtocolError(f"工作节点 {address[0]}:{address[1]} 认证失败")
+            return _Session(sock, _session_key(self.secret, str(challenge['nonce']), nonce), b'c2w', b'w2c')
+        except Exception:
+            sock.close()
+            raise
+
+    def refresh_status(self, workers=None):
+        """
+        查询工作节点的容量和签名配置
+        :param workers: 要查询的_WorkerState列表，默认为所有工作节点
+        :return: 可用的工作节点列表
+        """
+        for worker in self.workers if workers is None else workers:
+            worker.checked = time.monotonic()
+            try:
+                with self._connect(worker.address) as session:
+                    session.send({'type': 'status'})
+                    status = session.recv()
+                worker.capacity = int(status['capacity'])
+                worker.profiles = status['profiles']
+                worker.signers = status.get('signers', {})
+                # 节点报告的任务数包括本批次正在进行的任务
+                worker.busy = max(0, int(status.get('active', 0)) - worker.in_flight)
+                worker.alive = True
+            except (OSError, ProtocolError, ValueError, KeyError) as e:
+                print(f"工作节点 {worker.address[0]}:{worker.address[1]} 不可用: {e}")
+                worker.alive = False
+        return [worker for worker in self.workers if worker.alive]
+
+    def _sign_on_worker(self, worker, job, profile_name, output_dir, output_template):
+        """
+        把一个APK发送到工作节点签名并接收结果
+        :return: (输出路径, 输出文件的MultiHasher)，哈希在接收时同步计算
+        """
+        with self._connect(worker.address) as session:
+            with open(job.apk_path, 'rb') as f:
+                session.send({'type': 'sign', 'profile': profile_name,
+                                     'filename': os.path.basename(job.apk_path), 'size': job.size,
+                                     'output_template': output_template}, f)
+            reply = session.recv()
+            if reply.get('type') != 'result':
+                raise ProtocolError(f"工作节点返回了意外的消息: {reply.get('type')}")
+            if not reply.get('ok'):
+                raise ProtocolError(reply.get('message', '签名失败'))
+
+            # 输出路径在分发前已确定，工作节点按同样的模板命名，不一致时不使用它返回的文件名
+            output_path = job.output_path
+            if str(reply.get('filename')) != os.path.basename(output_path):
+                raise ProtocolError(f"工作节点返回的文件名与预期不一致: {reply.get('filename')!r}")
+            temp_path = f"{output_path}.part"
+            hasher = MultiHasher()
+            try:
+                with open(temp_path, 'wb') as f:
+                    session.recv_stream(int(reply['size']), f, hasher)
+                os.replace(temp_path, output_path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return output_path, hasher
+
+    def _pick(self, pending, profile_name):
+        """
+        选择下一个(任务, 工作节点)：优先大文件，分配给按容量归一化后负载最低的空闲节点；
+        优先选择扣除其他任务后仍有空闲名额的节点，都没有时才分配给忙碌的节点（任务在节点上排队）
+        """
+        for job in pending:
+            candidates = [worker for worker in self.workers
+                          if worker.alive and profile_name in worker.profiles
+                          and worker.in_flight < worker.capacity and worker.address not in job.tried]
+            if candidates:
+                free = [worker for worker in candidates if worker.has_free_slot()]
+                return job, min(free or candidates, key=lambda worker: worker.load(job.size))
+        return None, None
+
+    def _has_candidate(self, job, profile_name):
+        """任务是否还有可以尝试的工作节点（暂时不可用的节点之后可能恢复，也算在内）"""
+        return any(profile_name in worker.profiles and worker.address not in job.tried for worker in self.workers)
+
+    def _refresh_unlocked(self, cond, workers):
+        """在不持有cond的情况下重新查询工作节点，查询期间任务线程可以正常结束"""
+        cond.release()
+        try:
+            self.refresh_status(workers)
+        finally:
+            cond.acquire()
+
+    @staticmethod
+    def _assign_output_paths(jobs, profile_name, output_dir, output_template):
+        """
+        分发前按命名模板确定每个任务的输出路径
+        不同目录中的同名APK输出到同一个output_dir时会互相覆盖，这种情况下整批不执行
+        :return: 无法生成输出文件名的任务集合（已设置失败结果）
+        :raises ValueError: 多个APK的输出路径相同，或输出会覆盖批次中的输入APK
+        """
+        failed = set()
+        outputs = {}
+        inputs = {os.path.normcase(os.path.abspath(job.apk_path)) for job in jobs}
+        for job in jobs:
+            try:
+                name = resolve_output_name(job.apk_path, output_template, profile_name)
+            except (ValueError, ApkFormatError) as e:
+                job.result = {'apk_path': job.apk_path, 'ok': False, 'message': f"输出文件名不可用: {str(e)}"}
+                failed.add(job)
+                continue
+            job.output_path = os.path.join(output_dir or os.path.dirname(job.apk_path), name)
+            key = os.path.normcase(os.path.abspath(job.output_path))
+            if key in inputs:
+                raise ValueError(f"输出会覆盖输入APK: {job.output_path}")
+            if key in outputs:
+                raise ValueError(f"{outputs[key].apk_path} 和 {job.apk_path} 的输出路径相同: {job.output_path}，"
+                                 f"请修改命名模板（例如加入{{package}}）或不使用统一的输出目录")
+            outputs[key] = job
+        return failed
+
+    def run_batch(self, apk_paths, profile_name, output_dir=None, output_template=None, progress_callback=None,
+                  journals=None, resume=False, verify=VERIFY_HASH, checksums=False):
+        """
+        分发一批APK签名
+        :param apk_paths: APK路径列表
+        :param profile_name: 工作节点上的签名配置名称
+        :param output_dir: 输出目录，为None时输出到各APK所在目录
+        :param output_template: 输出文件命名模板
+        :param progress_callback: 可选回调callback(result)，每个任务结束时调用
+        :param journals: 可选的JournalSet，在输出目录中记录任务日志
+        :param resume: 是否跳过日志中已完成且输出校验通过的任务
+        :param verify: 校验已完成输出的方式，VERIFY_SIZE或VERIFY_HASH
+        :param checksums: 是否把接收时计算的校验和追加到输出目录的校验清单
+        :return: 结果列表，每项为 {'apk_path', 'ok', 'output_path'/'message', 'worker', 'elapsed'}，
+                 校验和不可用时成功的结果中带有'checksums_error'
+        :raises ValueError: 多个APK的输出路径相同，或输出会覆盖批次中的输入APK
+        """
+        # 大文件优先，减少批次末尾的长尾
+        jobs = sorted((_BatchJob(path) for path in apk_paths), key=lambda job: job.size, reverse=True)
+        failed = self._assign_output_paths(jobs, profile_name, output_dir, output_template)
+
+        if not self.refresh_status():
+            raise ProtocolError("没有可用的工作节点")
+
+        # 签名在工作节点上进行，任务标识使用各节点报告的密钥标识，节点换了密钥库或别名后不会跳过旧的输出
+        signer = sorted({worker.signers[profile_name] for worker in self.workers
+                         if worker.alive and profile_name in worker.signers})
+        pending = []
+        for job in jobs:
+            if job in failed:
+                if progress_callback:
+                    progress_callback(job.result)
+                continue
+            if journals is not None:
+                job.journal = journals.get(output_dir or os.path.dirname(os.path.abspath(job.apk_path)))
+                job.key = signing_job_key(job.apk_path, signer, output_template, profile_name)
+                if resume:
+                    output_path = job.journal.verified_output(job.key, verify)
+                    if output_path:
+                        job.result = {'apk_path': job.apk_path, 'ok': True, 'output_path': output_path,
+                                      'worker': None, 'elapsed': 0.0, 'skipped': True}
+                        continue
+            pending.append(job)
+        cond = threading.Condition()
+        in_flight = [0]
+
+        def finish(job, result):
+            job.result = result
+            if progress_callback:
+                progress_callback(result)
+
+        def run(job, worker):
+            start = time.monotonic()
+            result = None
+            error = None
+            checksums_error = None
+            try:
+                if job.journal is not None and job.attempts == 0:
+                    job.journal.record_start(job.key, job.apk_path)
+                output_path, hasher = self._sign_on_worker(worker, job, profile_name, output_dir, output_template)
+                if checksums:
+                    try:
+                        append_manifest(checksum_record(output_path, hasher, apk_signer_sha256(output_path),
+                                                        job.apk_path, time.monotonic() - start))
+                    except (OSError, ApkFormatError) as e:
+                        # 输出已经签好并传回，只是没有写入校验清单
+                        checksums_error = f"校验和不可用: {str(e)}"
+                if job.journal is not None:
+                    try:
+                        job.journal.record_done(job.key, job.apk_path, output_path, hasher.hexdigests()['sha256'])
+                    except Exception as e:
+                        # 输出已经签好，日志写不进去只影响之后能否跳过这个任务
+                        print(f"写入任务日志失败: {e}")
+                result = {'apk_path': job.apk_path, 'ok': True, 'output_path': output_path,
+                          'worker': f"{worker.address[0]}:{worker.address[1]}", 'elapsed': time.monotonic() - start,
+                          'skipped': False}
+                if checksums_error:
+                    result['checksums_error'] = checksums_error
+            except Exception as e:
+                error = e
+                if isinstance(e, OSError):
+                    # 连接失败的节点暂时不再分配任务，之后重新查询状态时可能恢复
+                    worker.alive = False
+            finally:
+                # 无论任务如何结束都要归还名额并唤醒调度循环，否则协调节点会一直等待
+                with cond:
+                    worker.in_flight -= 1
+                    worker.assigned_bytes -= job.size
+                    in_flight[0] -= 1
+                    if result is None:
+                        job.attempts += 1
+                        job.error = str(error) if error is not None else "任务被中断"
+                        if job.attempts < self.max_attempts and self._has_candidate(job, profile_name):
+                            # 换一个工作节点重试
+                            pending.insert(0, job)
+                        else:
+                            result = {'apk_path': job.apk_path, 'ok': False, 'message': job.error,
+                                      'worker': f"{worker.address[0]}:{worker.address[1]}",
+                                      'elapsed': time.monotonic() - start}
+                            if job.journal is not None:
+                                job.journal.record_failed(job.key, job.apk_path, job.error)
+                    cond.notify_all()
+            if result is not None:
+                finish(job, result)
+
+        # 没有任务在进行且无法分配时，先重新查询一次不可用的节点再放弃
+        probed = False
+        with cond:
+            while pending or in_flight[0]:
+                job, worker = self._pick(pending, profile_name)
+                if job is None:
+                    dead = [worker for worker in self.workers if not worker.alive]
+                    if not in_flight[0]:
+                        if dead and not probed:
+                            probed = True
+                            self._refresh_unlocked(cond, dead)
+                            continue
+                        # 剩余任务没有任何可用节点
+                        for job in pending:
+                            message = job.error or f"没有可用的工作节点提供签名配置 '{profile_name}'"
+                            if job.journal is not None:
+                                job.journal.record_failed(job.key, job.apk_path, message)
+                            finish(job, {'apk_path': job.apk_path, 'ok': False, 'message': message})
+                        pending.clear()
+                        break
+                    cond.wait(STATUS_REFRESH_INTERVAL)
+                    # 定期重新查询不可用的节点，恢复的节点可以继续分配任务
+                    now = time.monotonic()
+                    due = [worker for worker in dead if now - worker.checked >= STATUS_REFRESH_INTERVAL]
+                    if due:
+                        self._refresh_unlocked(cond, due)
+                    continue
+                probed = False
+                pending.remove(job)
+                job.tried.add(worker.address)
+                worker.in_flight += 1
+                worker.assigned_bytes += job.size
+                in_flight[0] += 1
+                thread = threading.Thread(target=run, args=(job, worker))
+                thread.daemon = True
+                thread.start()
+
+        return [job.result for job in jobs]
+
+
+def _parse_address(value):
+    """解析 host:port"""
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="APK分布式重签名")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    worker_parser = subparsers.add_parser('worker', help="运行工作节点")
+    worker_parser.add_argument('--host', default='0.0.0.0')
+    worker_parser.add_argument('--port', type=int, default=9600)
+    worker_parser.add_argument('--capacity', type=int, default=2, help="同时签名的最大任务数")
+    worker_parser.add_argument('--config', default="~/.apk_resign_gui_config.json", help="签名配置文件")
+    worker_parser.add_argument('--sdk', default=None, help="Android SDK路径，默认读取配置文件")
+    worker_parser.add_argument('--secret-file', default=None)
+
+    coordinator_parser = subparsers.add_parser('coordinate', help="把一批APK分发到工作节点签名")
+    coordinator_parser.add_argument('--worker', action='append', required=True, help="工作节点地址 host:port，可重复")
+    coordinator_parser.add_argument('--profile', required=True, help="工作节点上的签名配置名称")
+    coordinator_parser.add_argument('--output-dir', default=None)
+    coordinator_parser.add_argument('--output-template', default=None)
+    coordinator_parser.add_argument('--secret-file', default=None)
+    coordinator_parser.add_argument('--resume', action='store_true', help="根据任务日志跳过已完成的任务")
+    coordinator_parser.add_argument('--verify', choices=(VERIFY_SIZE, VERIFY_HASH), default=VERIFY_HASH,
+                                    help="续传时校验已完成输出的方式")
+    coordinator_parser.add_argument('--checksums', action='store_true', help="把输出的校验和写入输出目录的checksums.jsonl")
+    coordinator_parser.add_argument('apks', nargs='+')
+
+    args = parser.parse_args(argv)
+    secret = load_secret(args.secret_file)
+
+    if args.mode == 'worker':
+        config_manager = ConfigManager(args.config)
+        processor = SigningProcessor(args.sdk if args.sdk is not None else config_manager.get_sdk_path(),
+                                     use_direct_java=config_manager.get_direct_java(),
+                                     use_block_signing=config_manager.get_block_signing())
+        ok, missing, debug_info = processor.check_tools()
+        if not ok:
+            print(f"缺少必要的工具: {missing}\n调试信息：{debug_info}")
+            return 1
+        worker = SigningWorker(processor, config_manager, secret, args.capacity, args.host, args.port)
+        print(f"工作节点已启动: {worker.address[0]}:{worker.address[1]}")
+        try:
+            worker.serve_forever()
+        except KeyboardInterrupt:
+            worker.shutdown()
+        return 0
+
+    from job_queue import collect_apk_paths
+    coordinator = SigningCoordinator([_parse_address(value) for value in args.worker], secret)
+
+    def report(result):
+        if result['ok']:
+            print(f"[成功] {result['apk_path']} -> {result['output_path']} ({result['worker']}, {result['elapsed']:.1f}s)")
+            if result.get('checksums_error'):
+                print(f"[警告] {result['apk_path']}: {result['checksums_error']}")
+        else:
+            print(f"[失败] {result['apk_path']}: {result['message']}")
+
+    journals = JournalSet()
+    try:
+        results = coordinator.run_batch(collect_apk_paths(args.apks), args.profile, args.output_dir,
+                                        args.output_template, report, journals, args.resume, args.verify,
+                                        args.checksums)
+    except (ValueError, ProtocolError) as e:
+        print(f"错误: {e}")
+        return 1
+    finally:
+        journals.close()
+    failed = [result for result in results if not result['ok']]
+    skipped = [result for result in results if result.get('skipped')]
+    print(f"完成: {len(results) - len(failed) - len(skipped)} 成功, {len(skipped)} 已跳过, {len(failed)} 失败")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
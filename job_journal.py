@@ -0,0 +1,267 @@
+"""
+任务日志模块
+批量签名时在输出目录中追加写入任务日志（JSON Lines），记录任务开始、输出哈希和完成状态，
+中断后可以重放日志，只重新执行未完成的任务。打开日志时如果大部分记录已被后面的记录取代，
+先把日志压缩为只包含仍然有效的done记录
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+# 日志文件名，保存在输出目录中
+JOURNAL_FILENAME = ".apk_resign_journal.jsonl"
+
+# 成组fsync：累计到一定条数或距离第一条未fsync的记录超过一定时间后fsync（由定时器触发，不必等下一条记录）
+DEFAULT_GROUP_SIZE = 64
+DEFAULT_GROUP_INTERVAL = 1.0
+
+# 压缩日志：记录数超过COMPACT_MIN_RECORDS且超过有效记录数的COMPACT_RATIO倍时，打开日志时重写
+COMPACT_MIN_RECORDS = 1000
+COMPACT_RATIO = 2
+
+# 计算哈希时的读取块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 日志事件
+EVENT_START = "start"
+EVENT_DONE = "done"
+EVENT_FAILED = "failed"
+
+# 校验已完成输出的方式
+VERIFY_SIZE = "size"
+VERIFY_HASH = "hash"
+
+
+def file_sha256(path):
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def job_key(apk_path, *options):
+    """
+    生成任务标识：输入文件路径、大小、修改时间以及影响输出的选项（命名模板、签名配置等）
+    输入文件被修改后标识会变化，任务会重新执行
+    """
+    stat = os.stat(apk_path)
+    parts = [os.path.abspath(apk_path), str(stat.st_size), str(stat.st_mtime_ns)]
+    parts.extend('' if option is None else json.dumps(option, sort_keys=True, ensure_ascii=False)
+                 for option in options)
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def keystore_fingerprint(keystore_path, key_alias):
+    """
+    签名密钥的标识：密钥库路径、密钥库内容的SHA-256和别名
+    换了密钥库（包括同一路径下替换了文件）或别名后，任务标识随之变化，已完成的任务不会被跳过
+    """
+    try:
+        content = file_sha256(keystore_path)
+    except OSError:
+        content = ''
+    parts = [os.path.abspath(keystore_path), content, key_alias or '']
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def signing_job_key(apk_path, signer, output_template=None, profile_name="", repack_options=None, channels=None):
+    """
+    签名任务的标识，GUI、命令行批量签名和分布式签名使用相同的组成
+    :param signer: keystore_fingerprint的结果（分布式签名为各工作节点报告的标识列表）
+    :param channels: 渠道名列表，渠道包也是输出的一部分
+    """
+    options = [output_template, profile_name, repack_options, signer]
+    if channels:
+        options.append(list(channels))
+    return job_key(apk_path, *options)
+
+
+class JobJournal:
+    def __init__(self, directory, group_size=DEFAULT_GROUP_SIZE, group_interval=DEFAULT_GROUP_INTERVAL):
+        """
+        打开（或创建）输出目录中的任务日志，并重放已有的记录
+        :param directory: 输出目录
+        :param group_size: 累计多少条记录后fsync
+        :param group_interval: 第一条未fsync的记录最多等待多少秒后fsync
+        """
+        self.path = os.path.join(directory, JOURNAL_FILENAME)
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.completed, records = self._load(self.path)
+        if records > COMPACT_MIN_RECORDS and records > COMPACT_RATIO * len(self.completed):
+            self.compact(self.path, self.completed)
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._unsynced = 0
+        self._timer = None
+
+    @staticmethod
+    def replay(path):
+        """
+        读取日志，返回 {任务标识: done记录}
+        最后一行可能因断电而不完整，无法解析的行会被忽略
+        """
+        return JobJournal._load(path)[0]
+
+    @staticmethod
+    def _load(path):
+        """读取日志，返回({任务标识: done记录}, 记录行数)"""
+        completed = {}
+        records = 0
+        if not os.path.exists(path):
+            return completed, records
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                records += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                if record.get('event') == EVENT_DONE:
+                    completed[record.get('key')] = record
+                elif record.get('event') in (EVENT_START, EVENT_FAILED):
+                    completed.pop(record.get('key'), None)
+        return completed, records
+
+    @staticmethod
+    def compact(path, completed):
+        """
+        把日志重写为只包含completed中的done记录（先写临时文件、fsync再替换，中途断电时旧日志仍然完整）
+        只在打开日志、尚未追加时调用；其他进程同时追加到同一日志时它们的记录可能丢失，只会导致任务重新执行
+        """
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for record in completed.values():
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except OSError as e:
+            # 压缩失败不影响继续追加
+            print(f"压缩任务日志失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _append(self, record, force_sync=False):
+        """追加一条记录，按成组策略fsync"""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if force_sync or self._unsynced >= self.group_size:
+                self._sync()
+            elif self._timer is None:
+                # 之后没有新记录时也在group_interval秒内fsync
+                self._timer = threading.Timer(self.group_interval, self._timed_sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timed_sync(self):
+        """定时器线程中fsync尚未fsync的记录"""
+        with self._lock:
+            if self._timer is threading.current_thread():
+                self._timer = None
+            if self._unsynced and not self._file.closed:
+                self._sync()
+
+    def _sync(self):
+        """在持有_lock时调用"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def record_start(self, key, apk_path):
+        """记录任务开始"""
+        self._append({'event': EVENT_START, 'key': key, 'input': apk_path, 'time': time.time()})
+
+    def record_done(self, key, apk_path, output_path, sha256=None):
+        """
+        记录任务完成
+        :param sha256: 输出文件的SHA-256，为None时在这里计算
+        """
+        if sha256 is None:
+            sha256 = file_sha256(output_path)
+        record = {'event': EVENT_DONE, 'key': key, 'input': apk_path, 'output': output_path,
+                  'size': os.path.getsize(output_path), 'sha256': sha256, 'time': time.time()}
+        self._append(record)
+        with self._lock:
+            self.completed[key] = record
+
+    def record_failed(self, key, apk_path, message):
+        """记录任务失败"""
+        self._append({'event': EVENT_FAILED, 'key': key, 'input': apk_path, 'message': message, 'time': time.time()})
+        with self._lock:
+            self.completed.pop(key, None)
+
+    def verified_output(self, key, verify=VERIFY_HASH):
+        """
+        检查任务是否已完成且输出文件完好
+        先比较大小，大小一致时再按需比较哈希
+        :return: 输出路径，未完成或输出已损坏时返回None
+        """
+        with self._lock:
+            record = self.completed.get(key)
+        if record is None:
+            return None
+        output_path = record.get('output', '')
+        try:
+            if os.path.getsize(output_path) != record.get('size'):
+                return None
+        except OSError:
+            return None
+        if verify == VERIFY_HASH and file_sha256(output_path) != record.get('sha256'):
+            return None
+        return output_path
+
+    def close(self):
+        """fsync并关闭日志"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            self._sync()
+            self._file.close()
+
+
+class JournalSet:
+    def __init__(self, group_size=DEFAULT_GROUP_SIZE, group_interval=DEFAULT_GROUP_INTERVAL):
+        """按输出目录管理多个任务日志"""
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self._journals = {}
+        self._lock = threading.Lock()
+
+    def get(self, directory):
+        """获取输出目录对应的任务日志"""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            journal = self._journals.get(directory)
+            if journal is None:
+                journal = JobJournal(directory, self.group_size, self.group_interval)
+                self._journals[directory] = journal
+            return journal
+
+    def close(self):
+        """关闭所有日志"""
+        with self._lock:
+            journals = list(self._journals.values())
+            self._journals.clear()
+        for journal in journals:
+            journal.close()
@@ -0,0 +1,324 @@
+"""
+任务队列模块
+负责批量重签名任务的排队、并发执行、取消与重试
+"""
+
+import os
+import time
+import threading
+import itertools
+
+from apk_metadata import get_apk_metadata
+from apk_repack import format_repack_stats
+from apk_pipeline import format_pipeline_stats
+from apk_channel import format_channel_stats
+from apk_checksum import format_checksum
+from job_journal import signing_job_key, keystore_fingerprint
+
+
+# 任务状态
+JOB_PENDING = "等待中"
+JOB_RUNNING = "处理中"
+JOB_DONE = "已完成"
+JOB_FAILED = "失败"
+JOB_CANCELLED = "已取消"
+
+# 已结束的任务状态
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+def collect_apk_paths(paths):
+    """
+    展开文件和文件夹路径，返回其中所有APK文件
+    :param paths: 文件或文件夹路径列表
+    :return: APK文件路径列表（保持输入顺序，文件夹内按名称排序）
+    """
+    apk_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    # 跳过之前生成的重签名输出，避免重复处理
+                    if filename.lower().endswith('.apk') and not filename.lower().endswith('_resigned.apk'):
+                        apk_paths.append(os.path.join(dirpath, filename))
+        elif path.lower().endswith('.apk'):
+            apk_paths.append(path)
+    return apk_paths
+
+
+class SigningJob:
+    def __init__(self, job_id, apk_path):
+        """
+        初始化签名任务
+        :param job_id: 任务ID
+        :param apk_path: 待签名APK路径
+        """
+        self.job_id = job_id
+        self.apk_path = apk_path
+        self.status = JOB_PENDING
+        self.progress = 0
+        self.message = ""
+        self.output_path = ""
+        # 签名时计算的输出SHA-256，记录任务日志时不必再读取输出
+        self.output_sha256 = None
+        self.start_time = None
+        self.end_time = None
+        self.cancel_event = threading.Event()
+        # 清单元数据（包名、版本等），后台解析
+        self.metadata = None
+        # 签名参数，用于执行和重试
+        self.processor = None
+        self.signing_args = None
+        self.signing_options = {}
+
+    def elapsed(self):
+        """获取任务耗时（秒）"""
+        if self.start_time is None:
+            return 0.0
+        end = self.end_time if self.end_time is not None else time.monotonic()
+        return end - self.start_time
+
+    def reset(self):
+        """重置任务状态以便重试"""
+        self.status = JOB_PENDING
+        self.progress = 0
+        self.message = ""
+        self.output_path = ""
+        self.output_sha256 = None
+        self.start_time = None
+        self.end_time = None
+        self.cancel_event = threading.Event()
+
+
+class _JobProgressSink:
+    """把签名过程的进度消息记录到任务上并转发到任务的进度通道"""
+
+    def __init__(self, job_queue, job):
+        self.job_queue = job_queue
+        self.job = job
+
+    def put(self, msg):
+        self.job_queue.handle_message(self.job, msg)
+
+
+class JobQueue:
+    def __init__(self, dispatcher, max_workers=2, journals=None):
+        """
+        初始化任务队列
+        :param dispatcher: 提供channel(job_id)的进度分发器，每个任务使用独立的进度通道
+        :param max_workers: 同时执行的最大任务数
+        :param journals: 可选的JournalSet，在输出目录中记录任务日志
+        """
+        self.dispatcher = dispatcher
+        self.max_workers = max(1, int(max_workers))
+        self.journals = journals
+        # 是否根据任务日志跳过已完成的任务
+        self.resume = False
+        self.jobs = {}
+        self._pending = []
+        self._running = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def add_job(self, apk_path):
+        """
+        添加任务，若该APK已有未结束的任务则返回None
+        :param apk_path: APK路径
+        """
+        apk_path = os.path.normpath(apk_path)
+        with self._lock:
+            for job in self.jobs.values():
+                if job.apk_path == apk_path and job.status not in FINISHED_STATES:
+                    return None
+            job = SigningJob(next(self._ids), apk_path)
+            self.jobs[job.job_id] = job
+            return job
+
+    def find_job(self, apk_path):
+        """查找指定APK对应的最新任务"""
+        apk_path = os.path.normpath(apk_path)
+        with self._lock:
+            for job in reversed(list(self.jobs.values())):
+                if job.apk_path == apk_path:
+                    return job
+        return None
+
+    def pending_jobs(self):
+        """获取尚未提交执行的等待任务"""
+        with self._lock:
+            return [job for job in self.jobs.values()
+                    if job.status == JOB_PENDING and job not in self._pending]
+
+    def load_metadata(self, jobs):
+        """在后台线程中解析任务APK的清单元数据，完成后通过进度通道通知界面"""
+        def worker():
+            for job in jobs:
+                try:
+                    job.metadata = get_apk_metadata(job.apk_path)
+                except Exception:
+                    job.metadata = {}
+                self.dispatcher.channel(job.job_id).put({'type': 'metadata'})
+
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, job, processor, signing_args, signing_options=None):
+        """
+        提交任务执行
+        :param job: 任务
+        :param processor: 已完成工具检查的SigningProcessor
+        :param signing_args: (keystore_path, storepass, keypass, key_alias)
+        :param signing_options: 传给perform_resign的其他关键字参数，如output_template
+        """
+        with self._lock:
+            job.processor = processor
+            job.signing_args = signing_args
+            job.signing_options = dict(signing_options or {})
+            if job not in self._pending:
+                self._pending.append(job)
+        self._schedule()
+
+    def set_max_workers(self, max_workers):
+        """调整并发数，已在运行的任务不受影响"""
+        with self._lock:
+            self.max_workers = max(1, int(max_workers))
+        self._schedule()
+
+    def cancel(self, job_id):
+        """取消任务，等待中的任务直接取消，运行中的任务会终止签名进程"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            job.cancel_event.set()
+            if job in self._pending:
+                self._pending.remove(job)
+                job.status = JOB_CANCELLED
+                job.message = "已取消"
+                self.dispatcher.channel(job.job_id).put({'type': 'cancelled'})
+        return True
+
+    def retry(self, job_id):
+        """重试已失败或已取消的任务"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in (JOB_FAILED, JOB_CANCELLED) or job.processor is None:
+                return False
+            job.reset()
+            self._pending.append(job)
+        self.dispatcher.channel(job.job_id).put({'type': 'progress', 'value': 0, 'status': JOB_PENDING})
+        self._schedule()
+        return True
+
+    def remove(self, job_id):
+        """移除未在运行的任务"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status == JOB_RUNNING:
+                return False
+            if job in self._pending:
+                self._pending.remove(job)
+            del self.jobs[job_id]
+        self.dispatcher.remove_channel(job_id)
+        return True
+
+    def is_busy(self):
+        """是否还有等待或运行中的任务"""
+        with self._lock:
+            return bool(self._pending) or self._running > 0
+
+    def handle_message(self, job, msg):
+        """记录签名过程发送的消息并转发到任务的进度通道"""
+        with self._lock:
+            if msg['type'] == 'progress':
+                job.progress = msg['value']
+                job.message = msg.get('status', job.message)
+            elif msg['type'] == 'complete':
+                job.status = JOB_DONE
+                job.progress = 100
+                job.output_path = msg['output_path']
+                job.message = "已跳过，之前已完成" if msg.get('skipped') else "处理成功完成"
+                block_stats = msg.get('block_signing')
+                if block_stats:
+                    job.message += "（只替换了v2签名块"
+                    if block_stats.get('chunks_reused'):
+                        job.message += f"，沿用{block_stats['chunks_reused']}/{block_stats['chunks']}个块摘要"
+                    if block_stats.get('stages'):
+                        job.message += "，" + format_pipeline_stats(block_stats)
+                    job.message += "）"
+                if msg.get('repack_stats'):
+                    job.message += "，" + format_repack_stats(msg['repack_stats'])
+                if msg.get('channel_stats'):
+                    job.message += "，" + format_channel_stats(msg['channel_stats'])
+                if msg.get('checksums'):
+                    job.output_sha256 = msg['checksums']['sha256']
+                    job.message += "，" + format_checksum(msg['checksums'])
+                if msg.get('checksums_error'):
+                    job.message += "，" + msg['checksums_error']
+            elif msg['type'] == 'error':
+                job.status = JOB_FAILED
+                job.message = msg['message']
+            elif msg['type'] == 'cancelled':
+                job.status = JOB_CANCELLED
+                job.message = "已取消"
+        self.dispatcher.channel(job.job_id).put(msg)
+
+    def _schedule(self):
+        """在并发数允许的范围内启动等待中的任务"""
+        with self._lock:
+            while self._pending and self._running < self.max_workers:
+                job = self._pending.pop(0)
+                job.status = JOB_RUNNING
+                job.start_time = time.monotonic()
+                self._running += 1
+                thread = threading.Thread(target=self._run_job, args=(job,))
+                thread.daemon = True
+                thread.start()
+
+    def _run_job(self, job):
+        """在工作线程中执行单个任务"""
+        sink = _JobProgressSink(self, job)
+        try:
+            journal = key = None
+            if self.journals is not None:
+                # 输出与输入在同一目录，日志也放在那里
+                journal = self.journals.get(os.path.dirname(os.path.abspath(job.apk_path)))
+                options = job.signing_options
+                keystore_path, _, _, key_alias = job.signing_args
+                key = signing_job_key(job.apk_path, keystore_fingerprint(keystore_path, key_alias),
+                                      options.get('output_template'), options.get('profile_name', ''),
+                                      options.get('repack_options'), options.get('channels'))
+                if self.resume:
+                    output_path = journal.verified_output(key)
+                    if output_path:
+                        sink.put({'type': 'complete', 'output_path': output_path, 'skipped': True})
+                        return
+                journal.record_start(key, job.apk_path)
+
+            keystore_path, storepass, keypass, key_alias = job.signing_args
+            job.processor.perform_resign(job.apk_path, keystore_path, storepass, keypass, key_alias, sink,
+                                         cancel_event=job.cancel_event, **job.signing_options)
+
+            if journal is not None:
+                if job.status == JOB_DONE:
+                    try:
+                        journal.record_done(key, job.apk_path, job.output_path, job.output_sha256)
+                    except Exception as e:
+                        # 输出已经签好，日志写不进去只影响之后能否跳过这个任务
+                        print(f"写入任务日志失败: {e}")
+                elif job.status == JOB_FAILED:
+                    journal.record_failed(key, job.apk_path, job.message)
+        except Exception as e:
+            sink.put({'type': 'error', 'message': f"签名过程中发生异常: {str(e)}"})
+        finally:
+            with self._lock:
+                if job.status == JOB_RUNNING:
+                    # 签名过程未报告结果
+                    job.status = JOB_FAILED
+                    job.message = "签名过程意外结束"
+                    self.dispatcher.channel(job.job_id).put({'type': 'error', 'message': job.message})
+                job.end_time = time.monotonic()
+                self._running -= 1
+            self._schedule()
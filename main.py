@@ -15,6 +15,7 @@ from pathlib import Path
 import json
 import threading
 import queue
+import time
 
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
@@ -26,13 +27,26 @@ from constants import VERSION
 from config_manager import ConfigManager
 from signing_processor import SigningProcessor
 from profile_dialog import ManageProfilesDialog
+from apk_channel import load_channel_list
+from apk_prepare import ApkPreparer, format_prepare_stats
+from job_queue import JobQueue, collect_apk_paths, JOB_RUNNING, JOB_FAILED, JOB_CANCELLED
+from progress_dispatcher import ProgressDispatcher
+from job_journal import JournalSet
+from profile_health import ProfileHealthChecker, profile_fingerprint, HEALTH_MARKS, HEALTH_ERROR
+
+# 运行中任务耗时的刷新间隔（秒）
+ELAPSED_REFRESH_INTERVAL = 0.5
+# 非模态通知的显示时长（毫秒）
+NOTIFICATION_MS = 5000
+# APK路径停止变化多久后开始预处理（毫秒），手动输入路径时不必每个字符都启动一次
+PREPARE_DELAY_MS = 300
 
 
 class APKResignGUI:
     def __init__(self, root):
         self.root = root
         self.root.title(f"APK重签名工具 v{VERSION}")
-        self.root.geometry("600x400")  # 调整大小适应新布局
+        self.root.geometry("800x600")  # 调整大小适应任务队列
         
         # 设置窗口图标
         self.set_window_icon()
@@ -47,15 +61,78 @@ class APKResignGUI:
         # 当前选中的签名配置
         self.current_profile = tk.StringVar(value="default")
         
-        # 用于进度更新的队列
-        self.progress_queue = queue.Queue()
+        # 并发任务数
+        self.max_workers = tk.IntVar(value=self.config_manager.get_max_workers())
+        
+        # 是否直接用java启动apksigner（跳过包装脚本并使用AppCDS归档）
+        self.direct_java = tk.BooleanVar(value=self.config_manager.get_direct_java())
+        
+        # 是否优先在进程内只替换v2签名块
+        self.block_signing = tk.BooleanVar(value=self.config_manager.get_block_signing())
+        
+        # 签名前重新打包（原生库不压缩并按页对齐）
+        self.repack_enabled = tk.BooleanVar(value=self.config_manager.get_repack_settings()["enabled"])
+        
+        # 输出文件命名模板
+        self.output_template = tk.StringVar(value=self.config_manager.get_output_template())
+        
+        # 根据任务日志跳过已完成的任务
+        self.resume = tk.BooleanVar(value=self.config_manager.get_resume())
+        
+        # 签名后按渠道列表生成渠道包
+        self.channels_enabled = tk.BooleanVar(value=self.config_manager.get_channels_enabled())
+        self.channel_file = tk.StringVar(value=self.config_manager.get_channel_file())
+        
+        # 签名时计算输出的校验和并写入校验清单
+        self.write_checksums = tk.BooleanVar(value=self.config_manager.get_write_checksums())
+        
+        # 批量签名任务队列，每个任务通过独立的进度通道向界面报告；任务日志写在APK所在目录
+        self.dispatcher = ProgressDispatcher(self.root, self.on_job_messages)
+        self.journals = JournalSet()
+        self.job_queue = JobQueue(self.dispatcher, self.max_workers.get(), self.journals)
+        self.job_queue.resume = self.resume.get()
+        self.batch_active = False
+        self.last_elapsed_refresh = 0.0
+        self.notification_after_id = None
+        
+        # 签名配置健康检查：启动时和配置变化时在后台进行，结果在主线程中每帧取出
+        self.profile_health = {}
+        self.profile_names = []
+        self.profile_health_results = queue.Queue()
+        self.health_checker = ProfileHealthChecker()
+        self.profiles_dialog = None
+        self.config_manager.add_profile_listener(self.check_profiles_health)
+        
+        # 选择APK后在后台预处理（工具检查、预热页缓存、解析中央目录、预先计算块摘要），结果在主线程中每帧取出
+        self.preparer = ApkPreparer()
+        self.prepare_results = queue.Queue()
+        self.prepare_after_id = None
         
         # 创建控件
         self.create_widgets()
         
         # 更新签名配置下拉菜单
+        self.current_profile.trace_add('write', self.refresh_profiles_combo)
+        self.apk_path.trace_add('write', self.on_apk_path_changed)
         self.update_profiles_list()
+        self.check_profiles_health()
+        
+        # 关闭窗口时保存任务日志
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # 启动进度分发
+        self.dispatcher.add_frame_callback(self.on_frame)
+        self.dispatcher.add_frame_callback(self.on_profile_health_frame)
+        self.dispatcher.add_frame_callback(self.on_prepare_frame)
+        self.dispatcher.start()
     
+    def on_close(self):
+        """关闭窗口前把任务日志写入磁盘"""
+        self.health_checker.shutdown()
+        self.preparer.shutdown()
+        self.journals.close()
+        self.root.destroy()
+
     def set_window_icon(self):
         """设置窗口图标"""
         import sys
@@ -78,6 +155,16 @@ class APKResignGUI:
 
     def save_config(self):
         """保存配置到文件"""
+        self.config_manager.set_max_workers(self.max_workers.get())
+        self.config_manager.set_direct_java(self.direct_java.get())
+        self.config_manager.set_block_signing(self.block_signing.get())
+        self.config_manager.set_output_template(self.output_template.get())
+        self.config_manager.set_repack_enabled(self.repack_enabled.get())
+        self.config_manager.set_resume(self.resume.get())
+        self.config_manager.set_channels_enabled(self.channels_enabled.get())
+        self.config_manager.set_channel_file(self.channel_file.get())
+        self.config_manager.set_write_checksums(self.write_checksums.get())
+        self.job_queue.resume = self.resume.get()
         self.config_manager.save_config(self.sdk_path.get())
 
     def create_widgets(self):
@@ -93,6 +180,7 @@ class APKResignGUI:
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(5, weight=1)
         
         # SDK路径选择
         ttk.Label(main_frame, text="Android SDK路径:").grid(row=1, column=0, sticky=tk.W, pady=(0, 5))
@@ -102,47 +190,165 @@ class APKResignGUI:
         
         # 签名配置选择
         ttk.Label(main_frame, text="签名配置:").grid(row=2, column=0, sticky=tk.W, pady=(0, 5))
-        self.profiles_combo = ttk.Combobox(main_frame, textvariable=self.current_profile, state="readonly", width=50)
+        self.profiles_combo = ttk.Combobox(main_frame, state="readonly", width=50)
         self.profiles_combo.grid(row=2, column=1, padx=(10, 0), pady=(0, 5))
+        self.profiles_combo.bind('<<ComboboxSelected>>', self.on_profile_selected)
         ttk.Button(main_frame, text="管理", command=self.manage_profiles).grid(row=2, column=2, padx=(10, 0), pady=(0, 5))
         
         # APK文件选择
         ttk.Label(main_frame, text="选择APK文件:").grid(row=3, column=0, sticky=tk.W, pady=(0, 5))
         apk_entry = ttk.Entry(main_frame, textvariable=self.apk_path, width=50)
         apk_entry.grid(row=3, column=1, padx=(10, 0), pady=(0, 5))
+        ttk.Button(main_frame, text="浏览", command=self.browse_apk).grid(row=3, column=2, padx=(10, 0), pady=(0, 5))
+        
+        # 并发数设置
+        ttk.Label(main_frame, text="并发任务数:").grid(row=4, column=0, sticky=tk.W, pady=(0, 5))
+        options_frame = ttk.Frame(main_frame)
+        options_frame.grid(row=4, column=1, columnspan=3, sticky=tk.W, padx=(10, 0), pady=(0, 5))
+        ttk.Spinbox(options_frame, from_=1, to=32, textvariable=self.max_workers, width=5).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="直接启动java运行apksigner（更快）",
+                        variable=self.direct_java, command=self.save_config).pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Checkbutton(options_frame, text="只替换v2签名块",
+                        variable=self.block_signing, command=self.save_config).pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Checkbutton(options_frame, text="原生库不压缩并按页对齐",
+                        variable=self.repack_enabled, command=self.save_config).pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Checkbutton(options_frame, text="跳过已完成的任务",
+                        variable=self.resume, command=self.save_config).pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Checkbutton(options_frame, text="生成校验清单",
+                        variable=self.write_checksums, command=self.save_config).pack(side=tk.LEFT, padx=(20, 0))
+        
+        self.max_workers.trace_add('write', self.on_max_workers_change)
+        
+        # 任务队列
+        queue_frame = ttk.Frame(main_frame)
+        queue_frame.grid(row=5, column=0, columnspan=4, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
+        queue_frame.columnconfigure(0, weight=1)
+        queue_frame.rowconfigure(0, weight=1)
+        
+        columns = ("file", "app", "status", "progress", "elapsed", "output")
+        self.job_tree = ttk.Treeview(queue_frame, columns=columns, show="headings", height=10)
+        self.job_tree.heading("file", text="APK文件")
+        self.job_tree.heading("app", text="包名/版本")
+        self.job_tree.heading("status", text="状态")
+        self.job_tree.heading("progress", text="进度")
+        self.job_tree.heading("elapsed", text="耗时")
+        self.job_tree.heading("output", text="输出路径")
+        self.job_tree.column("file", width=160)
+        self.job_tree.column("app", width=160)
+        self.job_tree.column("status", width=120)
+        self.job_tree.column("progress", width=60, anchor=tk.CENTER)
+        self.job_tree.column("elapsed", width=60, anchor=tk.CENTER)
+        self.job_tree.column("output", width=200)
+        tree_scrollbar = ttk.Scrollbar(queue_frame, orient="vertical", command=self.job_tree.yview)
+        self.job_tree.configure(yscrollcommand=tree_scrollbar.set)
+        self.job_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.job_tree.bind('<Double-1>', self.show_job_details)
+        tree_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
-        # 启用APK文件拖拽功能
+        # 启用APK文件和文件夹拖拽功能
         if TkinterDnD and hasattr(self.root, 'dnd_bind'):
-            # 注册拖拽目标
-            apk_entry.drop_target_register(DND_FILES)
-            # 绑定拖拽事件
-            apk_entry.dnd_bind('<<Drop>>', self.on_apk_drop)
-            
-        ttk.Button(main_frame, text="浏览", command=self.browse_apk).grid(row=3, column=2, padx=(10, 0), pady=(0, 5))
+            for widget in (apk_entry, self.job_tree):
+                # 注册拖拽目标
+                widget.drop_target_register(DND_FILES)
+                # 绑定拖拽事件
+                widget.dnd_bind('<<Drop>>', self.on_apk_drop)
+        
+        # 任务操作按钮
+        job_btn_frame = ttk.Frame(main_frame)
+        job_btn_frame.grid(row=6, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Button(job_btn_frame, text="取消所选", command=self.cancel_selected_jobs).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(job_btn_frame, text="重试所选", command=self.retry_selected_jobs).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(job_btn_frame, text="移除所选", command=self.remove_selected_jobs).pack(side=tk.LEFT, padx=(0, 5))
+        
+        # 输出文件命名模板
+        ttk.Label(main_frame, text="输出命名模板:").grid(row=7, column=0, sticky=tk.W, pady=(10, 0))
+        ttk.Entry(main_frame, textvariable=self.output_template, width=50).grid(row=7, column=1, padx=(10, 0), pady=(10, 0))
+        ttk.Label(main_frame, text="可用: {apk_name} {package} {versionName} {versionCode} {profile}",
+                  foreground="gray").grid(row=7, column=2, columnspan=2, sticky=tk.W, padx=(10, 0), pady=(10, 0))
+        
+        # 渠道列表
+        ttk.Label(main_frame, text="渠道列表:").grid(row=8, column=0, sticky=tk.W, pady=(5, 0))
+        ttk.Entry(main_frame, textvariable=self.channel_file, width=50).grid(row=8, column=1, padx=(10, 0), pady=(5, 0))
+        ttk.Button(main_frame, text="浏览", command=self.browse_channel_file).grid(row=8, column=2, padx=(10, 0), pady=(5, 0))
+        ttk.Checkbutton(main_frame, text="签名后生成渠道包", variable=self.channels_enabled,
+                        command=self.save_config).grid(row=8, column=3, sticky=tk.W, padx=(10, 0), pady=(5, 0))
         
         # 处理按钮
-        ttk.Button(main_frame, text="重签名APK", command=self.resign_apk).grid(row=8, column=0, columnspan=4, pady=(20, 0))
+        ttk.Button(main_frame, text="重签名APK", command=self.resign_apk).grid(row=9, column=0, columnspan=4, pady=(10, 0))
         
-        # 进度条
+        # 总进度条
         self.progress = ttk.Progressbar(main_frame, mode='determinate', length=400)
-        self.progress.grid(row=9, column=0, columnspan=4, sticky=(tk.W, tk.E), pady=(20, 0))
+        self.progress.grid(row=10, column=0, columnspan=4, sticky=(tk.W, tk.E), pady=(10, 0))
         
         # 状态标签
         self.status_label = ttk.Label(main_frame, text="就绪", foreground="blue")
-        self.status_label.grid(row=10, column=0, columnspan=4, pady=(10, 0))
+        self.status_label.grid(row=11, column=0, columnspan=4, pady=(10, 0))
+        
+        # 非模态通知，不阻塞界面
+        self.notification_label = ttk.Label(main_frame, text="")
+        self.notification_label.grid(row=12, column=0, columnspan=4, pady=(5, 0))
 
     def update_profiles_list(self):
         """更新签名配置列表"""
         profiles = list(self.config_manager.get_all_profiles().keys())
-        self.profiles_combo['values'] = profiles
-        if self.current_profile.get() in profiles:
-            self.profiles_combo.set(self.current_profile.get())
-        elif profiles:
+        if self.current_profile.get() not in profiles and profiles:
             self.current_profile.set(profiles[0])
+        self.refresh_profiles_combo()
+
+    def refresh_profiles_combo(self, *args):
+        """刷新签名配置下拉菜单，每个配置后显示检查状态"""
+        self.profile_names = list(self.config_manager.get_all_profiles().keys())
+        self.profiles_combo['values'] = [self.profile_label(name) for name in self.profile_names]
+        if self.current_profile.get() in self.profile_names:
+            self.profiles_combo.set(self.profile_label(self.current_profile.get()))
+
+    def profile_label(self, name):
+        """下拉菜单中显示的配置名称和检查状态"""
+        health = self.profile_health.get(name)
+        if health is None:
+            return name
+        return f"{name}    [{HEALTH_MARKS[health.status]}]"
+
+    def on_profile_selected(self, event):
+        """从下拉菜单选择签名配置"""
+        index = self.profiles_combo.current()
+        if 0 <= index < len(self.profile_names):
+            self.current_profile.set(self.profile_names[index])
+
+    def check_profiles_health(self):
+        """在后台检查所有签名配置，有缓存结果的配置立即显示"""
+        self.profile_health = self.health_checker.check_profiles(
+            self.config_manager.get_all_profiles(), self.on_profile_health)
+        self.refresh_profile_health()
+
+    def on_profile_health(self, name, fingerprint, health):
+        """签名配置检查完成（工作线程调用）"""
+        self.profile_health_results.put((name, fingerprint, health))
+
+    def on_profile_health_frame(self):
+        """每帧取出后台检查的结果"""
+        changed = False
+        while True:
+            try:
+                name, fingerprint, health = self.profile_health_results.get_nowait()
+            except queue.Empty:
+                break
+            # 检查期间配置又被修改时，旧的结果作废
+            if profile_fingerprint(self.config_manager.get_profile(name)) == fingerprint:
+                self.profile_health[name] = health
+                changed = True
+        if changed:
+            self.refresh_profile_health()
+
+    def refresh_profile_health(self):
+        """在下拉菜单和管理对话框中显示检查状态"""
+        self.refresh_profiles_combo()
+        if self.profiles_dialog is not None and self.profiles_dialog.dialog.winfo_exists():
+            self.profiles_dialog.refresh_health()
 
     def manage_profiles(self):
         """管理签名配置"""
-        ManageProfilesDialog(self.root, self)
+        self.profiles_dialog = ManageProfilesDialog(self.root, self)
 
     def browse_sdk(self):
         """打开文件对话框选择Android SDK目录"""
@@ -155,32 +361,172 @@ class APKResignGUI:
             # 立即保存配置
             self.save_config()
 
+    def browse_channel_file(self):
+        """打开文件对话框选择渠道列表文件"""
+        file_path = filedialog.askopenfilename(
+            title="选择渠道列表文件（每行一个渠道名）",
+            filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")]
+        )
+        if file_path:
+            self.channel_file.set(file_path)
+            self.channels_enabled.set(True)
+            self.save_config()
+
     def browse_apk(self):
-        """打开文件对话框选择APK文件"""
-        filename = filedialog.askopenfilename(
+        """打开文件对话框选择APK文件（可多选）"""
+        filenames = filedialog.askopenfilenames(
             title="选择APK文件",
             filetypes=[("APK文件", "*.apk"), ("所有文件", "*.*")]
         )
-        if filename:
-            self.apk_path.set(filename)
+        if filenames:
+            self.add_apk_files(self.root.tk.splitlist(filenames))
 
     def on_apk_drop(self, event):
-        """处理APK文件拖拽事件"""
+        """处理APK文件和文件夹拖拽事件"""
         # 获取拖拽的文件路径
         try:
-            # 处理可能包含花括号的路径
-            dropped_file = event.data.strip('{}')
-            # 检查文件扩展名
-            if dropped_file.lower().endswith('.apk'):
-                self.apk_path.set(dropped_file)
-            else:
-                messagebox.showerror("错误", "请选择有效的APK文件")
+            # splitlist会正确处理包含空格（被花括号包裹）的多个路径
+            dropped_paths = self.root.tk.splitlist(event.data)
+            if not collect_apk_paths(dropped_paths):
+                messagebox.showerror("错误", "请选择有效的APK文件或包含APK的文件夹")
+                return
+            self.add_apk_files(dropped_paths)
         except Exception as e:
             messagebox.showerror("错误", f"处理拖拽文件时出错: {str(e)}")
 
+    def on_apk_path_changed(self, *args):
+        """APK路径改变时取消上一次的预处理，路径稳定后开始新的预处理"""
+        self.preparer.cancel()
+        if self.prepare_after_id is not None:
+            self.root.after_cancel(self.prepare_after_id)
+        self.prepare_after_id = self.root.after(PREPARE_DELAY_MS, self.prepare_apk)
+
+    def prepare_apk(self):
+        """在后台预处理当前的APK"""
+        self.prepare_after_id = None
+        apk_path = self.apk_path.get()
+        if os.path.isfile(apk_path):
+            self.preparer.prepare(apk_path, self.create_processor(), self.repack_options(), self.on_apk_prepared)
+
+    def on_apk_prepared(self, apk_path, stats, error):
+        """预处理完成（工作线程调用）"""
+        self.prepare_results.put((apk_path, stats, error))
+
+    def on_prepare_frame(self):
+        """每帧取出预处理结果，只显示当前APK的结果，签名过程中不覆盖处理状态"""
+        while True:
+            try:
+                apk_path, stats, error = self.prepare_results.get_nowait()
+            except queue.Empty:
+                break
+            if apk_path != self.apk_path.get() or self.batch_active:
+                continue
+            if error:
+                self.status_label.config(text=f"预处理 {os.path.basename(apk_path)} 失败: {error}")
+            else:
+                self.status_label.config(text=format_prepare_stats(stats))
+
+    def create_processor(self):
+        """按当前设置创建SigningProcessor"""
+        return SigningProcessor(self.sdk_path.get(), use_direct_java=self.direct_java.get(),
+                                use_block_signing=self.block_signing.get(),
+                                write_checksums=self.write_checksums.get())
+
+    def repack_options(self):
+        """签名前重新打包的参数，未启用时返回None"""
+        repack_settings = self.config_manager.get_repack_settings()
+        if not repack_settings["enabled"]:
+            return None
+        return {
+            'page_size': repack_settings["page_size"],
+            'recompress_extensions': repack_settings["recompress_extensions"],
+            'compress_level': repack_settings["compress_level"]
+        }
+
+    def add_apk_files(self, paths):
+        """把文件和文件夹中的APK加入任务队列"""
+        apk_paths = collect_apk_paths(paths)
+        new_jobs = []
+        for apk_path in apk_paths:
+            job = self.job_queue.add_job(apk_path)
+            if job:
+                self.job_tree.insert("", tk.END, iid=str(job.job_id))
+                self.refresh_job_row(job)
+                new_jobs.append(job)
+        # 后台解析包名和版本用于显示
+        if new_jobs:
+            self.job_queue.load_metadata(new_jobs)
+        if apk_paths:
+            self.apk_path.set(apk_paths[-1])
+        return apk_paths
+
+    def on_max_workers_change(self, *args):
+        """并发数变化时更新任务队列"""
+        try:
+            max_workers = self.max_workers.get()
+        except tk.TclError:
+            # 输入过程中的非法值，忽略
+            return
+        if max_workers < 1:
+            return
+        self.job_queue.set_max_workers(max_workers)
+        self.save_config()
+
+    def selected_job_ids(self):
+        """获取任务列表中选中的任务ID"""
+        return [int(iid) for iid in self.job_tree.selection()]
+
+    def cancel_selected_jobs(self):
+        """取消选中的任务"""
+        for job_id in self.selected_job_ids():
+            self.job_queue.cancel(job_id)
+
+    def retry_selected_jobs(self):
+        """重试选中的失败或已取消任务"""
+        for job_id in self.selected_job_ids():
+            if self.job_queue.retry(job_id):
+                self.batch_active = True
+
+    def remove_selected_jobs(self):
+        """从队列中移除选中的任务（运行中的任务需先取消）"""
+        for job_id in self.selected_job_ids():
+            if self.job_queue.remove(job_id):
+                self.job_tree.delete(str(job_id))
+        self.update_overall_progress()
+
+    def refresh_job_row(self, job):
+        """刷新任务列表中的一行"""
+        iid = str(job.job_id)
+        if not self.job_tree.exists(iid):
+            return
+        status = job.status
+        if job.status == JOB_RUNNING and job.message:
+            status = job.message
+        elif job.status == JOB_FAILED:
+            status = f"{job.status}: {job.message}"
+        elapsed = f"{job.elapsed():.1f}s" if job.start_time is not None else ""
+        app = ""
+        if job.metadata:
+            app = f"{job.metadata.get('package', '')} {job.metadata.get('versionName', '')}".strip()
+        self.job_tree.item(iid, values=(os.path.basename(job.apk_path), app, status, f"{job.progress}%",
+                                        elapsed, job.output_path))
+
+    def update_overall_progress(self):
+        """根据所有任务更新总进度条和状态"""
+        jobs = list(self.job_queue.jobs.values())
+        if not jobs:
+            self.progress['value'] = 0
+            return
+        self.progress['value'] = sum(job.progress for job in jobs) / len(jobs)
+
     def resign_apk(self):
-        """处理APK重签名过程"""
-        if not self.apk_path.get():
+        """处理APK重签名过程，执行队列中所有等待的任务"""
+        # 手动输入的路径也加入队列
+        if self.apk_path.get() and not self.job_queue.find_job(self.apk_path.get()):
+            self.add_apk_files([self.apk_path.get()])
+        
+        pending_jobs = self.job_queue.pending_jobs()
+        if not pending_jobs:
             messagebox.showerror("错误", "请选择一个APK文件")
             return
             
@@ -205,53 +551,120 @@ class APKResignGUI:
             messagebox.showerror("错误", f"签名配置 '{profile_name}' 中未设置密钥别名 (alias)")
             return
         
+        # 渠道列表在提交任务前读取，格式错误时直接提示
+        channels = None
+        if self.channels_enabled.get():
+            try:
+                channels = load_channel_list(self.channel_file.get())
+            except (OSError, ValueError) as e:
+                messagebox.showerror("错误", f"无法读取渠道列表: {str(e)}")
+                return
+        
+        # 后台检查已确认配置不可用时直接提示，不必等到apksigner报错
+        health = self.health_checker.check_profiles({profile_name: profile}, self.on_profile_health)[profile_name]
+        if health.status == HEALTH_ERROR:
+            messagebox.showerror("错误", f"签名配置 '{profile_name}' 不可用: {health.message}")
+            return
+        
         # 保存配置
         self.save_config()
         
-        # 检查是否有必要的工具
-        processor = SigningProcessor(self.sdk_path.get())
+        # 检查是否有必要的工具（预处理时已检查过的直接使用缓存的结果）
+        processor = self.create_processor()
         tool_check_result = processor.check_tools()
         if not tool_check_result[0]:
             messagebox.showerror("错误", f"缺少必要的工具: {tool_check_result[1]}，请确保已安装Android SDK并在PATH中\n\n调试信息：{tool_check_result[2]}")
             return
         
-        # 开始处理
+        # 开始处理，未完成的预处理不再需要，签名时会自行完成同样的工作
+        self.preparer.cancel()
         self.status_label.config(text="正在处理...")
-        self.progress['value'] = 0  # 重置进度条
+        self.batch_active = True
         
-        # 在新线程中执行重签名
-        thread = threading.Thread(target=processor.perform_resign, 
-                                  args=(self.apk_path.get(), keystore_path, storepass, keypass, key_alias, self.progress_queue))
-        thread.daemon = True
-        thread.start()
+        signing_options = {'output_template': self.output_template.get(), 'profile_name': profile_name}
+        repack_options = self.repack_options()
+        if repack_options is not None:
+            signing_options['repack_options'] = repack_options
+        if channels:
+            signing_options['channels'] = channels
         
-        # 启动进度更新检查
-        self.check_progress()
+        # 提交到任务队列，由工作线程并发执行
+        for job in pending_jobs:
+            self.job_queue.submit(job, processor, (keystore_path, storepass, keypass, key_alias), signing_options)
     
-    def check_progress(self):
-        """检查进度更新"""
-        # 检查队列中的消息
-        try:
-            while True:
-                msg = self.progress_queue.get_nowait()
-                if msg['type'] == 'progress':
-                    self.progress['value'] = msg['value']
-                    self.status_label.config(text=msg.get('status', self.status_label.cget('text')))
-                elif msg['type'] == 'complete':
-                    self.progress['value'] = 100
-                    self.status_label.config(text="处理成功完成！")
-                    messagebox.showinfo("成功", f"APK重签名成功！\n已保存到: {msg['output_path']}")
-                    return
-                elif msg['type'] == 'error':
-                    self.progress['value'] = 0
-                    self.status_label.config(text="处理失败")
-                    messagebox.showerror("错误", msg['message'])
-                    return
-        except queue.Empty:
-            pass
-        
-        # 继续检查，除非我们收到了完成或错误消息
-        self.root.after(100, self.check_progress)
+    def on_job_messages(self, job_id, messages):
+        """处理一个任务在一帧内合并后的进度消息（主线程调用）"""
+        job = self.job_queue.jobs.get(job_id)
+        if job is None:
+            return
+        self.refresh_job_row(job)
+        for msg in messages:
+            name = os.path.basename(job.apk_path)
+            if msg['type'] == 'complete':
+                self.show_notification(f"{name} 重签名成功", "green")
+            elif msg['type'] == 'error':
+                self.show_notification(f"{name} 重签名失败，双击任务查看详情", "red")
+    
+    def on_frame(self):
+        """每帧刷新汇总信息"""
+        now = time.monotonic()
+        if now - self.last_elapsed_refresh >= ELAPSED_REFRESH_INTERVAL:
+            self.last_elapsed_refresh = now
+            # 刷新运行中任务的耗时
+            for job in list(self.job_queue.jobs.values()):
+                if job.status == JOB_RUNNING:
+                    self.refresh_job_row(job)
+            self.update_overall_progress()
+        
+        # 整批任务结束后汇总提示
+        if self.batch_active and not self.job_queue.is_busy():
+            self.batch_active = False
+            self.update_overall_progress()
+            self.on_batch_finished()
+    
+    def on_batch_finished(self):
+        """整批任务结束时显示汇总结果"""
+        jobs = list(self.job_queue.jobs.values())
+        failed = [job for job in jobs if job.status == JOB_FAILED]
+        cancelled = [job for job in jobs if job.status == JOB_CANCELLED]
+        if failed:
+            self.status_label.config(text=f"处理完成，{len(failed)} 个任务失败")
+            self.show_notification(f"{len(failed)} 个APK重签名失败，双击任务查看详情", "red")
+        elif cancelled:
+            self.status_label.config(text=f"处理完成，{len(cancelled)} 个任务已取消")
+        else:
+            self.status_label.config(text="处理成功完成！")
+            self.show_notification(f"全部APK重签名成功！共 {len(jobs)} 个", "green")
+    
+    def show_notification(self, text, color="blue"):
+        """显示非模态通知，一段时间后自动清除"""
+        self.notification_label.config(text=text, foreground=color)
+        if self.notification_after_id:
+            self.root.after_cancel(self.notification_after_id)
+        self.notification_after_id = self.root.after(NOTIFICATION_MS, self.clear_notification)
+    
+    def clear_notification(self):
+        """清除通知"""
+        self.notification_after_id = None
+        self.notification_label.config(text="")
+    
+    def show_job_details(self, event):
+        """双击任务时显示详情"""
+        iid = self.job_tree.identify_row(event.y)
+        if not iid:
+            return
+        job = self.job_queue.jobs.get(int(iid))
+        if job is None:
+            return
+        details = f"APK: {job.apk_path}\n状态: {job.status}\n耗时: {job.elapsed():.1f}s"
+        if job.output_path:
+            details += f"\n输出: {job.output_path}"
+        if job.message:
+            details += f"\n信息: {job.message}"
+        if job.status == JOB_FAILED:
+            messagebox.showerror("任务详情", details)
+        else:
+            messagebox.showinfo("任务详情", details)
 
 
 def main():
@@ -7,6 +7,8 @@ import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 
+from profile_health import HEALTH_COLORS
+
 
 class ManageProfilesDialog:
     def __init__(self, parent, app):
@@ -76,6 +78,10 @@ class ManageProfilesDialog:
         # 绑定选择事件
         self.listbox.bind('<<ListboxSelect>>', self.on_select_profile)
         
+        # 选中配置的检查结果
+        self.health_label = ttk.Label(main_frame, text="", wraplength=500)
+        self.health_label.pack(anchor=tk.W, pady=(0, 10))
+        
         # 编辑区域
         edit_frame = ttk.LabelFrame(main_frame, text="编辑配置", padding="10")
         edit_frame.pack(fill=tk.X, pady=(0, 10))
@@ -184,6 +190,23 @@ class ManageProfilesDialog:
         profiles = list(self.app.config_manager.get_all_profiles().keys())
         for profile in profiles:
             self.listbox.insert(tk.END, profile)
+        self.refresh_health()
+    
+    def refresh_health(self):
+        """按检查状态为配置着色，并显示选中配置的检查结果"""
+        for i in range(self.listbox.size()):
+            health = self.app.profile_health.get(self.listbox.get(i))
+            if health is not None:
+                self.listbox.itemconfig(i, foreground=HEALTH_COLORS[health.status])
+        self.show_profile_health(self.selected_profile)
+    
+    def show_profile_health(self, profile_name):
+        """显示配置的检查结果"""
+        health = self.app.profile_health.get(profile_name) if profile_name else None
+        if health is None:
+            self.health_label.config(text="")
+        else:
+            self.health_label.config(text=f"检查结果: {health.message}", foreground=HEALTH_COLORS[health.status])
     
     def highlight_current_profile(self):
         """高亮显示当前选中的配置"""
@@ -217,6 +240,7 @@ class ManageProfilesDialog:
         self.alias_var.set(profile.get("key_alias", ""))
         self.storepass_var.set(profile.get("storepass", ""))
         self.keypass_var.set(profile.get("keypass", ""))
+        self.show_profile_health(profile_name)
     
     def browse_keystore(self):
         """浏览密钥库文件"""
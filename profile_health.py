@@ -0,0 +1,293 @@
+"""
+签名配置健康检查模块
+启动时和签名配置变化时在后台检查每个配置：密钥库是否存在、能否打开、别名是否存在、证书是否过期，
+结果按密钥库修改时间缓存，密钥库和配置都没有变化时不再重复检查
+"""
+
+import os
+import json
+import time
+import shutil
+import calendar
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_signing_block import load_signer, UnsupportedKeystoreError
+from signing_processor import SigningProcessor
+
+try:
+    from cryptography import x509
+except ImportError:
+    x509 = None
+
+
+# 检查结果缓存文件
+HEALTH_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".apk_resign_gui", "profile_health.json")
+
+# 同时检查的配置数
+DEFAULT_MAX_WORKERS = 4
+
+# keytool的超时时间（秒）
+KEYTOOL_TIMEOUT = 30
+
+# 缓存最多保留的检查结果数，超出时丢弃最早的
+MAX_CACHE_ENTRIES = 256
+
+# 证书剩余有效期少于该天数时提示
+EXPIRY_WARNING_DAYS = 30
+
+# 检查状态
+HEALTH_CHECKING = "checking"
+HEALTH_OK = "ok"
+HEALTH_WARNING = "warning"
+HEALTH_ERROR = "error"
+HEALTH_UNKNOWN = "unknown"
+
+# 状态在下拉菜单中的简短标记
+HEALTH_MARKS = {
+    HEALTH_CHECKING: "检查中...",
+    HEALTH_OK: "✓ 正常",
+    HEALTH_WARNING: "⚠ 注意",
+    HEALTH_ERROR: "✗ 不可用",
+    HEALTH_UNKNOWN: "? 未检查",
+}
+
+# 状态显示颜色
+HEALTH_COLORS = {
+    HEALTH_CHECKING: "gray",
+    HEALTH_OK: "green",
+    HEALTH_WARNING: "orange",
+    HEALTH_ERROR: "red",
+    HEALTH_UNKNOWN: "gray",
+}
+
+ProfileHealth = namedtuple('ProfileHealth', ['status', 'message', 'not_after'])
+
+CHECKING = ProfileHealth(HEALTH_CHECKING, "正在检查签名配置...", None)
+
+
+def profile_fingerprint(profile):
+    """
+    配置的缓存键：密钥库路径、修改时间、大小以及别名和密码
+    密钥库不存在时返回None
+    """
+    keystore_path = profile.get("keystore_path", "")
+    try:
+        stat = os.stat(keystore_path)
+    except (OSError, ValueError):
+        return None
+    parts = [os.path.abspath(keystore_path), str(stat.st_mtime_ns), str(stat.st_size),
+             profile.get("key_alias", ""), profile.get("storepass", ""), profile.get("keypass", "")]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def find_keytool():
+    """查找keytool，优先使用与java同目录的"""
+    keytool_name = 'keytool.exe' if os.name == 'nt' else 'keytool'
+    java_cmd = SigningProcessor.find_java()
+    if java_cmd:
+        keytool_path = Path(java_cmd).resolve().parent / keytool_name
+        if keytool_path.is_file():
+            return str(keytool_path)
+    return shutil.which('keytool')
+
+
+def _not_after_timestamp(certificate):
+    """证书到期时间（时间戳）"""
+    not_after = getattr(certificate, 'not_valid_after_utc', None)
+    if not_after is None:
+        # 旧版本cryptography返回不带时区的UTC时间
+        return calendar.timegm(certificate.not_valid_after.timetuple())
+    return not_after.timestamp()
+
+
+def _check_with_keytool(keytool_cmd, keystore_path, storepass, key_alias):
+    """
+    用keytool导出证书，能导出说明密钥库能打开且别名存在
+    :return: 检查结果字典
+    """
+    result = subprocess.run(
+        [keytool_cmd, '-exportcert', '-rfc', '-keystore', keystore_path, '-storepass', storepass, '-alias', key_alias],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace', timeout=KEYTOOL_TIMEOUT,
+        check=False)
+    if result.returncode != 0:
+        lines = [line.strip() for line in (result.stdout + result.stderr).splitlines() if line.strip()]
+        return {'valid': False, 'message': lines[0] if lines else "keytool检查失败", 'not_after': None}
+    not_after = None
+    if x509 is not None:
+        try:
+            not_after = _not_after_timestamp(x509.load_pem_x509_certificate(result.stdout.encode('ascii', 'ignore')))
+        except ValueError:
+            pass
+    return {'valid': True, 'message': "", 'not_after': not_after}
+
+
+def check_profile(profile, keytool_cmd=None):
+    """
+    检查单个签名配置（在工作线程中调用，可能启动keytool）
+    :return: 检查结果字典 {'valid': 是否可用, 'message': 说明, 'not_after': 证书到期时间戳或None}，
+             无法检查时valid为None
+    """
+    keystore_path = profile.get("keystore_path", "")
+    storepass = profile.get("storepass", "")
+    keypass = profile.get("keypass", "") or storepass
+    key_alias = profile.get("key_alias", "")
+    if not keystore_path:
+        return {'valid': False, 'message': "未设置密钥库路径", 'not_after': None}
+    if not os.path.isfile(keystore_path):
+        return {'valid': False, 'message': f"密钥库不存在: {keystore_path}", 'not_after': None}
+    if not storepass:
+        return {'valid': False, 'message': "未设置密钥库密码", 'not_after': None}
+    if not key_alias:
+        return {'valid': False, 'message': "未设置密钥别名", 'not_after': None}
+
+    # PKCS12密钥库直接在进程内检查（同时验证密钥密码）。无法在进程内确认的密钥库（JKS/JCEKS、多条目、
+    # 别名与第一个条目不同）不算错误，交给keytool检查别名（keytool导出证书不需要密钥密码），没有keytool时为未知
+    try:
+        signer = load_signer(keystore_path, storepass, keypass, key_alias)
+        return {'valid': True, 'message': "", 'not_after': _not_after_timestamp(signer.certificates[0])}
+    except UnsupportedKeystoreError:
+        pass
+    except ValueError as e:
+        return {'valid': False, 'message': str(e), 'not_after': None}
+    except OSError as e:
+        return {'valid': False, 'message': f"无法读取密钥库: {str(e)}", 'not_after': None}
+
+    if keytool_cmd is None:
+        return {'valid': None, 'message': "未找到keytool，无法检查该密钥库", 'not_after': None}
+    try:
+        return _check_with_keytool(keytool_cmd, keystore_path, storepass, key_alias)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return {'valid': None, 'message': f"运行keytool失败: {str(e)}", 'not_after': None}
+
+
+def evaluate(result, now=None):
+    """
+    把检查结果转换为ProfileHealth；证书有效期按当前时间判断，因此缓存的结果不会过时
+    过期的证书仍然可以签名（Android不检查证书有效期），只作为提示
+    """
+    if result['valid'] is None:
+        return ProfileHealth(HEALTH_UNKNOWN, result['message'], None)
+    if not result['valid']:
+        return ProfileHealth(HEALTH_ERROR, result['message'], None)
+    not_after = result.get('not_after')
+    if not_after is not None:
+        days_left = (not_after - (now if now is not None else time.time())) / 86400
+        expiry = time.strftime('%Y-%m-%d', time.localtime(not_after))
+        if days_left < 0:
+            return ProfileHealth(HEALTH_WARNING, f"证书已于{expiry}过期", not_after)
+        if days_left < EXPIRY_WARNING_DAYS:
+            return ProfileHealth(HEALTH_WARNING, f"证书将于{expiry}过期（剩余{int(days_left)}天）", not_after)
+        return ProfileHealth(HEALTH_OK, f"密钥库和别名正常，证书有效期至{expiry}", not_after)
+    return ProfileHealth(HEALTH_OK, "密钥库和别名正常", None)
+
+
+class ProfileHealthChecker:
+    def __init__(self, cache_path=HEALTH_CACHE_PATH, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        后台并发检查签名配置，结果按配置指纹缓存到磁盘
+        :param cache_path: 缓存文件路径
+        :param max_workers: 同时检查的配置数
+        """
+        self.cache_path = cache_path
+        self._cache = self._load_cache()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # 指纹 -> 正在进行的检查，同一配置的重复请求共用一次检查
+        self._in_flight = {}
+        self._keytool_cmd = None
+        self._keytool_resolved = False
+
+    def _load_cache(self):
+        """读取缓存文件"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            return cache if isinstance(cache, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        """写入缓存文件（先写临时文件再替换）"""
+        with self._lock:
+            data = json.dumps(self._cache)
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"保存签名配置检查结果失败: {e}")
+
+    def _get_keytool(self):
+        """查找keytool（只查找一次）"""
+        with self._lock:
+            if not self._keytool_resolved:
+                self._keytool_cmd = find_keytool()
+                self._keytool_resolved = True
+            return self._keytool_cmd
+
+    def check_profiles(self, profiles, callback):
+        """
+        检查多个配置，不阻塞调用线程
+        :param profiles: {配置名称: 配置字典}
+        :param callback: callback(配置名称, 配置指纹, ProfileHealth)，需要后台检查的配置完成后在工作线程中调用，
+                         调用方可以用指纹判断结果是否对应当前的配置
+        :return: {配置名称: ProfileHealth}，有缓存的配置直接给出结果，其余为CHECKING
+        """
+        results = {}
+        for name, profile in profiles.items():
+            fingerprint = profile_fingerprint(profile)
+            if fingerprint is None:
+                # 密钥库不存在，无需后台检查
+                results[name] = evaluate(check_profile(profile))
+                continue
+            with self._lock:
+                cached = self._cache.get(fingerprint)
+                if cached is None:
+                    future = self._in_flight.get(fingerprint)
+                    if future is None:
+                        future = self._executor.submit(self._check, fingerprint, dict(profile))
+                        self._in_flight[fingerprint] = future
+            if cached is not None:
+                results[name] = evaluate(cached)
+                continue
+            results[name] = CHECKING
+            future.add_done_callback(lambda f, name=name, fingerprint=fingerprint:
+                                     self._report(f, name, fingerprint, callback))
+        return results
+
+    @staticmethod
+    def _report(future, name, fingerprint, callback):
+        """检查完成后通知调用方，被取消的检查不通知"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        callback(name, fingerprint, evaluate(future.result()))
+
+    def _check(self, fingerprint, profile):
+        """在工作线程中检查配置并缓存结果"""
+        try:
+            result = check_profile(profile, self._get_keytool())
+        except Exception as e:
+            result = {'valid': None, 'message': f"检查签名配置时出错: {str(e)}", 'not_after': None}
+        with self._lock:
+            # 无法检查的结果不缓存，下次重新尝试
+            if result['valid'] is not None:
+                result['checked'] = time.time()
+                self._cache[fingerprint] = result
+                if len(self._cache) > MAX_CACHE_ENTRIES:
+                    oldest = sorted(self._cache, key=lambda key: self._cache[key].get('checked', 0))
+                    for key in oldest[:len(self._cache) - MAX_CACHE_ENTRIES]:
+                        del self._cache[key]
+            self._in_flight.pop(fingerprint, None)
+        self._save_cache()
+        return result
+
+    def shutdown(self):
+        """停止后台检查"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
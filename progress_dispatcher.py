@@ -0,0 +1,118 @@
+"""
+进度分发模块
+为每个任务提供独立的进度通道，并在Tk主循环中按帧合并更新
+"""
+
+import threading
+from collections import OrderedDict
+
+
+# 有更新时的帧间隔（毫秒），约60帧每秒
+FRAME_MS = 16
+# 没有更新时的检查间隔（毫秒）
+IDLE_MS = 50
+# 每帧最多处理的任务数，剩余的任务留到下一帧
+MAX_JOBS_PER_FRAME = 500
+
+
+class ProgressChannel:
+    def __init__(self, job_id, dispatcher):
+        """
+        初始化任务进度通道
+        工作线程通过put发送与progress_queue相同格式的消息，连续的progress消息只保留最新一条
+        :param job_id: 任务ID
+        :param dispatcher: 所属的ProgressDispatcher
+        """
+        self.job_id = job_id
+        self.dispatcher = dispatcher
+        self._lock = threading.Lock()
+        self._progress = None
+        self._events = []
+
+    def put(self, msg):
+        """发送消息（线程安全，不会阻塞）"""
+        with self._lock:
+            if msg['type'] == 'progress':
+                self._progress = msg
+            else:
+                # complete/error/cancelled等结束类消息不能丢弃
+                self._events.append(msg)
+        self.dispatcher.mark_dirty(self)
+
+    def drain(self):
+        """取出自上一帧以来合并后的消息"""
+        with self._lock:
+            messages = []
+            if self._progress is not None:
+                messages.append(self._progress)
+            messages.extend(self._events)
+            self._progress = None
+            self._events = []
+        return messages
+
+
+class ProgressDispatcher:
+    def __init__(self, root, handler):
+        """
+        初始化进度分发器
+        :param root: Tk根窗口，用于after调度
+        :param handler: 主线程回调handler(job_id, messages)，每帧每个任务最多调用一次
+        """
+        self.root = root
+        self.handler = handler
+        self.channels = {}
+        self._dirty = OrderedDict()
+        self._lock = threading.Lock()
+        self._frame_callbacks = []
+
+    def channel(self, job_id):
+        """获取（必要时创建）任务的进度通道"""
+        with self._lock:
+            channel = self.channels.get(job_id)
+            if channel is None:
+                channel = ProgressChannel(job_id, self)
+                self.channels[job_id] = channel
+            return channel
+
+    def remove_channel(self, job_id):
+        """移除任务的进度通道"""
+        with self._lock:
+            self.channels.pop(job_id, None)
+            self._dirty.pop(job_id, None)
+
+    def mark_dirty(self, channel):
+        """标记通道有待处理的更新"""
+        with self._lock:
+            self._dirty[channel.job_id] = channel
+
+    def add_frame_callback(self, callback):
+        """注册每帧结束后调用的回调，用于刷新耗时、总进度等汇总信息"""
+        self._frame_callbacks.append(callback)
+
+    def start(self):
+        """开始在Tk主循环中分发更新"""
+        self.root.after(IDLE_MS, self._on_frame)
+
+    def _on_frame(self):
+        """处理一帧内的所有合并更新"""
+        with self._lock:
+            batch = []
+            while self._dirty and len(batch) < MAX_JOBS_PER_FRAME:
+                batch.append(self._dirty.popitem(last=False)[1])
+            backlog = bool(self._dirty)
+
+        for channel in batch:
+            messages = channel.drain()
+            if messages:
+                try:
+                    self.handler(channel.job_id, messages)
+                except Exception as e:
+                    print(f"处理任务进度更新失败: {e}")
+
+        for callback in self._frame_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"刷新界面失败: {e}")
+
+        self.root.after(FRAME_MS if batch or backlog else IDLE_MS, self._on_frame)
@@ -4,26 +4,87 @@
 """
 
 import os
+import re
+import signal
 import subprocess
 import tempfile
 import shutil
+import threading
+import time
+import hashlib
 from pathlib import Path
 import queue
 
+from apk_metadata import resolve_output_name
+from apk_repack import repack_apk, DEFAULT_PAGE_SIZE
+from apk_zip import ApkZipReader, ApkFormatError
+from apk_signing_block import (load_signer, sign_apk_v2, block_signing_unsupported_reason, find_signing_block,
+                               UnsupportedKeystoreError, OperationCancelled)
+from apk_digest_cache import ChunkDigestCache
+from apk_pipeline import stream_sign_apk, rewrite_reason
+from apk_channel import write_channel_apks
+from apk_checksum import MultiHasher, hash_file, apk_signer_sha256, checksum_record, append_manifest
+
+# 复制文件时的块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# AppCDS归档缓存目录
+CDS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".apk_resign_gui", "cds")
+
+# 直接启动java时使用的JVM参数，apksigner是短生命周期进程，优先减少启动开销
+JAVA_STARTUP_FLAGS = ['-XX:+UseSerialGC', '-XX:-UsePerfData', '-Xshare:auto']
+
+# 支持-XX:ArchiveClassesAtExit动态归档的最低JDK版本
+CDS_DYNAMIC_ARCHIVE_MIN_JAVA = 13
+
 
 class SigningProcessor:
-    def __init__(self, sdk_path):
+    # java可执行文件 -> 主版本号，所有实例共享
+    _java_versions = {}
+    _java_versions_lock = threading.Lock()
+    # 块摘要缓存，所有实例共享
+    _digest_cache = ChunkDigestCache()
+    # (SDK路径, 环境变量) -> (检查结果, apksigner命令, zipalign命令)，只缓存成功的结果，所有实例共享
+    _tool_checks = {}
+    _tool_checks_lock = threading.Lock()
+
+    def __init__(self, sdk_path, use_direct_java=False, use_block_signing=False, write_checksums=False):
         """
         初始化签名处理器
         :param sdk_path: Android SDK路径
+        :param use_direct_java: 是否绕过apksigner包装脚本，直接用java启动lib/apksigner.jar
+        :param use_block_signing: 是否优先在进程内只替换v2签名块，不满足条件时回退到apksigner
+        :param write_checksums: 是否为每个输出计算校验和并追加到输出目录的校验清单（见apk_checksum）
         """
         self.sdk_path = sdk_path
+        self.use_direct_java = use_direct_java
+        self.use_block_signing = use_block_signing
+        self.write_checksums = write_checksums
         self.apksigner_cmd = None
         self.zipalign_cmd = None
         self.progress_queue = queue.Queue()
         
     def check_tools(self):
-        """检查是否有必要的工具"""
+        """
+        检查是否有必要的工具
+        成功的结果按SDK路径和环境变量缓存（查找PATH中的工具需要启动apksigner），缓存的工具文件不存在时重新检查
+        """
+        key = (self.sdk_path, os.environ.get('ANDROID_HOME'), os.environ.get('ANDROID_SDK_ROOT'),
+               os.environ.get('PATH'))
+        with self._tool_checks_lock:
+            cached = self._tool_checks.get(key)
+        if cached is not None and all(cmd is None or not os.path.isabs(cmd) or os.path.exists(cmd)
+                                      for cmd in cached[1:]):
+            result, self.apksigner_cmd, self.zipalign_cmd = cached
+            return result
+        result = self._find_tools()
+        if result[0]:
+            with self._tool_checks_lock:
+                self._tool_checks[key] = (result, self.apksigner_cmd, self.zipalign_cmd)
+        return result
+
+    def _find_tools(self):
+        """在SDK路径、环境变量和PATH中查找apksigner和zipalign"""
         try:
             # 初始化结果
             apksigner_available = False
@@ -175,62 +236,138 @@ class SigningProcessor:
         except Exception as e:
             return False, "未知错误", f"检查工具时出错: {str(e)}"
 
-    def perform_resign(self, apk_path, keystore_path, storepass, keypass, key_alias, progress_queue):
-        """执行APK重签名"""
+    def resolve_output_path(self, apk_path, output_template=None, profile_name=""):
+        """
+        根据命名模板生成输出路径（与原APK同目录）
+        :param apk_path: 输入APK路径
+        :param output_template: 命名模板，为空时使用 "{apk_name}_resigned.apk"
+        :param profile_name: 签名配置名称，对应模板中的{profile}
+        :raises ValueError: 模板字段不可用，或生成的文件名带有目录（输出只能写在输入APK所在目录）
+        """
+        output_name = resolve_output_name(apk_path, output_template, profile_name)
+        output_apk = os.path.join(os.path.dirname(apk_path), output_name)
+        if os.path.normcase(os.path.abspath(output_apk)) == os.path.normcase(os.path.abspath(apk_path)):
+            raise ValueError(f"输出文件名与输入APK相同: {output_name}")
+        return output_apk
+
+    def perform_resign(self, apk_path, keystore_path, storepass, keypass, key_alias, progress_queue,
+                       cancel_event=None, output_template=None, profile_name="", repack_options=None,
+                       channels=None):
+        """执行APK重签名
+
+        :param cancel_event: 可选的threading.Event，被设置时终止签名并发送cancelled消息
+        :param output_template: 输出文件命名模板，见apk_metadata.format_output_name
+        :param profile_name: 签名配置名称，用于命名模板
+        :param repack_options: 签名前重新打包的参数（见apk_repack.repack_apk），为None时不重新打包
+        :param channels: 可选的渠道名列表，签名完成后由签名后的APK生成渠道包（见apk_channel）
+        """
         # 发送初始进度
         progress_queue.put({'type': 'progress', 'value': 10, 'status': '准备重签名...'})
+        started = time.perf_counter()
+        # 进程内签名时在写出的同时计算输出的校验和
+        hasher = MultiHasher() if self.write_checksums else None
+
+        # 输出路径 - 在原APK同目录下按命名模板生成新的签名APK
+        try:
+            output_apk = self.resolve_output_path(apk_path, output_template, profile_name)
+        except Exception as e:
+            progress_queue.put({'type': 'error', 'message': f"生成输出文件名失败: {str(e)}"})
+            return
+
+        format_error = self.check_apk_format(apk_path)
+        if format_error:
+            progress_queue.put({'type': 'error', 'message': format_error})
+            return
+
+        # 可选：进程内只替换签名块，不复制临时文件也不启动apksigner
+        if self.use_block_signing and self.can_fuse_repack(repack_options):
+            progress_queue.put({'type': 'progress', 'value': 20, 'status': '计算v2签名摘要...'})
+            try:
+                block_stats, reason = self.block_sign(apk_path, output_apk, keystore_path, storepass, keypass,
+                                                      key_alias, cancel_event, repack_options, hasher)
+            except OperationCancelled:
+                progress_queue.put({'type': 'cancelled'})
+                return
+            except Exception as e:
+                progress_queue.put({'type': 'error', 'message': f"签名失败: {str(e)}"})
+                return
+            if block_stats is not None:
+                self._complete(progress_queue, apk_path, {
+                    'type': 'complete',
+                    'output_path': output_apk,
+                    'block_signing': block_stats
+                }, channels, cancel_event, hasher, started)
+                return
+            progress_queue.put({'type': 'progress', 'value': 10, 'status': f'改用apksigner签名: {reason}'})
 
         # 创建临时目录
         with tempfile.TemporaryDirectory() as temp_dir:
             # 复制原始APK到临时位置
             unsigned_apk = os.path.join(temp_dir, "unsigned.apk")
-            shutil.copy2(apk_path, unsigned_apk)
+            self._copy_with_progress(apk_path, unsigned_apk, progress_queue, 10, 20, cancel_event)
+
+            if cancel_event is not None and cancel_event.is_set():
+                progress_queue.put({'type': 'cancelled'})
+                return
+
+            # 可选：签名前重新打包（原生库按页对齐、重新压缩）
+            repack_stats = None
+            if repack_options is not None:
+                progress_queue.put({'type': 'progress', 'value': 20, 'status': '重新打包APK...'})
+                repacked_apk = os.path.join(temp_dir, "repacked.apk")
+                try:
+                    repack_stats = repack_apk(unsigned_apk, repacked_apk, **repack_options)
+                except Exception as e:
+                    progress_queue.put({'type': 'error', 'message': f"重新打包失败: {str(e)}"})
+                    return
+                unsigned_apk = repacked_apk
 
             # 发送进度更新
             progress_queue.put({'type': 'progress', 'value': 20, 'status': '准备签名文件...'})
 
-            # 输出路径 - 在原APK同目录下生成新的签名APK
-            original_dir = os.path.dirname(apk_path)
-            apk_name = os.path.splitext(os.path.basename(apk_path))[0]
-            output_apk = os.path.join(original_dir, f"{apk_name}_resigned.apk")
-
             # 使用apksigner进行签名
             try:
                 # 准备命令参数
-                cmd = [
-                    self.apksigner_cmd, 'sign',
-                    '--ks', keystore_path,
-                    '--ks-key-alias', key_alias,
-                    '--ks-pass', f'pass:{storepass}',
-                    '--key-pass', f'pass:{keypass}',
-                    '--out', output_apk,
-                    unsigned_apk
-                ]
+                cmd, shell, cds_pending = self.build_sign_command(
+                    keystore_path, storepass, keypass, key_alias, unsigned_apk, output_apk)
 
                 # 发送进度更新
                 progress_queue.put({'type': 'progress', 'value': 30, 'status': '开始签名过程...'})
 
                 # 执行签名命令
-                result = subprocess.run(cmd, check=False, capture_output=True, text=True, shell=(os.name == 'nt'))
-
-                if result.returncode != 0:
+                # 非Windows下放到独立的进程组中，取消时可以连同包装脚本启动的java一起结束
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                           text=True, shell=shell, start_new_session=(os.name != 'nt'))
+                while True:
+                    try:
+                        stdout, stderr = process.communicate(timeout=0.2)
+                        break
+                    except subprocess.TimeoutExpired:
+                        if cancel_event is not None and cancel_event.is_set():
+                            self._kill_process(process)
+                            self.finish_cds_archive(cds_pending, False)
+                            progress_queue.put({'type': 'cancelled'})
+                            return
+
+                # 首次直接启动时生成的AppCDS归档，签名成功后才启用
+                self.finish_cds_archive(cds_pending, process.returncode == 0)
+
+                if process.returncode != 0:
                     progress_queue.put({
                         'type': 'error',
-                        'message': f"签名失败: {result.stderr}"
+                        'message': f"签名失败: {stderr}"
                     })
                     return
 
                 # 检查输出文件是否存在
                 if os.path.exists(output_apk):
-                    # 发送完成前的进度更新
-                    progress_queue.put({'type': 'progress', 'value': 90, 'status': '完成...'})
                     # 稍微延迟以显示完成状态
-                    import time
                     time.sleep(0.2)
-                    progress_queue.put({
+                    self._complete(progress_queue, apk_path, {
                         'type': 'complete',
-                        'output_path': output_apk
-                    })
+                        'output_path': output_apk,
+                        'repack_stats': repack_stats
+                    }, channels, cancel_event, None, started)
                 else:
                     progress_queue.put({
                         'type': 'error',
@@ -241,4 +378,351 @@ class SigningProcessor:
                 progress_queue.put({
                     'type': 'error',
                     'message': f"签名过程中发生异常: {str(e)}"
-                })
\ No newline at end of file
+                })
+
+    def _complete(self, progress_queue, apk_path, message, channels, cancel_event, hasher=None, started=None):
+        """
+        签名完成：需要时先由签名后的APK生成渠道包、写入校验清单，再发送complete消息
+        校验和计算或写入失败时输出仍然是签好的，complete消息中带checksums_error说明
+        :param hasher: 写出输出时已计算的MultiHasher，为None时需要校验和则读取输出计算
+        """
+        output_apk = message['output_path']
+        try:
+            if self.write_checksums:
+                if hasher is None:
+                    progress_queue.put({'type': 'progress', 'value': 90, 'status': '计算校验和...'})
+                try:
+                    message['checksums'] = self.record_checksums(apk_path, output_apk, hasher, started,
+                                                                 cancel_event)
+                except (OSError, ApkFormatError) as e:
+                    message['checksums_error'] = f"校验和不可用: {str(e)}"
+            if channels:
+                def report(done, total):
+                    progress_queue.put({'type': 'progress', 'value': 90 + 9 * done // total,
+                                        'status': f'生成渠道包 {done}/{total}...'})
+
+                progress_queue.put({'type': 'progress', 'value': 90, 'status': f'生成{len(channels)}个渠道包...'})
+                try:
+                    message['channel_stats'] = self.write_channels(apk_path, output_apk, channels, started,
+                                                                   cancel_event, report)
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    progress_queue.put({'type': 'error', 'message': f"签名成功，但生成渠道包失败: {str(e)}"})
+                    return
+        except OperationCancelled:
+            progress_queue.put({'type': 'cancelled'})
+            return
+        if not channels:
+            progress_queue.put({'type': 'progress', 'value': 90, 'status': '完成...'})
+        progress_queue.put(message)
+
+    def record_checksums(self, apk_path, output_apk, hasher=None, started=None, cancel_event=None):
+        """
+        把输出APK的校验和追加到输出目录的校验清单
+        :param hasher: 写出输出时已计算的MultiHasher，为None时读取输出计算
+        :param started: 开始签名时的time.perf_counter()，用于记录耗时
+        :return: 清单记录
+        :raises ApkFormatError: 无法从输出中读取签名块
+        """
+        elapsed = time.perf_counter() - started if started is not None else None
+        if hasher is None:
+            hasher = hash_file(output_apk, cancel_event=cancel_event)
+        record = checksum_record(output_apk, hasher, apk_signer_sha256(output_apk), apk_path, elapsed)
+        append_manifest(record)
+        return record
+
+    def write_channels(self, apk_path, output_apk, channels, started=None, cancel_event=None, progress_callback=None):
+        """
+        由签名后的APK生成渠道包，需要时把各渠道包的校验和追加到渠道包目录的校验清单
+        :return: write_channel_apks的统计信息（不含哈希状态）
+        """
+        stats = write_channel_apks(output_apk, channels, cancel_event=cancel_event,
+                                   progress_callback=progress_callback, checksums=self.write_checksums)
+        hashers = stats.pop('hashers', None)
+        if hashers:
+            elapsed = time.perf_counter() - started if started is not None else None
+            for channel, hasher in hashers.items():
+                append_manifest(checksum_record(stats['outputs'][channel], hasher, stats['signer_sha256'],
+                                                apk_path, elapsed, channel))
+        return stats
+
+    @staticmethod
+    def check_apk_format(apk_path):
+        """
+        签名前检查ZIP结构（只读取EOCD），提前给出明确的错误，而不是在复制和启动apksigner之后才失败
+        :return: 错误信息，没有问题时返回None
+        """
+        try:
+            with ApkZipReader(apk_path) as reader:
+                zip64 = reader.eocd.zip64
+        except (ApkFormatError, OSError) as e:
+            return f"APK文件格式错误: {str(e)}"
+        if zip64:
+            return "APK为ZIP64格式（超过4GB或65535个条目），Android和apksigner都不支持，请把大资源拆分到资源包中"
+        return None
+
+    @staticmethod
+    def can_fuse_repack(repack_options):
+        """
+        重新打包能否合并到进程内签名的单次流水线中：原生库按页对齐可以边读边做，
+        重新压缩需要先得到压缩后的长度，仍然先重新打包再交给apksigner
+        """
+        return repack_options is None or not repack_options.get('recompress_extensions')
+
+    def block_sign(self, input_apk, output_apk, keystore_path, storepass, keypass, key_alias, cancel_event=None,
+                   repack_options=None, hasher=None):
+        """
+        进程内v2签名：条目区可以原样保留时由内核直接复制，只生成新的签名块和中央目录偏移；
+        有v1签名文件、条目未对齐或需要按页对齐原生库时，用单次流水线重写条目区并同时计算摘要
+        :param repack_options: 可以合并的重新打包参数（见can_fuse_repack），为None时不重新打包
+        :param hasher: 可选的apk_checksum.MultiHasher，在写出的同时计算输出的校验和
+        :return: (统计信息, None)；APK或密钥库不满足条件时返回(None, 原因)，调用方应改用apksigner
+        :raises OperationCancelled: cancel_event被设置
+        """
+        page_size = (repack_options or {}).get('page_size', DEFAULT_PAGE_SIZE)
+        with ApkZipReader(input_apk) as reader:
+            reason = block_signing_unsupported_reason(reader)
+            rewrite = reason is None and (repack_options is not None or rewrite_reason(reader.index(), page_size))
+        if reason:
+            return None, reason
+        try:
+            signer = load_signer(keystore_path, storepass, keypass, key_alias)
+        except UnsupportedKeystoreError as e:
+            return None, str(e)
+        try:
+            if rewrite:
+                page_align_native_libs = (repack_options is not None
+                                          and repack_options.get('page_align_native_libs', True))
+                return stream_sign_apk(input_apk, output_apk, signer, cancel_event,
+                                       page_align_native_libs=page_align_native_libs, page_size=page_size,
+                                       hasher=hasher), None
+            return sign_apk_v2(input_apk, output_apk, signer, cancel_event, digest_cache=self._digest_cache,
+                               hasher=hasher), None
+        except BaseException:
+            # 不留下不完整的输出
+            if os.path.exists(output_apk):
+                os.remove(output_apk)
+            raise
+
+    def precompute_digests(self, apk_path, repack_options=None, cancel_event=None):
+        """
+        开始签名前计算与密钥无关的条目区块摘要并存入块摘要缓存，之后block_sign只需计算变化的块和生成签名
+        只在进程内签名会原样保留条目区时计算（与block_sign的判断相同），流水线重写和apksigner签名不使用块摘要
+        :return: (统计信息, None)；不需要预先计算时返回(None, 原因)
+        :raises OperationCancelled: cancel_event被设置
+        """
+        if not self.use_block_signing:
+            return None, "未启用进程内签名"
+        page_size = (repack_options or {}).get('page_size', DEFAULT_PAGE_SIZE)
+        with ApkZipReader(apk_path) as reader:
+            reason = block_signing_unsupported_reason(reader)
+            if reason is None and (repack_options is not None or rewrite_reason(reader.index(), page_size)):
+                reason = "需要重写条目区"
+            if reason:
+                return None, reason
+            # 条目区到签名块（没有签名块时到中央目录）为止，与sign_apk_v2相同
+            block_offset, _ = find_signing_block(reader.buf, reader.eocd)
+            entries_end = reader.eocd.cd_offset if block_offset is None else block_offset
+            return self._digest_cache.precompute(apk_path, reader, entries_end, cancel_event), None
+
+    def find_apksigner_jar(self):
+        """查找与apksigner包装脚本同目录的lib/apksigner.jar，找不到时返回None"""
+        if not self.apksigner_cmd:
+            return None
+        apksigner_path = Path(self.apksigner_cmd)
+        if not apksigner_path.is_absolute():
+            resolved = shutil.which(self.apksigner_cmd)
+            if not resolved:
+                return None
+            apksigner_path = Path(resolved)
+        jar_path = apksigner_path.resolve().parent / 'lib' / 'apksigner.jar'
+        return jar_path if jar_path.is_file() else None
+
+    @staticmethod
+    def find_java():
+        """查找java可执行文件，优先使用JAVA_HOME"""
+        java_name = 'java.exe' if os.name == 'nt' else 'java'
+        java_home = os.environ.get('JAVA_HOME')
+        if java_home:
+            java_path = Path(java_home) / 'bin' / java_name
+            if java_path.is_file():
+                return str(java_path)
+        return shutil.which('java')
+
+    @classmethod
+    def get_java_major_version(cls, java_cmd):
+        """获取java主版本号（结果缓存），失败时返回0"""
+        with cls._java_versions_lock:
+            if java_cmd in cls._java_versions:
+                return cls._java_versions[java_cmd]
+        major = 0
+        try:
+            result = subprocess.run([java_cmd, '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    text=True, check=False)
+            match = re.search(r'version "(\d+)(?:\.(\d+))?', result.stderr)
+            if match:
+                major = int(match.group(1))
+                # 1.8 这类旧格式
+                if major == 1 and match.group(2):
+                    major = int(match.group(2))
+        except Exception:
+            pass
+        with cls._java_versions_lock:
+            cls._java_versions[java_cmd] = major
+        return major
+
+    def get_cds_archive_path(self, java_cmd, jar_path):
+        """
+        获取AppCDS归档路径，按build-tools版本和JDK区分
+        :param java_cmd: java可执行文件
+        :param jar_path: apksigner.jar路径
+        """
+        build_tools_version = jar_path.parent.parent.name
+        java_stat = os.stat(java_cmd)
+        java_key = hashlib.sha1(f"{os.path.realpath(java_cmd)}|{java_stat.st_mtime_ns}".encode('utf-8')).hexdigest()[:12]
+        return os.path.join(CDS_CACHE_DIR, f"apksigner-{build_tools_version}-{java_key}.jsa")
+
+    def get_apksigner_command(self):
+        """
+        获取启动apksigner的命令前缀
+        :return: (命令列表, 是否使用shell, 待提交的CDS归档(临时路径, 最终路径)或None)
+        """
+        wrapper = ([self.apksigner_cmd], os.name == 'nt', None)
+        if not self.use_direct_java:
+            return wrapper
+
+        jar_path = self.find_apksigner_jar()
+        java_cmd = self.find_java()
+        if jar_path is None or java_cmd is None:
+            # 没有jar或JDK（例如测试用的替身脚本），回退到包装脚本
+            return wrapper
+
+        cmd = [java_cmd] + JAVA_STARTUP_FLAGS
+        cds_pending = None
+        if self.get_java_major_version(java_cmd) >= CDS_DYNAMIC_ARCHIVE_MIN_JAVA:
+            archive_path = self.get_cds_archive_path(java_cmd, jar_path)
+            if os.path.exists(archive_path):
+                cmd.append(f'-XX:SharedArchiveFile={archive_path}')
+            else:
+                # 首次使用：退出时把加载过的类写入临时归档，签名成功后再替换为正式归档
+                os.makedirs(CDS_CACHE_DIR, exist_ok=True)
+                temp_archive = f"{archive_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                cmd.append(f'-XX:ArchiveClassesAtExit={temp_archive}')
+                cds_pending = (temp_archive, archive_path)
+        cmd += ['-jar', str(jar_path)]
+        return cmd, False, cds_pending
+
+    def build_sign_command(self, keystore_path, storepass, keypass, key_alias, input_apk, output_apk):
+        """
+        生成apksigner sign命令
+        :return: (命令列表, 是否使用shell, 待提交的CDS归档或None)，见get_apksigner_command
+        """
+        apksigner_cmd, shell, cds_pending = self.get_apksigner_command()
+        cmd = apksigner_cmd + [
+            'sign',
+            '--ks', keystore_path,
+            '--ks-key-alias', key_alias,
+            '--ks-pass', f'pass:{storepass}',
+            '--key-pass', f'pass:{keypass}',
+            '--out', output_apk,
+            input_apk
+        ]
+        return cmd, shell, cds_pending
+
+    @staticmethod
+    def finish_cds_archive(cds_pending, success):
+        """
+        处理首次运行生成的CDS归档：成功时启用（并发生成时以最后完成的为准），失败时删除
+        :param cds_pending: get_apksigner_command返回的(临时路径, 最终路径)或None
+        :param success: apksigner是否运行成功
+        """
+        if not cds_pending:
+            return
+        temp_archive, archive_path = cds_pending
+        try:
+            if success and os.path.exists(temp_archive):
+                os.replace(temp_archive, archive_path)
+                return
+        except OSError:
+            pass
+        try:
+            os.remove(temp_archive)
+        except OSError:
+            pass
+
+    def measure_launch_overhead(self, runs=5):
+        """
+        测量apksigner每次启动的开销（运行--version的平均耗时）
+        分别测量包装脚本和直接启动java两种方式，便于对比优化前后的效果
+        CDS归档只由真实签名生成，这里不会用--version的运行结果生成归档
+        :param runs: 每种方式的运行次数
+        :return: {'wrapper': 秒, 'direct': 秒或None, 'cds': 直接启动时是否使用了CDS归档}
+        """
+        results = {}
+        original = self.use_direct_java
+        try:
+            for mode, use_direct_java in (('wrapper', False), ('direct', True)):
+                self.use_direct_java = use_direct_java
+                if use_direct_java and (self.find_apksigner_jar() is None or self.find_java() is None):
+                    results[mode] = None
+                    continue
+                cmd, shell, cds_pending = self.get_apksigner_command()
+                if cds_pending:
+                    cmd = [arg for arg in cmd if not arg.startswith('-XX:ArchiveClassesAtExit=')]
+                if use_direct_java:
+                    results['cds'] = any(arg.startswith('-XX:SharedArchiveFile=') for arg in cmd)
+                # 预热一次，排除首次读取文件的影响
+                subprocess.run(cmd + ['--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=shell, check=False)
+                start = time.perf_counter()
+                for _ in range(runs):
+                    subprocess.run(cmd + ['--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=shell, check=False)
+                results[mode] = (time.perf_counter() - start) / runs
+        finally:
+            self.use_direct_java = original
+        return results
+
+    @staticmethod
+    def _copy_with_progress(src, dst, progress_queue, start_value, end_value, cancel_event=None):
+        """按块复制文件，并按已复制的字节数发送进度"""
+        total = os.path.getsize(src)
+        copied = 0
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                chunk = fsrc.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                fdst.write(chunk)
+                copied += len(chunk)
+                value = start_value + (end_value - start_value) * copied // max(total, 1)
+                progress_queue.put({
+                    'type': 'progress',
+                    'value': value,
+                    'status': f'复制APK... {copied // 1024}/{total // 1024} KB',
+                    'bytes_done': copied,
+                    'bytes_total': total
+                })
+        shutil.copystat(src, dst)
+
+    @staticmethod
+    def _kill_process_tree(pid):
+        """结束进程及其子进程（Windows下通过taskkill，其他系统结束整个进程组）"""
+        try:
+            if os.name == 'nt':
+                subprocess.run(['taskkill', '/F', '/T', '/PID', str(pid)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+            else:
+                os.killpg(pid, signal.SIGKILL)
+        except Exception:
+            pass
+
+    @classmethod
+    def _kill_process(cls, process):
+        """终止签名进程"""
+        cls._kill_process_tree(process.pid)
+        try:
+            process.communicate()
+        except Exception:
+            pass
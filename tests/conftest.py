@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from helpers import make_keystore, STOREPASS, KEY_ALIAS  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def keystore(tmp_path_factory):
+    """(密钥库路径, 证书DER)"""
+    path = str(tmp_path_factory.mktemp('keystore') / 'release.p12')
+    return path, make_keystore(path)
+
+
+@pytest.fixture
+def profile(keystore):
+    """使用测试密钥库的签名配置"""
+    return {'keystore_path': keystore[0], 'storepass': STOREPASS, 'keypass': STOREPASS, 'key_alias': KEY_ALIAS}
+
+
+@pytest.fixture(autouse=True)
+def digest_cache(tmp_path, monkeypatch):
+    """块摘要缓存写到临时目录，不影响用户目录"""
+    from signing_processor import SigningProcessor
+    from apk_digest_cache import ChunkDigestCache
+    cache = ChunkDigestCache(str(tmp_path / 'digests'))
+    monkeypatch.setattr(SigningProcessor, '_digest_cache', cache)
+    return cache
@@ -0,0 +1,177 @@
+"""
+测试辅助：生成测试用APK和PKCS12密钥库，并独立于被测代码校验v2签名
+"""
+
+import os
+import struct
+import hashlib
+import zipfile
+import datetime
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+STOREPASS = "secret"
+KEY_ALIAS = "mykey"
+
+V2_BLOCK_ID = 0x7109871a
+CHUNK = 1024 * 1024
+
+
+def _axml(package, version_code=42, version_name='1.2.3', min_sdk=24):
+    """最小的二进制AndroidManifest.xml：<manifest package versionCode versionName><uses-sdk minSdkVersion>"""
+    strings = ['versionCode', 'versionName', 'minSdkVersion', 'android', 'http://schemas.android.com/apk/res/android',
+               'package', 'manifest', 'uses-sdk', version_name, package]
+    body = b''
+    offsets = []
+    for text in strings:
+        offsets.append(len(body))
+        data = text.encode('utf-8')
+        body += bytes([len(text), len(data)]) + data + b'\0'
+    while len(body) % 4:
+        body += b'\0'
+    start = 28 + 4 * len(strings)
+    pool = (struct.pack('<HHIIIIII', 1, 28, start + len(body), len(strings), 0, 0x100, start, 0)
+            + struct.pack(f'<{len(strings)}I', *offsets) + body)
+    resource_map = struct.pack('<HHI', 0x180, 8, 8 + 12) + struct.pack('<3I', 0x0101021b, 0x0101021c, 0x0101020c)
+
+    def element(name, attrs):
+        data = b''.join(struct.pack('<IIIHBBI', ns, attr_name, raw, 8, 0, data_type, value)
+                        for ns, attr_name, raw, data_type, value in attrs)
+        return (struct.pack('<HHIII', 0x102, 16, 16 + 20 + len(data), 1, 0xFFFFFFFF)
+                + struct.pack('<IIHHHHHH', 0xFFFFFFFF, name, 20, 20, len(attrs), 0, 0, 0) + data)
+
+    none = 0xFFFFFFFF
+    manifest = element(6, [(none, 5, 9, 3, 9), (4, 0, none, 0x10, version_code), (4, 1, 8, 3, 8)])
+    uses_sdk = element(7, [(4, 2, none, 0x10, min_sdk)])
+    content = pool + resource_map + manifest + uses_sdk
+    return struct.pack('<HHI', 3, 8, 8 + len(content)) + content
+
+
+def make_apk(path, package='com.example.app', payload_size=3 * CHUNK):
+    """生成未签名的测试APK，条目不压缩且不对齐，带一个跨越多个1MB块的条目"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('AndroidManifest.xml', _axml(package))
+        z.writestr('classes.dex', os.urandom(1000))
+        z.writestr(zipfile.ZipInfo('assets/payload.bin'), os.urandom(payload_size), zipfile.ZIP_STORED)
+    return path
+
+
+def make_keystore(path, storepass=STOREPASS, alias=KEY_ALIAS, extra_aliases=()):
+    """
+    生成PKCS12密钥库（RSA 2048，自签名证书）
+    :param alias: 别名，为None时生成没有别名的密钥库
+    :param extra_aliases: 额外的别名，不为空时生成多条目密钥库
+    :return: 第一个证书的DER
+    """
+    def key_and_cert(name):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (x509.CertificateBuilder().subject_name(subject).issuer_name(subject).public_key(key.public_key())
+                .serial_number(x509.random_serial_number()).not_valid_before(now - datetime.timedelta(days=1))
+                .not_valid_after(now + datetime.timedelta(days=365)).sign(key, hashes.SHA256()))
+        return key, cert
+
+    key, cert = key_and_cert(alias or 'key')
+    name = alias.encode('utf-8') if alias else None
+    encryption = serialization.BestAvailableEncryption(storepass.encode('utf-8'))
+    if not extra_aliases:
+        data = pkcs12.serialize_key_and_certificates(name, key, cert, None, encryption)
+    else:
+        # 多条目密钥库：cryptography只能写入一个私钥，其余别名以带名称的证书条目写入
+        extra = [pkcs12.PKCS12Certificate(key_and_cert(name)[1], name.encode('utf-8')) for name in extra_aliases]
+        data = pkcs12.serialize_key_and_certificates(name, key, cert, extra, encryption)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return cert.public_bytes(serialization.Encoding.DER)
+
+
+def _length_prefixed(data, pos=0):
+    """读取一个长度前缀的值，返回(值, 下一个位置)"""
+    length, = struct.unpack_from('<I', data, pos)
+    return data[pos + 4:pos + 4 + length], pos + 4 + length
+
+
+def _sequence(data):
+    """读取长度前缀的序列"""
+    items = []
+    pos = 0
+    while pos < len(data):
+        item, pos = _length_prefixed(data, pos)
+        items.append(item)
+    return items
+
+
+def read_signing_block(path):
+    """
+    读取APK签名块
+    :return: (签名块偏移, {ID: 值}, 文件内容, 中央目录偏移, EOCD偏移)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    eocd = data.rindex(b'PK\x05\x06')
+    cd_offset, = struct.unpack_from('<I', data, eocd + 16)
+    assert data[cd_offset - 16:cd_offset] == b'APK Sig Block 42', "没有APK签名块"
+    size, = struct.unpack_from('<Q', data, cd_offset - 24)
+    block_offset = cd_offset - size - 8
+    assert struct.unpack_from('<Q', data, block_offset)[0] == size
+    pairs = {}
+    pos = block_offset + 8
+    while pos < cd_offset - 24:
+        length, pair_id = struct.unpack_from('<QI', data, pos)
+        pairs[pair_id] = data[pos + 12:pos + 8 + length]
+        pos += 8 + length
+    return block_offset, pairs, data, cd_offset, eocd
+
+
+def verify_v2(path):
+    """
+    校验APK的v2签名：签名块结构、签名、证书公钥和整个文件的块摘要
+    :return: 签名证书的DER
+    """
+    block_offset, pairs, data, cd_offset, eocd = read_signing_block(path)
+    signer = _sequence(_length_prefixed(pairs[V2_BLOCK_ID])[0])[0]
+    signed_data, pos = _length_prefixed(signer)
+    signatures, pos = _length_prefixed(signer, pos)
+    public_key_der, _ = _length_prefixed(signer, pos)
+    digests, pos = _length_prefixed(signed_data)
+    certificates, _ = _length_prefixed(signed_data, pos)
+    digest_item = _sequence(digests)[0]
+    algorithm, = struct.unpack_from('<I', digest_item)
+    expected_digest, _ = _length_prefixed(digest_item, 4)
+    certificate = _sequence(certificates)[0]
+
+    signature = _sequence(signatures)[0]
+    signature_algorithm, = struct.unpack_from('<I', signature)
+    assert signature_algorithm == algorithm == 0x0103
+    public_key = serialization.load_der_public_key(public_key_der)
+    public_key.verify(_length_prefixed(signature, 4)[0], signed_data, padding.PKCS1v15(), hashes.SHA256())
+    assert x509.load_der_x509_certificate(certificate).public_key().public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo) == public_key_der
+
+    # 摘要覆盖条目区、中央目录和EOCD（其中的中央目录偏移替换为签名块偏移）
+    eocd_record = bytearray(data[eocd:])
+    struct.pack_into('<I', eocd_record, 16, block_offset)
+    chunks = []
+    for section in (data[:block_offset], data[cd_offset:eocd], bytes(eocd_record)):
+        for start in range(0, len(section), CHUNK):
+            chunk = section[start:start + CHUNK]
+            chunks.append(hashlib.sha256(b'\xa5' + struct.pack('<I', len(chunk)) + chunk).digest())
+    top = hashlib.sha256(b'\x5a' + struct.pack('<I', len(chunks)) + b''.join(chunks)).digest()
+    assert top == expected_digest, "v2摘要不一致"
+    assert zipfile.ZipFile(path).testzip() is None
+    return certificate
+
+
+class FakeRoot:
+    """代替Tk根窗口：记录after调度，由测试手动运行帧"""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append((ms, callback))
@@ -0,0 +1,92 @@
+import queue
+import threading
+
+from apk_prepare import ApkPreparer
+from helpers import make_apk
+
+TIMEOUT = 10
+
+
+class StubProcessor:
+    """只提供prepare_apk用到的方法；precompute_digests可以阻塞到gate被设置，或抛出指定的异常"""
+    use_direct_java = False
+
+    def __init__(self, gate=None, error=None):
+        self.gate = gate
+        self.error = error
+        self.started = threading.Event()
+
+    def check_tools(self):
+        return True, None, None
+
+    def precompute_digests(self, apk_path, repack_options=None, cancel_event=None):
+        self.started.set()
+        if self.gate is not None:
+            # 故意不检查cancel_event，模拟取消时已经算完的结果
+            assert self.gate.wait(TIMEOUT)
+        if self.error is not None:
+            raise self.error
+        return None, "未启用进程内签名"
+
+
+def _prepare(preparer, results, apk_path, processor):
+    preparer.prepare(apk_path, processor, callback=lambda *args: results.put(args))
+
+
+def test_reselect_cancels_and_ignores_stale_result(tmp_path):
+    first = make_apk(str(tmp_path / 'first.apk'))
+    second = make_apk(str(tmp_path / 'second.apk'))
+    third = make_apk(str(tmp_path / 'third.apk'))
+    gate = threading.Event()
+    slow = StubProcessor(gate)
+    preparer = ApkPreparer()
+    results = queue.Queue()
+    try:
+        _prepare(preparer, results, first, slow)
+        assert slow.started.wait(TIMEOUT)
+        # first正在计算时先后选择second和third：second还没开始就被取消，first算完的结果已过时
+        _prepare(preparer, results, second, StubProcessor())
+        _prepare(preparer, results, third, StubProcessor())
+        gate.set()
+        apk_path, stats, error = results.get(timeout=TIMEOUT)
+        assert (apk_path, error) == (third, None)
+        assert stats['apk_path'] == third and stats['entries'] == 3
+        preparer._executor.submit(lambda: None).result(TIMEOUT)
+        assert results.empty()
+    finally:
+        preparer.shutdown()
+
+
+def test_cancel_suppresses_callback(tmp_path):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    gate = threading.Event()
+    processor = StubProcessor(gate)
+    preparer = ApkPreparer()
+    results = queue.Queue()
+    try:
+        _prepare(preparer, results, apk, processor)
+        assert processor.started.wait(TIMEOUT)
+        preparer.cancel()
+        gate.set()
+        preparer._executor.submit(lambda: None).result(TIMEOUT)
+        assert results.empty()
+    finally:
+        preparer.shutdown()
+
+
+def test_errors_are_reported(tmp_path):
+    corrupt = str(tmp_path / 'corrupt.apk')
+    with open(corrupt, 'wb') as f:
+        f.write(b'PK\x03\x04' + b'\0' * 100)
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    preparer = ApkPreparer()
+    results = queue.Queue()
+    try:
+        _prepare(preparer, results, corrupt, StubProcessor())
+        apk_path, stats, error = results.get(timeout=TIMEOUT)
+        assert apk_path == corrupt and stats is None and error
+        # 意外的异常同样作为预处理失败报告
+        _prepare(preparer, results, apk, StubProcessor(error=RuntimeError("意外错误")))
+        assert results.get(timeout=TIMEOUT) == (apk, None, "意外错误")
+    finally:
+        preparer.shutdown()
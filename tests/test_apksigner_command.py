@@ -0,0 +1,106 @@
+import os
+import subprocess
+
+import pytest
+
+import signing_processor
+from signing_processor import SigningProcessor, CDS_DYNAMIC_ARCHIVE_MIN_JAVA
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="测试用的替身脚本是sh脚本")
+
+# 替身java：-version时输出版本，带-XX:ArchiveClassesAtExit时创建归档文件
+FAKE_JAVA = """#!/bin/sh
+for arg in "$@"; do
+  case "$arg" in
+    -version) echo 'openjdk version "{version}"' >&2; exit 0;;
+    -XX:ArchiveClassesAtExit=*) echo archive > "${{arg#-XX:ArchiveClassesAtExit=}}";;
+  esac
+done
+exit 0
+"""
+
+
+def _executable(path, content):
+    path.write_text(content)
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def sdk(tmp_path, monkeypatch):
+    """只有apksigner包装脚本（替身）和lib/apksigner.jar的build-tools目录，java不在PATH中"""
+    build_tools = tmp_path / 'sdk' / 'build-tools' / '34.0.0'
+    (build_tools / 'lib').mkdir(parents=True)
+    wrapper = _executable(build_tools / 'apksigner', "#!/bin/sh\nexit 0\n")
+    (build_tools / 'lib' / 'apksigner.jar').write_bytes(b'jar')
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.delenv('JAVA_HOME', raising=False)
+    monkeypatch.setenv('PATH', str(bin_dir))
+    monkeypatch.setattr(signing_processor, 'CDS_CACHE_DIR', str(tmp_path / 'cds'))
+    monkeypatch.setattr(SigningProcessor, '_java_versions', {})
+    return wrapper, build_tools, bin_dir
+
+
+def _processor(wrapper):
+    processor = SigningProcessor('', use_direct_java=True)
+    processor.apksigner_cmd = wrapper
+    return processor
+
+
+def _install_java(bin_dir, version):
+    return _executable(bin_dir / 'java', FAKE_JAVA.format(version=version))
+
+
+def test_falls_back_to_wrapper_without_java_or_jar(sdk):
+    wrapper, build_tools, bin_dir = sdk
+    # 没有java
+    assert _processor(wrapper).get_apksigner_command() == ([wrapper], False, None)
+    # 有java但没有jar
+    _install_java(bin_dir, '17.0.2')
+    (build_tools / 'lib' / 'apksigner.jar').unlink()
+    assert _processor(wrapper).get_apksigner_command() == ([wrapper], False, None)
+    # 未启用直接启动java
+    processor = _processor(wrapper)
+    processor.use_direct_java = False
+    assert processor.get_apksigner_command() == ([wrapper], False, None)
+
+
+@pytest.mark.parametrize('version, major', [('1.8.0_292', 8), ('11.0.20', 11), ('17.0.2', 17)])
+def test_java_version_gates_cds(sdk, version, major):
+    wrapper, build_tools, bin_dir = sdk
+    java = _install_java(bin_dir, version)
+    assert SigningProcessor.get_java_major_version(java) == major
+    cmd, shell, cds_pending = _processor(wrapper).get_apksigner_command()
+    assert cmd[0] == java and cmd[-2:] == ['-jar', str(build_tools / 'lib' / 'apksigner.jar')]
+    assert not shell
+    uses_cds = any(arg.startswith('-XX:ArchiveClassesAtExit=') for arg in cmd)
+    assert uses_cds == (major >= CDS_DYNAMIC_ARCHIVE_MIN_JAVA)
+    assert (cds_pending is not None) == uses_cds
+
+
+def test_cds_archive_is_created_once_and_reused(sdk, tmp_path):
+    wrapper, build_tools, bin_dir = sdk
+    _install_java(bin_dir, '17.0.2')
+    processor = _processor(wrapper)
+
+    # 签名失败时不保留归档
+    cmd, _, cds_pending = processor.build_sign_command('ks', 'pw', 'pw', 'alias', 'in.apk', 'out.apk')
+    assert subprocess.run(cmd).returncode == 0
+    assert os.path.exists(cds_pending[0])
+    SigningProcessor.finish_cds_archive(cds_pending, False)
+    assert not os.path.exists(cds_pending[0]) and not os.path.exists(cds_pending[1])
+
+    cmd, _, cds_pending = processor.build_sign_command('ks', 'pw', 'pw', 'alias', 'in.apk', 'out.apk')
+    assert cmd[-3:] == ['--out', 'out.apk', 'in.apk']
+    subprocess.run(cmd, check=True)
+    SigningProcessor.finish_cds_archive(cds_pending, True)
+    archive_path = cds_pending[1]
+    assert os.path.exists(archive_path) and not os.path.exists(cds_pending[0])
+
+    # 之后的签名直接使用已有的归档，不再生成
+    cmd, _, cds_pending = processor.build_sign_command('ks', 'pw', 'pw', 'alias', 'in.apk', 'out.apk')
+    assert cds_pending is None
+    assert f'-XX:SharedArchiveFile={archive_path}' in cmd
+    assert not any(arg.startswith('-XX:ArchiveClassesAtExit=') for arg in cmd)
+    assert os.listdir(str(tmp_path / 'cds')) == [os.path.basename(archive_path)]
@@ -0,0 +1,44 @@
+import sys
+import time
+import asyncio
+
+from async_signer import AsyncSigner, AsyncSigningJob
+from signing_processor import SigningProcessor
+from helpers import make_apk
+
+# 代替apksigner：把输入复制为输出
+COPY_SCRIPT = "import shutil, sys; shutil.copy(sys.argv[1], sys.argv[2])"
+
+
+class SlowProcessor(SigningProcessor):
+    """生成命令时像第一次获取java版本一样阻塞"""
+
+    def build_sign_command(self, keystore_path, storepass, keypass, key_alias, input_apk, output_apk):
+        time.sleep(0.3)
+        return [sys.executable, '-c', COPY_SCRIPT, input_apk, output_apk], False, None
+
+
+def test_blocking_preparation_runs_off_the_event_loop(tmp_path):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    signer = AsyncSigner(SlowProcessor(''))
+    ticks = []
+
+    async def ticker(done):
+        while not done.is_set():
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        done = asyncio.Event()
+        task = asyncio.ensure_future(ticker(done))
+        try:
+            return await signer.sign(AsyncSigningJob(apk, 'release.p12', 'secret', 'secret', 'mykey'))
+        finally:
+            done.set()
+            await task
+
+    output = asyncio.run(main())
+    assert output == str(tmp_path / 'app_resigned.apk')
+    # 事件循环没有被阻塞：生成命令的0.3秒内计时协程一直在运行
+    assert len(ticks) >= 10
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.2
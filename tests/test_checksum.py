@@ -0,0 +1,82 @@
+import os
+import json
+import queue
+import shutil
+import hashlib
+import subprocess
+
+import signing_processor
+from signing_processor import SigningProcessor
+from apk_channel import read_channel, CHANNEL_BLOCK_ID
+from apk_checksum import MANIFEST_NAME
+from apk_zip import ApkFormatError
+from helpers import make_apk, verify_v2, read_signing_block, STOREPASS, KEY_ALIAS
+
+
+def _resign(apk, keystore, channels=None):
+    """进程内签名并写校验清单，返回最后的complete/error消息"""
+    processor = SigningProcessor('', use_block_signing=True, write_checksums=True)
+    progress_queue = queue.Queue()
+    processor.perform_resign(apk, keystore[0], STOREPASS, STOREPASS, KEY_ALIAS, progress_queue, channels=channels)
+    messages = [progress_queue.get_nowait() for _ in range(progress_queue.qsize())]
+    return [msg for msg in messages if msg['type'] != 'progress'][-1]
+
+
+def _manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def _file_hashes(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    if shutil.which('sha256sum'):
+        assert subprocess.check_output(['sha256sum', path]).split()[0].decode() == sha256
+    return sha256, hashlib.md5(data).hexdigest()
+
+
+def test_manifest_matches_output(tmp_path, keystore):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    message = _resign(apk, keystore)
+    assert message['type'] == 'complete', message
+    output = message['output_path']
+    verify_v2(output)
+
+    record, = _manifest(str(tmp_path))
+    assert record['output'] == os.path.abspath(output)
+    assert (record['sha256'], record['md5']) == _file_hashes(output)
+    assert record['size'] == os.path.getsize(output)
+    assert record['signer_sha256'] == hashlib.sha256(keystore[1]).hexdigest()
+    assert message['checksums']['sha256'] == record['sha256']
+
+
+def test_channel_apks_verify_and_match_manifest(tmp_path, keystore):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    message = _resign(apk, keystore, channels=['huawei', 'xiaomi'])
+    assert message['type'] == 'complete', message
+    outputs = message['channel_stats']['outputs']
+    assert sorted(outputs) == ['huawei', 'xiaomi']
+
+    records = {}
+    for channel, path in outputs.items():
+        # 渠道信息在签名块中，不影响v2签名
+        assert verify_v2(path) == keystore[1]
+        assert json.loads(read_signing_block(path)[1][CHANNEL_BLOCK_ID]) == {'channel': channel}
+        assert read_channel(path) == channel
+        for record in _manifest(os.path.dirname(path)):
+            records[record['channel']] = record
+    for channel, path in outputs.items():
+        assert (records[channel]['sha256'], records[channel]['md5']) == _file_hashes(path)
+
+
+def test_unreadable_signing_block_keeps_signed_output(tmp_path, keystore, monkeypatch):
+    def broken(path):
+        raise ApkFormatError("APK签名块大小错误")
+    monkeypatch.setattr(signing_processor, 'apk_signer_sha256', broken)
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    message = _resign(apk, keystore)
+    assert message['type'] == 'complete', message
+    assert 'APK签名块大小错误' in message['checksums_error']
+    assert 'checksums' not in message
+    verify_v2(message['output_path'])
@@ -0,0 +1,75 @@
+import os
+
+import apk_digest_cache
+from apk_zip import ApkZipReader
+from apk_signing_block import compute_chunk_digests
+from helpers import make_apk, CHUNK
+
+
+def _payload_offset(path):
+    with ApkZipReader(path) as reader:
+        index = reader.index()
+        return index.data_offset(index.find('assets/payload.bin'))
+
+
+def _overwrite(path, offset, keep_mtime):
+    """改写条目数据但不更新CRC和大小（相当于CRC碰撞），可选保留修改时间"""
+    stat = os.stat(path)
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    mtime_ns = stat.st_mtime_ns if keep_mtime else stat.st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(stat.st_atime_ns, mtime_ns))
+
+
+def _lookup(cache, path):
+    """返回(沿用的块摘要, 实际的块摘要)"""
+    with ApkZipReader(path) as reader:
+        entries_end = reader.eocd.cd_offset
+        known, _ = cache.lookup(path, reader, entries_end)
+        return known, compute_chunk_digests((reader.buf[:entries_end],))
+
+
+def _precompute(cache, path):
+    with ApkZipReader(path) as reader:
+        return cache.precompute(path, reader, reader.eocd.cd_offset)
+
+
+def test_unchanged_file_reuses_every_chunk(tmp_path, digest_cache):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    assert _precompute(digest_cache, apk)['chunks_reused'] == 0
+    known, actual = _lookup(digest_cache, apk)
+    assert known == dict(enumerate(actual))
+
+
+def test_rewritten_entry_is_not_reused(tmp_path, digest_cache):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    _precompute(digest_cache, apk)
+    offset = _payload_offset(apk)
+    _overwrite(apk, offset, keep_mtime=False)
+    known, actual = _lookup(digest_cache, apk)
+    assert offset // CHUNK not in known
+    assert all(actual[k] == digest for k, digest in known.items())
+
+
+def test_stale_chunk_with_same_size_and_mtime_is_caught(tmp_path, digest_cache):
+    # 改写在数据中间，区间签名不变；条目区只有一个块，抽查必然检查到被改写的块
+    apk = make_apk(str(tmp_path / 'app.apk'), payload_size=CHUNK // 2)
+    _precompute(digest_cache, apk)
+    _overwrite(apk, _payload_offset(apk) + CHUNK // 4, keep_mtime=True)
+    known, _ = _lookup(digest_cache, apk)
+    assert known == {}
+
+
+def test_stale_spans_are_caught_without_spot_check(tmp_path, digest_cache, monkeypatch):
+    # 条目区有多个块，抽查不一定检查到被改写的块；保留修改时间的改写落在数据开头时靠区间签名发现
+    monkeypatch.setattr(apk_digest_cache, 'spot_check', lambda buf, known, entries_end: True)
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    _precompute(digest_cache, apk)
+    offset = _payload_offset(apk) + 100
+    _overwrite(apk, offset, keep_mtime=True)
+    known, actual = _lookup(digest_cache, apk)
+    assert offset // CHUNK not in known
+    assert all(actual[k] == digest for k, digest in known.items())
@@ -0,0 +1,205 @@
+import os
+import socket
+import threading
+
+import pytest
+
+import distributed_signing
+from distributed_signing import SigningWorker, SigningCoordinator, ProtocolError, _Session
+from config_manager import ConfigManager
+from signing_processor import SigningProcessor
+from apk_metadata import check_output_name
+from apk_zip import ApkFormatError
+from helpers import make_apk, verify_v2
+
+SECRET = b'test-secret'
+
+
+@pytest.fixture
+def workers(tmp_path, profile):
+    """两个只在本机监听的工作节点"""
+    started = []
+    for i in range(2):
+        config_manager = ConfigManager(str(tmp_path / f'worker{i}.json'))
+        config_manager.add_profile('release', dict(profile))
+        worker = SigningWorker(SigningProcessor('', use_block_signing=True), config_manager, SECRET,
+                               capacity=2, host='127.0.0.1', port=0)
+        worker.start()
+        started.append(worker)
+    yield started
+    for worker in started:
+        worker.shutdown()
+
+
+def _free_port():
+    """一个当前没有监听的端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _run_batch(coordinator, *args, **kwargs):
+    """在线程中运行run_batch，协调节点卡住时测试失败而不是一直等待"""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(coordinator.run_batch(*args, **kwargs)))
+    thread.daemon = True
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), "协调节点没有结束"
+    return results[0]
+
+
+def test_batch_across_workers(tmp_path, workers, keystore):
+    apks = [make_apk(str(tmp_path / f'app{i}.apk')) for i in range(4)]
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    coordinator = SigningCoordinator([worker.address for worker in workers], SECRET)
+    results = _run_batch(coordinator, apks, 'release', str(output_dir))
+    assert all(result['ok'] for result in results), results
+    for result in results:
+        assert verify_v2(result['output_path']) == keystore[1]
+
+
+def test_dead_worker_is_skipped(tmp_path, workers):
+    apks = [make_apk(str(tmp_path / f'app{i}.apk')) for i in range(2)]
+    coordinator = SigningCoordinator([('127.0.0.1', _free_port()), workers[0].address], SECRET)
+    results = _run_batch(coordinator, apks, 'release')
+    assert all(result['ok'] for result in results), results
+
+
+def test_unexpected_error_fails_job_without_hanging(tmp_path, workers, monkeypatch):
+    def broken(record, directory=None):
+        raise RuntimeError("broken")
+    monkeypatch.setattr(distributed_signing, 'append_manifest', broken)
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    coordinator = SigningCoordinator([worker.address for worker in workers], SECRET)
+    results = _run_batch(coordinator, [apk], 'release', checksums=True)
+    assert not results[0]['ok']
+    assert 'broken' in results[0]['message']
+
+
+def test_unreadable_signing_block_keeps_result(tmp_path, workers, monkeypatch):
+    def broken(path):
+        raise ApkFormatError("broken")
+    monkeypatch.setattr(distributed_signing, 'apk_signer_sha256', broken)
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    coordinator = SigningCoordinator([workers[0].address], SECRET)
+    results = _run_batch(coordinator, [apk], 'release', checksums=True)
+    assert results[0]['ok'], results
+    assert 'broken' in results[0]['checksums_error']
+    verify_v2(results[0]['output_path'])
+
+
+@pytest.mark.parametrize('template', ['../evil_{apk_name}.apk', '/tmp/evil.apk', 'sub/{apk_name}.apk',
+                                      'sub\\{apk_name}.apk'])
+def test_output_template_cannot_escape(tmp_path, workers, template):
+    source_dir = tmp_path / 'src'
+    source_dir.mkdir()
+    apk = make_apk(str(source_dir / 'app.apk'))
+    coordinator = SigningCoordinator([workers[0].address], SECRET)
+    results = _run_batch(coordinator, [apk], 'release', output_template=template)
+    assert not results[0]['ok']
+    assert not (tmp_path / 'evil_app.apk').exists()
+
+
+def test_check_output_name():
+    assert check_output_name('app_resigned.apk') == 'app_resigned.apk'
+    for name in ('../app.apk', '/etc/evil.apk', 'a/b.apk', 'a\\b.apk', '..', ''):
+        with pytest.raises(ValueError):
+            check_output_name(name)
+
+
+def test_resolve_output_path_rejects_directories(tmp_path):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    processor = SigningProcessor('')
+    assert processor.resolve_output_path(apk) == str(tmp_path / 'app_resigned.apk')
+    with pytest.raises(ValueError):
+        processor.resolve_output_path(apk, '../../evil_{apk_name}.apk')
+
+
+def test_tampered_stream_is_rejected(tmp_path):
+    left, right = socket.socketpair()
+    key = os.urandom(32)
+    sender = _Session(left, key, b'c2w', b'w2c')
+    receiver = _Session(right, key, b'w2c', b'c2w')
+    source = tmp_path / 'data.bin'
+    source.write_bytes(os.urandom(4096))
+
+    class Flip:
+        """模拟链路上的篡改：发送的文件数据中改掉一个字节"""
+        def __init__(self, sock):
+            self.sock = sock
+            self.flipped = False
+
+        def sendall(self, data):
+            if not self.flipped and len(data) == 4096:
+                data = bytes([data[0] ^ 1]) + data[1:]
+                self.flipped = True
+            self.sock.sendall(data)
+
+    sender.sock = Flip(left)
+    def send():
+        with open(source, 'rb') as f:
+            sender.send({'type': 'sign', 'size': 4096}, f)
+    thread = threading.Thread(target=send)
+    thread.start()
+    assert receiver.recv()['type'] == 'sign'
+    with open(tmp_path / 'received.bin', 'wb') as f:
+        with pytest.raises(ProtocolError):
+            receiver.recv_stream(4096, f)
+    thread.join()
+    left.close()
+    right.close()
+
+
+def test_replayed_header_is_rejected():
+    left, right = socket.socketpair()
+    key = os.urandom(32)
+    sender = _Session(left, key, b'c2w', b'w2c')
+    receiver = _Session(right, key, b'w2c', b'c2w')
+    sender.send({'type': 'status'})
+    receiver.recv()
+    # 重放第一条消息：序号不同，HMAC不匹配
+    sender._send_seq = 0
+    sender.send({'type': 'status'})
+    with pytest.raises(ProtocolError):
+        receiver.recv()
+    left.close()
+    right.close()
+
+
+def test_same_basename_into_one_output_dir_is_refused(tmp_path, workers):
+    apks = []
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        apks.append(make_apk(str(tmp_path / name / 'app.apk')))
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    coordinator = SigningCoordinator([workers[0].address], SECRET)
+    with pytest.raises(ValueError):
+        coordinator.run_batch(apks, 'release', str(output_dir))
+    assert list(output_dir.iterdir()) == []
+
+    # 模板能区分两个APK时可以正常输出到同一目录
+    (tmp_path / 'b' / 'app.apk').unlink()
+    apks[1] = make_apk(str(tmp_path / 'b' / 'app.apk'), package='com.example.other')
+    results = _run_batch(coordinator, apks, 'release', str(output_dir), '{package}.apk')
+    assert all(result['ok'] for result in results), results
+    assert sorted(path.name for path in output_dir.iterdir()) == ['com.example.app.apk', 'com.example.other.apk']
+
+
+def test_busy_worker_is_avoided():
+    coordinator = SigningCoordinator([('127.0.0.1', 1), ('127.0.0.1', 2)], SECRET)
+    for worker in coordinator.workers:
+        worker.alive = True
+        worker.capacity = 2
+        worker.profiles = ['release']
+    busy, idle = coordinator.workers
+    busy.busy = 2
+    job = distributed_signing._BatchJob.__new__(distributed_signing._BatchJob)
+    job.size = 1
+    job.tried = set()
+    assert coordinator._pick([job], 'release') == (job, idle)
+    # 所有节点都忙时仍然分配，任务在节点上排队
+    idle.busy = 2
+    assert coordinator._pick([job], 'release')[0] is job
@@ -0,0 +1,74 @@
+import os
+import time
+
+import job_journal
+from job_journal import JobJournal, JOURNAL_FILENAME, COMPACT_MIN_RECORDS, keystore_fingerprint, signing_job_key
+
+
+def _write_output(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(name.encode())
+    return str(path)
+
+
+def test_group_sync_fires_without_another_record(tmp_path, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(job_journal.os, 'fsync', lambda fd: synced.append(fd) or real_fsync(fd))
+    journal = JobJournal(str(tmp_path), group_size=100, group_interval=0.05)
+    try:
+        journal.record_start('a', 'a.apk')
+        assert not synced
+        deadline = time.monotonic() + 5
+        while not synced and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(synced) == 1
+    finally:
+        journal.close()
+
+
+def test_close_syncs_pending_records(tmp_path, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(job_journal.os, 'fsync', lambda fd: synced.append(fd) or real_fsync(fd))
+    journal = JobJournal(str(tmp_path), group_size=100, group_interval=60)
+    journal.record_start('a', 'a.apk')
+    journal.close()
+    assert len(synced) == 1
+    assert journal._timer is None
+
+
+def test_superseded_records_are_compacted_on_open(tmp_path):
+    output = _write_output(tmp_path, 'out.apk')
+    journal = JobJournal(str(tmp_path))
+    for i in range(COMPACT_MIN_RECORDS):
+        key = f'key{i % 10}'
+        journal.record_start(key, 'in.apk')
+        if i % 10 < 5:
+            journal.record_done(key, 'in.apk', output)
+        else:
+            journal.record_failed(key, 'in.apk', 'failed')
+    journal.close()
+    path = os.path.join(str(tmp_path), JOURNAL_FILENAME)
+    completed = JobJournal.replay(path)
+    assert sorted(completed) == [f'key{i}' for i in range(5)]
+
+    journal = JobJournal(str(tmp_path))
+    journal.close()
+    with open(path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 5
+    assert JobJournal.replay(path) == completed
+    assert journal.verified_output('key0') == output
+
+
+def test_key_changes_with_keystore_and_alias(tmp_path):
+    apk = _write_output(tmp_path, 'app.apk')
+    keystore = _write_output(tmp_path, 'release.p12')
+    signer = keystore_fingerprint(keystore, 'mykey')
+    key = signing_job_key(apk, signer, '{apk_name}_resigned.apk', 'release')
+    assert key == signing_job_key(apk, keystore_fingerprint(keystore, 'mykey'), '{apk_name}_resigned.apk', 'release')
+    assert key != signing_job_key(apk, keystore_fingerprint(keystore, 'other'), '{apk_name}_resigned.apk', 'release')
+    # 同一路径下换了密钥库文件
+    (tmp_path / 'release.p12').write_bytes(b'another keystore')
+    assert key != signing_job_key(apk, keystore_fingerprint(keystore, 'mykey'), '{apk_name}_resigned.apk', 'release')
+    assert key != signing_job_key(apk, signer, '{apk_name}_resigned.apk', 'release', channels=['huawei'])
@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+
+from job_queue import JobQueue, JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_CANCELLED, FINISHED_STATES
+from job_journal import JournalSet, JOURNAL_FILENAME
+from progress_dispatcher import ProgressDispatcher
+from helpers import FakeRoot
+
+
+class StubProcessor:
+    """代替SigningProcessor：不启动签名工具，按需阻塞直到被取消或放行"""
+
+    def __init__(self, block=False):
+        self.block = block
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def perform_resign(self, apk_path, keystore_path, storepass, keypass, key_alias, progress_queue,
+                       cancel_event=None, **options):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            progress_queue.put({'type': 'progress', 'value': 50, 'status': '签名中...'})
+            if self.block:
+                while not self.release.is_set():
+                    if cancel_event.is_set():
+                        progress_queue.put({'type': 'cancelled'})
+                        return
+                    time.sleep(0.005)
+            output_path = os.path.splitext(apk_path)[0] + '_resigned.apk'
+            with open(output_path, 'wb') as f:
+                f.write(b'signed')
+            progress_queue.put({'type': 'complete', 'output_path': output_path})
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+SIGNING_ARGS = ('release.p12', 'secret', 'secret', 'mykey')
+
+
+def _make_queue(max_workers=2, journals=None):
+    dispatcher = ProgressDispatcher(FakeRoot(), lambda job_id, messages: None)
+    return JobQueue(dispatcher, max_workers, journals)
+
+
+def _wait_finished(job_queue, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job_queue.is_busy():
+        assert time.monotonic() < deadline, "任务没有结束"
+        time.sleep(0.005)
+    assert all(job.status in FINISHED_STATES for job in job_queue.jobs.values())
+
+
+def _wait_running(processor, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while processor.running != count:
+        assert time.monotonic() < deadline, f"运行中的任务数没有达到{count}"
+        time.sleep(0.005)
+
+
+def _add_jobs(job_queue, tmp_path, count):
+    jobs = []
+    for i in range(count):
+        path = tmp_path / f'app{i}.apk'
+        path.write_bytes(b'apk')
+        jobs.append(job_queue.add_job(str(path)))
+    return jobs
+
+
+def test_journal_failure_does_not_fail_signed_job(tmp_path, monkeypatch):
+    journals = JournalSet()
+    job_queue = _make_queue(journals=journals)
+    job, = _add_jobs(job_queue, tmp_path, 1)
+    journal = journals.get(str(tmp_path))
+
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(journal, 'record_done', broken)
+    job_queue.submit(job, StubProcessor(), SIGNING_ARGS)
+    _wait_finished(job_queue)
+    journals.close()
+    assert job.status == JOB_DONE, job.message
+    assert os.path.exists(job.output_path)
+    assert os.path.exists(os.path.join(str(tmp_path), JOURNAL_FILENAME))
+
+
+def test_concurrency_is_limited_to_max_workers(tmp_path):
+    job_queue = _make_queue(max_workers=2)
+    jobs = _add_jobs(job_queue, tmp_path, 6)
+    processor = StubProcessor(block=True)
+    for job in jobs:
+        job_queue.submit(job, processor, SIGNING_ARGS)
+    _wait_running(processor, 2)
+    assert [job.status for job in jobs] == [JOB_RUNNING] * 2 + [JOB_PENDING] * 4
+
+    # 提高并发数后立即启动等待中的任务
+    job_queue.set_max_workers(3)
+    _wait_running(processor, 3)
+    processor.release.set()
+    _wait_finished(job_queue)
+    assert processor.max_running == 3
+    assert all(job.status == JOB_DONE and os.path.exists(job.output_path) for job in jobs)
+
+
+def test_cancel_pending_and_running_jobs(tmp_path):
+    job_queue = _make_queue(max_workers=1)
+    running, waiting, cancelled = _add_jobs(job_queue, tmp_path, 3)
+    processor = StubProcessor(block=True)
+    for job in (running, waiting, cancelled):
+        job_queue.submit(job, processor, SIGNING_ARGS)
+    _wait_running(processor, 1)
+
+    # 等待中的任务直接取消，不会再启动
+    assert job_queue.cancel(cancelled.job_id)
+    assert cancelled.status == JOB_CANCELLED
+    assert job_queue.dispatcher.channel(cancelled.job_id).drain() == [{'type': 'cancelled'}]
+
+    # 运行中的任务由签名过程响应取消，之后启动下一个等待中的任务
+    assert job_queue.cancel(running.job_id)
+    deadline = time.monotonic() + 10
+    while waiting.status != JOB_RUNNING:
+        assert time.monotonic() < deadline, "等待中的任务没有启动"
+        time.sleep(0.005)
+    assert running.status == JOB_CANCELLED
+    processor.release.set()
+    _wait_finished(job_queue)
+    assert waiting.status == JOB_DONE
+    assert cancelled.start_time is None and not (tmp_path / 'app2_resigned.apk').exists()
+    assert processor.max_running == 1
+    assert not job_queue.cancel(running.job_id)
+
+    # 已取消的任务可以重试
+    assert job_queue.retry(running.job_id)
+    _wait_finished(job_queue)
+    assert running.status == JOB_DONE
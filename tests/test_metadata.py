@@ -0,0 +1,57 @@
+import pytest
+
+from apk_zip import ApkFormatError
+from apk_metadata import (parse_manifest, get_apk_metadata, format_output_name, check_output_name,
+                          resolve_output_name, template_needs_metadata, DEFAULT_OUTPUT_TEMPLATE)
+from helpers import _axml, make_apk
+
+
+def test_parse_manifest():
+    metadata = parse_manifest(_axml('com.example.shop', version_code=1203, version_name='12.3-beta', min_sdk=21))
+    assert metadata == {'package': 'com.example.shop', 'versionCode': 1203, 'versionName': '12.3-beta',
+                        'minSdkVersion': 21}
+
+
+@pytest.mark.parametrize('data', [b'', b'<?xml version="1.0"?><manifest/>', _axml('com.example.app')[:40],
+                                  _axml('com.example.app')[:300]])
+def test_parse_manifest_rejects_malformed_data(data):
+    with pytest.raises(ApkFormatError):
+        parse_manifest(data)
+
+
+def test_template_naming(tmp_path):
+    apk = make_apk(str(tmp_path / 'app-release.apk'), payload_size=1024)
+    assert get_apk_metadata(apk)['package'] == 'com.example.app'
+    assert resolve_output_name(apk, '{package}-{versionName}-{versionCode}-{profile}.apk', 'release') == \
+        'com.example.app-1.2.3-42-release.apk'
+    assert resolve_output_name(apk) == 'app-release_resigned.apk'
+    # 缺少扩展名时补上.apk
+    assert resolve_output_name(apk, '{apk_name}-v{minSdkVersion}') == 'app-release-v24.apk'
+
+
+def test_template_needs_metadata():
+    assert not template_needs_metadata(DEFAULT_OUTPUT_TEMPLATE)
+    assert not template_needs_metadata('{apk_name}-{profile}.apk')
+    assert template_needs_metadata('{apk_name}-{versionCode}.apk')
+
+
+def test_unknown_placeholder():
+    with pytest.raises(ValueError, match='versionname'):
+        format_output_name('{apk_name}-{versionname}.apk', 'app.apk', {'versionName': '1.0'})
+    # 清单中没有的字段同样不可用
+    with pytest.raises(ValueError):
+        format_output_name('{apk_name}-{versionName}.apk', 'app.apk', {'versionName': None})
+
+
+def test_unsafe_characters_are_replaced():
+    name = format_output_name('{package}-{versionName}-{profile}.apk', 'app.apk',
+                              {'package': 'com.example', 'versionName': '1.0/../../x'}, profile='a:b*c?')
+    assert name == 'com.example-1.0_.._.._x-a_b_c_.apk'
+    assert check_output_name(name) == name
+
+
+@pytest.mark.parametrize('template', ['../{apk_name}.apk', 'out/{apk_name}.apk', '/tmp/{apk_name}.apk'])
+def test_template_with_directories_is_refused(tmp_path, template):
+    apk = make_apk(str(tmp_path / 'app.apk'), payload_size=1024)
+    with pytest.raises(ValueError):
+        resolve_output_name(apk, template)
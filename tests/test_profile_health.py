@@ -0,0 +1,27 @@
+from profile_health import check_profile, evaluate, HEALTH_OK, HEALTH_ERROR, HEALTH_UNKNOWN
+from helpers import make_keystore, STOREPASS, KEY_ALIAS
+
+
+def _health(profile):
+    return evaluate(check_profile(profile, keytool_cmd=None)).status
+
+
+def test_valid_pkcs12_profile(profile):
+    assert _health(profile) == HEALTH_OK
+
+
+def test_wrong_key_password_is_an_error(profile):
+    assert _health(dict(profile, keypass='wrong')) == HEALTH_ERROR
+
+
+def test_wrong_store_password_is_an_error(profile):
+    assert _health(dict(profile, storepass='wrong', keypass='')) == HEALTH_ERROR
+
+
+def test_multi_entry_keystore_is_not_an_error(tmp_path):
+    path = str(tmp_path / 'multi.p12')
+    make_keystore(path, extra_aliases=('second',))
+    profile = {'keystore_path': path, 'storepass': STOREPASS, 'keypass': '', 'key_alias': 'second'}
+    # 进程内无法确认，没有keytool时为未知，签名时仍交给apksigner
+    assert _health(profile) == HEALTH_UNKNOWN
+    assert _health(dict(profile, key_alias=KEY_ALIAS)) == HEALTH_UNKNOWN
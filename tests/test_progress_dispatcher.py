@@ -0,0 +1,105 @@
+import threading
+
+from progress_dispatcher import ProgressDispatcher, FRAME_MS, IDLE_MS, MAX_JOBS_PER_FRAME
+from helpers import FakeRoot
+
+
+def _progress(value):
+    return {'type': 'progress', 'value': value, 'status': f'{value}%'}
+
+
+def _dispatcher():
+    handled = []
+    dispatcher = ProgressDispatcher(FakeRoot(), lambda job_id, messages: handled.append((job_id, messages)))
+    return dispatcher, handled
+
+
+def _run_frame(dispatcher):
+    """运行已调度的下一帧，返回再下一帧的间隔"""
+    _, callback = dispatcher.root.scheduled.pop(0)
+    callback()
+    return dispatcher.root.scheduled[-1][0]
+
+
+def test_channel_keeps_last_progress_and_every_event():
+    dispatcher, _ = _dispatcher()
+    channel = dispatcher.channel(1)
+    channel.put(_progress(10))
+    channel.put({'type': 'metadata'})
+    channel.put(_progress(20))
+    channel.put({'type': 'error', 'message': '签名失败'})
+    channel.put(_progress(0))
+    channel.put({'type': 'complete', 'output_path': 'out.apk'})
+    assert channel.drain() == [_progress(0), {'type': 'metadata'}, {'type': 'error', 'message': '签名失败'},
+                               {'type': 'complete', 'output_path': 'out.apk'}]
+    assert channel.drain() == []
+
+
+def test_concurrent_updates_never_drop_completion():
+    dispatcher, handled = _dispatcher()
+    dispatcher.start()
+
+    def work(job_id):
+        channel = dispatcher.channel(job_id)
+        for value in range(200):
+            channel.put(_progress(value))
+        channel.put({'type': 'complete', 'output_path': f'{job_id}.apk'})
+
+    threads = [threading.Thread(target=work, args=(job_id,)) for job_id in range(8)]
+    for thread in threads:
+        thread.start()
+    # 工作线程发送的同时运行帧
+    while any(thread.is_alive() for thread in threads):
+        _run_frame(dispatcher)
+    for thread in threads:
+        thread.join()
+    _run_frame(dispatcher)
+
+    for job_id in range(8):
+        messages = [msg for handled_id, batch in handled if handled_id == job_id for msg in batch]
+        assert messages[-1] == {'type': 'complete', 'output_path': f'{job_id}.apk'}
+        assert [msg['type'] for msg in messages].count('complete') == 1
+        values = [msg['value'] for msg in messages if msg['type'] == 'progress']
+        assert values == sorted(values) and len(values) <= 200
+
+
+def test_frame_handles_at_most_max_jobs():
+    dispatcher, handled = _dispatcher()
+    frames = []
+    dispatcher.add_frame_callback(lambda: frames.append(len(handled)))
+    dispatcher.start()
+    assert dispatcher.root.scheduled == [(IDLE_MS, dispatcher._on_frame)]
+
+    extra = 10
+    for job_id in range(MAX_JOBS_PER_FRAME + extra):
+        for value in (10, 20):
+            dispatcher.channel(job_id).put(_progress(value))
+    # 每个任务每帧只调用一次处理函数，超出的任务留到下一帧
+    assert _run_frame(dispatcher) == FRAME_MS
+    assert len(handled) == MAX_JOBS_PER_FRAME
+    assert all(messages == [_progress(20)] for _, messages in handled)
+    assert _run_frame(dispatcher) == FRAME_MS
+    assert sorted(job_id for job_id, _ in handled) == list(range(MAX_JOBS_PER_FRAME + extra))
+    # 没有更新时放慢检查
+    assert _run_frame(dispatcher) == IDLE_MS
+    assert frames == [MAX_JOBS_PER_FRAME, MAX_JOBS_PER_FRAME + extra, MAX_JOBS_PER_FRAME + extra]
+
+
+def test_handler_error_does_not_stop_frames():
+    handled = []
+
+    def handler(job_id, messages):
+        if job_id == 1:
+            raise RuntimeError("界面已关闭")
+        handled.append(job_id)
+    dispatcher = ProgressDispatcher(FakeRoot(), handler)
+    dispatcher.start()
+    for job_id in (1, 2):
+        dispatcher.channel(job_id).put(_progress(50))
+    assert _run_frame(dispatcher) == FRAME_MS
+    assert handled == [2]
+    # 移除的通道不再分发
+    dispatcher.channel(3).put(_progress(50))
+    dispatcher.remove_channel(3)
+    assert _run_frame(dispatcher) == IDLE_MS
+    assert handled == [2]
@@ -0,0 +1,136 @@
+import os
+import sys
+import queue
+import struct
+import zipfile
+
+import pytest
+
+from apk_repack import repack_apk, format_repack_stats
+from signing_processor import SigningProcessor
+from helpers import _axml, verify_v2, STOREPASS, KEY_ALIAS
+
+NAMES = ['AndroidManifest.xml', 'lib/arm64-v8a/libfoo.so', 'classes.dex', 'assets/raw.bin', 'resources.arsc',
+         'lib/x86/libbar.so']
+DEX = b''.join(b'const-string v%d, "line %d"\n' % (i % 16, i) for i in range(20000))
+ARSC = os.urandom(64 * 1024)
+
+# apksigner的替身：在子进程中用进程内签名签名重新打包后的APK
+SIGN_SCRIPT = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+from apk_signing_block import load_signer, sign_apk_v2
+sign_apk_v2(sys.argv[6], sys.argv[7], load_signer(*sys.argv[2:6]))
+'''
+
+
+def make_native_apk(path):
+    """带压缩的原生库、未对齐的不压缩条目，dex用低压缩级别，arsc是无法再压缩的随机数据"""
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('AndroidManifest.xml', _axml('com.example.app'), zipfile.ZIP_DEFLATED)
+        z.writestr('lib/arm64-v8a/libfoo.so', b'\x7fELF' + os.urandom(3000) + b'\0' * 20000, zipfile.ZIP_DEFLATED)
+        z.writestr('classes.dex', DEX, zipfile.ZIP_DEFLATED, compresslevel=1)
+        z.writestr('assets/raw.bin', os.urandom(777), zipfile.ZIP_STORED)
+        z.writestr('resources.arsc', ARSC, zipfile.ZIP_DEFLATED, compresslevel=1)
+        z.writestr('lib/x86/libbar.so', os.urandom(5001), zipfile.ZIP_STORED)
+    return path
+
+
+def _layout(path):
+    """{条目名: (压缩方式, 数据偏移, 压缩数据)}，按本地文件头中的长度计算数据偏移"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    layout = {}
+    with zipfile.ZipFile(path) as z:
+        assert [info.filename for info in z.infolist()] == NAMES
+        for info in z.infolist():
+            name_length, extra_length = struct.unpack_from('<HH', data, info.header_offset + 26)
+            start = info.header_offset + 30 + name_length + extra_length
+            layout[info.filename] = (info.compress_type, start, data[start:start + info.compress_size])
+    return layout
+
+
+def _check_alignment(path, page_size):
+    layout = _layout(path)
+    for name, (compress_type, start, _) in layout.items():
+        if name.endswith('.so'):
+            assert compress_type == zipfile.ZIP_STORED and start % page_size == 0, name
+        elif compress_type == zipfile.ZIP_STORED:
+            assert start % 4 == 0, name
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+    return layout
+
+
+@pytest.mark.parametrize('page_size', [4096, 16384])
+def test_native_libs_page_aligned(tmp_path, page_size):
+    src = make_native_apk(str(tmp_path / 'app.apk'))
+    dst = str(tmp_path / 'repacked.apk')
+    stats = repack_apk(src, dst, page_size=page_size, max_workers=2)
+    _check_alignment(dst, page_size)
+    assert (stats['entries'], stats['native_libs'], stats['native_libs_stored_aligned']) == (6, 2, 2)
+    assert stats['native_libs_previously_deflated'] == 1
+    assert stats['size_after'] == os.path.getsize(dst)
+
+    text = format_repack_stats(stats)
+    assert f"原生库 2/2 个不压缩并按{page_size // 1024}KB对齐" in text
+    # 测试清单没有声明extractNativeLibs
+    assert stats['extract_native_libs'] is None and 'extractNativeLibs=false' in text
+
+
+def test_recompress_keeps_smaller_data(tmp_path):
+    src = make_native_apk(str(tmp_path / 'app.apk'))
+    dst = str(tmp_path / 'repacked.apk')
+    stats = repack_apk(src, dst, page_align_native_libs=False, recompress_extensions=('.DEX', '.arsc'))
+    before, after = _layout(src), _layout(dst)
+    assert len(after['classes.dex'][2]) < len(before['classes.dex'][2])
+    # 随机数据重新压缩不会变小，保留原来的压缩数据
+    assert after['resources.arsc'][2] == before['resources.arsc'][2]
+    # 不对齐原生库时原样复制
+    assert after['lib/arm64-v8a/libfoo.so'][0] == zipfile.ZIP_DEFLATED
+    assert stats['recompressed_entries'] == 2
+    assert stats['recompressed_saved_bytes'] == len(before['classes.dex'][2]) - len(after['classes.dex'][2])
+    assert '重新压缩 2 个条目' in format_repack_stats(stats)
+    with zipfile.ZipFile(dst) as z:
+        assert z.read('classes.dex') == DEX and z.read('resources.arsc') == ARSC
+
+
+def test_unsupported_page_size(tmp_path):
+    src = make_native_apk(str(tmp_path / 'app.apk'))
+    with pytest.raises(ValueError):
+        repack_apk(src, str(tmp_path / 'repacked.apk'), page_size=8192)
+
+
+def _resign(processor, apk, keystore, repack_options):
+    progress_queue = queue.Queue()
+    processor.perform_resign(apk, keystore[0], STOREPASS, STOREPASS, KEY_ALIAS, progress_queue,
+                             repack_options=repack_options)
+    messages = [progress_queue.get_nowait() for _ in range(progress_queue.qsize())]
+    return [msg for msg in messages if msg['type'] != 'progress'][-1]
+
+
+def test_resign_with_recompress_repacks_then_signs(tmp_path, keystore, monkeypatch):
+    apk = make_native_apk(str(tmp_path / 'app.apk'))
+    processor = SigningProcessor('', use_block_signing=True)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def build_sign_command(keystore_path, storepass, keypass, key_alias, input_apk, output_apk):
+        return ([sys.executable, '-c', SIGN_SCRIPT, root, keystore_path, storepass, keypass, key_alias,
+                 input_apk, output_apk], False, None)
+    monkeypatch.setattr(processor, 'build_sign_command', build_sign_command)
+
+    # 需要重新压缩时不能合并到流水线中，先重新打包再交给apksigner
+    message = _resign(processor, apk, keystore, {'page_size': 16384, 'recompress_extensions': ['.dex']})
+    assert message['type'] == 'complete', message
+    assert message['repack_stats']['recompressed_entries'] == 1
+    assert verify_v2(message['output_path']) == keystore[1]
+    _check_alignment(message['output_path'], 16384)
+
+
+def test_resign_with_page_align_uses_pipeline(tmp_path, keystore):
+    apk = make_native_apk(str(tmp_path / 'app.apk'))
+    message = _resign(SigningProcessor('', use_block_signing=True), apk, keystore, {'page_size': 16384})
+    assert message['type'] == 'complete', message
+    assert 'block_signing' in message
+    assert verify_v2(message['output_path']) == keystore[1]
+    _check_alignment(message['output_path'], 16384)
@@ -0,0 +1,134 @@
+import os
+import struct
+import zipfile
+import tracemalloc
+
+import pytest
+
+import apk_pipeline
+from apk_pipeline import stream_sign_apk
+from apk_signing_block import load_signer, UnsupportedKeystoreError
+from signing_processor import SigningProcessor
+from helpers import _axml, make_apk, make_keystore, verify_v2, STOREPASS, KEY_ALIAS, CHUNK
+
+
+def test_block_sign_round_trip(tmp_path, keystore):
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    output = str(tmp_path / 'signed.apk')
+    stats, reason = SigningProcessor('').block_sign(apk, output, keystore[0], STOREPASS, STOREPASS, KEY_ALIAS)
+    assert reason is None
+    assert verify_v2(output) == keystore[1]
+
+    # 对已签名的APK再签名走只替换签名块的路径
+    resigned = str(tmp_path / 'resigned.apk')
+    stats, reason = SigningProcessor('').block_sign(output, resigned, keystore[0], STOREPASS, STOREPASS, KEY_ALIAS)
+    assert reason is None and 'chunks_reused' in stats
+    assert verify_v2(resigned) == keystore[1]
+
+
+def test_alias_mismatch_falls_back_to_apksigner(tmp_path, keystore):
+    with pytest.raises(UnsupportedKeystoreError):
+        load_signer(keystore[0], STOREPASS, STOREPASS, 'other')
+    apk = make_apk(str(tmp_path / 'app.apk'))
+    stats, reason = SigningProcessor('').block_sign(apk, str(tmp_path / 'out.apk'), keystore[0], STOREPASS,
+                                                     STOREPASS, 'other')
+    assert stats is None and reason
+    assert not (tmp_path / 'out.apk').exists()
+
+
+def test_multi_entry_keystore_falls_back_to_apksigner(tmp_path):
+    path = str(tmp_path / 'multi.p12')
+    make_keystore(path, extra_aliases=('second',))
+    for alias in (KEY_ALIAS, 'second'):
+        with pytest.raises(UnsupportedKeystoreError):
+            load_signer(path, STOREPASS, STOREPASS, alias)
+
+
+def test_keystore_without_alias_falls_back_to_apksigner(tmp_path):
+    path = str(tmp_path / 'noalias.p12')
+    make_keystore(path, alias=None)
+    with pytest.raises(UnsupportedKeystoreError):
+        load_signer(path, STOREPASS, STOREPASS, 'anything')
+
+
+def test_wrong_password_is_an_error(keystore):
+    with pytest.raises(ValueError):
+        load_signer(keystore[0], 'wrong', 'wrong', KEY_ALIAS)
+
+
+def _make_v1_signed_apk(path):
+    """带v1签名文件、未对齐的不压缩条目、压缩的原生库和ZIP注释的APK，条目区约9MB"""
+    with zipfile.ZipFile(path, 'w') as z:
+        z.comment = b'built by ci #1234'
+        z.writestr('AndroidManifest.xml', _axml('com.example.app'), zipfile.ZIP_DEFLATED)
+        z.writestr('META-INF/MANIFEST.MF', b'Manifest-Version: 1.0\r\n', zipfile.ZIP_DEFLATED)
+        z.writestr('META-INF/CERT.SF', b'Signature-Version: 1.0\r\n', zipfile.ZIP_DEFLATED)
+        z.writestr('META-INF/CERT.RSA', os.urandom(1200), zipfile.ZIP_STORED)
+        z.writestr('assets/odd.bin', os.urandom(8 * CHUNK + 1), zipfile.ZIP_STORED)
+        z.writestr('lib/arm64-v8a/libfoo.so', os.urandom(CHUNK) + bytes(2 * CHUNK), zipfile.ZIP_DEFLATED)
+    return path
+
+
+def _data_offsets(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    offsets = {}
+    with zipfile.ZipFile(path) as z:
+        for info in z.infolist():
+            name_length, extra_length = struct.unpack_from('<HH', data, info.header_offset + 26)
+            offsets[info.filename] = (info.compress_type, info.header_offset + 30 + name_length + extra_length)
+    return offsets
+
+
+class CountingPool(apk_pipeline.BufferPool):
+    """记录同时被取出的缓冲区数"""
+    def __init__(self, count, size=CHUNK):
+        super().__init__(count, size)
+        self.count = count
+        self.outstanding = 0
+        self.max_outstanding = 0
+
+    def acquire(self, stop_event):
+        buffer = super().acquire(stop_event)
+        self.outstanding += 1
+        self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        return buffer
+
+    def release(self, buffer):
+        self.outstanding -= 1
+        super().release(buffer)
+
+
+def test_stream_sign_strips_v1_aligns_and_keeps_comment(tmp_path, keystore, monkeypatch):
+    pools = []
+    monkeypatch.setattr(apk_pipeline, 'BufferPool', lambda count: pools.append(CountingPool(count)) or pools[-1])
+    apk = _make_v1_signed_apk(str(tmp_path / 'app.apk'))
+    output = str(tmp_path / 'signed.apk')
+    signer = load_signer(keystore[0], STOREPASS, STOREPASS, KEY_ALIAS)
+
+    tracemalloc.start()
+    try:
+        stats = stream_sign_apk(apk, output, signer, page_align_native_libs=True, page_size=16384, buffer_count=2)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # 内存只取决于缓冲区数量：输出条目区约12MB，同时最多占用2个1MB缓冲区，
+    # 另有解压原生库等与APK大小无关的固定开销
+    pool, = pools
+    assert stats['buffer_bytes'] == 2 * CHUNK and pool.max_outstanding <= 2
+    assert pool.outstanding == 0
+    assert stats['chunks'] > 12
+    assert peak < stats['buffer_bytes'] + 4 * CHUNK, peak
+
+    assert verify_v2(output) == keystore[1]
+    assert stats['stripped_entries'] == 2 and stats['native_libs_inflated'] == 1
+    offsets = _data_offsets(output)
+    assert list(offsets) == ['AndroidManifest.xml', 'META-INF/MANIFEST.MF', 'assets/odd.bin',
+                             'lib/arm64-v8a/libfoo.so']
+    assert offsets['lib/arm64-v8a/libfoo.so'] == (zipfile.ZIP_STORED, offsets['lib/arm64-v8a/libfoo.so'][1])
+    assert offsets['lib/arm64-v8a/libfoo.so'][1] % 16384 == 0
+    assert offsets['assets/odd.bin'][1] % 4 == 0
+    with zipfile.ZipFile(output) as z, zipfile.ZipFile(apk) as original:
+        assert z.comment == b'built by ci #1234'
+        for name in offsets:
+            assert z.read(name) == original.read(name)
@@ -0,0 +1,115 @@
+import os
+import zlib
+import struct
+import tracemalloc
+
+import pytest
+
+from apk_zip import ApkZipReader, ApkZipWriter, ApkFormatError, ZipEntry, ZIP_STORED, ZIP32_LIMIT
+
+ENTRY_COUNT = 100000
+HUGE_SIZE = 6 * 1024 ** 3
+# 索引每个条目允许的峰值内存（四个偏移/大小数组32字节、开放寻址查找表约21字节、暂存的哈希4字节）
+PEAK_BYTES_PER_ENTRY = 64
+
+
+def _local_header(name, data_size, crc=0, extra=b''):
+    return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45, 0x800, 0, 0, 0, crc, data_size, data_size,
+                       len(name), len(extra)) + name + extra
+
+
+def _central_record(name, crc, size, offset, extra=b''):
+    return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 45, 45, 0x800, 0, 0, 0, crc, size, size,
+                       len(name), len(extra), 0, 0, 0, 0, offset) + name + extra
+
+
+def _pack_name(i):
+    return f'assets/pack/{i:06d}.bin'.encode()
+
+
+def make_sparse_zip64(path, count=ENTRY_COUNT, huge_size=HUGE_SIZE):
+    """
+    生成ZIP64测试文件：count个小条目、一个huge_size字节的不压缩条目（文件空洞，不占磁盘）、
+    一个本地文件头偏移超过4GB的条目；中央目录条目数和偏移都只记录在ZIP64结束记录中
+    """
+    records = []
+    with open(path, 'wb') as f:
+        for i in range(count):
+            name = _pack_name(i)
+            data = b'x%d' % i
+            records.append(_central_record(name, zlib.crc32(data), len(data), f.tell()))
+            f.write(_local_header(name, len(data), zlib.crc32(data)) + data)
+
+        huge_offset = f.tell()
+        name = b'assets/huge.obb'
+        f.write(_local_header(name, ZIP32_LIMIT, extra=struct.pack('<HHQQ', 1, 16, huge_size, huge_size)))
+        f.seek(huge_size, os.SEEK_CUR)
+        records.append(_central_record(name, 0, ZIP32_LIMIT, huge_offset,
+                                       struct.pack('<HHQQ', 1, 16, huge_size, huge_size)))
+
+        tail_offset = f.tell()
+        f.write(_local_header(b'assets/tail.bin', 4, zlib.crc32(b'tail')) + b'tail')
+        records.append(_central_record(b'assets/tail.bin', zlib.crc32(b'tail'), 4, ZIP32_LIMIT,
+                                       struct.pack('<HHQ', 1, 8, tail_offset)))
+
+        cd_offset = f.tell()
+        central_directory = b''.join(records)
+        f.write(central_directory)
+        f.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, len(records), len(records),
+                            len(central_directory), cd_offset))
+        f.write(struct.pack('<IIQI', 0x07064b50, 0, cd_offset + len(central_directory), 1))
+        f.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, 0xFFFF, 0xFFFF, ZIP32_LIMIT, ZIP32_LIMIT, 0))
+    return huge_offset, tail_offset
+
+
+def _supports_sparse_files(directory):
+    probe = os.path.join(directory, 'sparse-probe')
+    with open(probe, 'wb') as f:
+        f.seek(64 * 1024 * 1024)
+        f.write(b'\0')
+    blocks = getattr(os.stat(probe), 'st_blocks', None)
+    os.remove(probe)
+    return blocks is not None and blocks * 512 < 1024 * 1024
+
+
+def test_zip64_index_memory(tmp_path):
+    if not _supports_sparse_files(str(tmp_path)):
+        pytest.skip("文件系统不支持稀疏文件")
+    path = str(tmp_path / 'huge.apk')
+    huge_offset, tail_offset = make_sparse_zip64(path)
+    assert os.path.getsize(path) > HUGE_SIZE
+
+    with ApkZipReader(path) as reader:
+        tracemalloc.start()
+        try:
+            index = reader.index()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert index.zip64
+        assert len(index) == ENTRY_COUNT + 2
+        assert peak < PEAK_BYTES_PER_ENTRY * ENTRY_COUNT, peak
+
+        huge = index.find('assets/huge.obb')
+        assert index.header_offsets[huge] == huge_offset
+        assert index.file_sizes[huge] == index.compressed_sizes[huge] == HUGE_SIZE
+        tail = index.find('assets/tail.bin')
+        assert index.header_offsets[tail] == tail_offset > ZIP32_LIMIT
+        for i in (0, 12345, ENTRY_COUNT - 1):
+            assert index.find(_pack_name(i).decode()) == i
+        assert index.find('assets/missing.bin') == -1
+        assert list(index.order_by_offset()[-2:]) == [huge, tail]
+        del index
+
+
+def test_writer_refuses_zip64_sentinel():
+    """0xFFFFFFFF在中央目录中表示值在ZIP64扩展字段中，不能作为普通值写出"""
+    entry = ZipEntry('a.bin', ZIP_STORED, 0, 0, 0, 0, 0, b'a.bin', 0, 0, 20, 0, 0)
+    writer = ApkZipWriter(None)
+    writer.offset = ZIP32_LIMIT
+    with pytest.raises(ApkFormatError):
+        writer.add_entry(entry, ZIP_STORED, 0)
+    with pytest.raises(ApkFormatError):
+        ApkZipWriter(None).add_entry(entry, ZIP_STORED, ZIP32_LIMIT)
+    with pytest.raises(ApkFormatError):
+        ApkZipWriter(None).eocd_record(ZIP32_LIMIT, 0)